@@ -0,0 +1,345 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+"""
+The async_session module provides the AsyncSession class, an asyncio based variant of the
+Session. All methods that communicate with the G-Node REST API are coroutines. Objects and
+array data are loaded into the local cache before they are converted into Neo or odML objects,
+therefore lazy loaded children of a result are only available if they were fetched before
+(e.g. by a recursive get). The module requires Python 3.5 or newer and the aiohttp package.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import asyncio
+import functools
+import os
+import urllib.parse as urlparse
+
+from gnodeclient.conf import Configuration
+from gnodeclient.session import create_cache_store
+from gnodeclient.store.async_rest_store import AsyncRestStore
+from gnodeclient.result.result_driver import NativeDriver
+
+__all__ = ("AsyncSession",)
+
+
+class AsyncSession(object):
+    """
+    The async session class defines coroutines for the basic methods, that are necessary
+    to access the G-Node REST API. An AsyncSession has to be opened before it can be used:
+
+    .. code-block:: python
+
+        async with AsyncSession(options, file_name) as session:
+            block = await session.get(location, recursive=True)
+    """
+
+    def __init__(self, options, file_name, persist_options=False):
+        """
+        Constructor.
+
+        :param options: A dict with configuration options such as 'username', 'password' or 'location'.
+        :type options: dict
+        :param file_name: A path to a file that contains further configuration options.
+        :type file_name: str
+        :param persist_options: If set to True, all options will be saved in the configuration
+                                file (except for the password).
+        """
+        self.__options = Configuration(options, file_name, persist_options)
+        self.__rest_store = AsyncRestStore(location=self.__options["location"], user=self.__options["username"],
+                                           password=self.__options["password"],
+                                           max_connections=self.__options["max_workers"])
+        self.__cache_store = create_cache_store(self.__options)
+        self.__driver = NativeDriver(self.__cache_store, memory_map=self.__options["memory_map_arrays"])
+
+    #
+    # Properties
+    #
+
+    @property
+    def driver(self):
+        return self.__driver
+
+    @property
+    def options(self):
+        """
+        Read only property for accessing all used options.
+
+        :returns: All currently used options.
+        :rtype: Configuration
+        """
+        return self.__options
+
+    #
+    # Methods
+    #
+
+    async def open(self):
+        """
+        Open the connections to the G-Node service.
+        """
+        await self.__run(self.__cache_store.connect)
+        await self.__rest_store.connect()
+
+    async def close(self):
+        """
+        Close all connections and opened files used by the session.
+        """
+        await self.__rest_store.disconnect()
+        await self.__run(self.__cache_store.disconnect)
+
+    def is_open(self):
+        return self.__rest_store.is_connected()
+
+    async def select(self, model_name, raw_filters=None):
+        """
+        Obtain a list of objects from a certain kind from the G-Node service. In addition
+        a set of filters can be applied in order to reduce the returned results.
+
+        :param model_name: The name of the model e.g. 'block' or 'spike'.
+        :type model_name: str
+        :param raw_filters: A set of filters as used by the G-Node REST API e.g. {'name_icontains': 'foo'}
+        :type raw_filters: dict
+
+        :returns: A list of objects.
+        :rtype: list
+        """
+        objects = await self.__rest_store.select(model_name, raw_filters)
+        await self.__run(self.__cache_store.set_many, objects)
+        await self.__get_arraydata(objects)
+        return await self.__run(self.__to_results, objects)
+
+    async def get(self, location, refresh=False, recursive=False):
+        """
+        Get a specific object from the G-Node service. The object to obtain is specified by its location.
+
+        :param location: The location of the object.
+        :type location: str
+        :param refresh: If True and if the object was previously cached, check if it has changed.
+        :type refresh: bool
+        :param recursive: If True, load all child objects recursively to the cache.
+        :type recursive: bool
+
+        :returns: The requested object (Neo or odML).
+        """
+        if recursive:
+            await self.__get_recursive(location, refresh)
+            obj = await self.__run(self.__cache_store.get, location)
+        else:
+            obj = (await self.__get_objects([location], refresh))[0]
+            if obj is not None:
+                await self.__get_arraydata([obj])
+
+        if obj is not None:
+            return await self.__run(self.__driver.to_result, obj)
+        else:
+            return None
+
+    async def get_list(self, locations, refresh=False):
+        """
+        Get a list of objects from the G-Node service. All objects are requested concurrently.
+
+        :param locations: The locations of the objects.
+        :type locations: list
+        :param refresh: If True and if objects were previously cached, check if they have changed.
+        :type refresh: bool
+
+        :returns: The requested objects (Neo or odML) in the order of the given locations.
+        :rtype: list
+        """
+        objects = await self.__get_objects(locations, refresh)
+        await self.__get_arraydata([obj for obj in objects if obj is not None])
+        return await self.__run(self.__to_results, objects)
+
+    async def set(self, entity, avoid_collisions=False):
+        """
+        Save a modified or created object on the G-Node service.
+
+        :param entity: The object to store (Neo or odML).
+        :type entity: object
+        :param avoid_collisions: If true, check if the modified object collide with changes on the server.
+        :type avoid_collisions: bool
+
+        :returns: The saved entity.
+        :rtype: object
+        """
+        # modified array data is written to the cache
+        obj = await self.__run(self.__driver.to_model, entity)
+
+        if obj.location is not None and avoid_collisions:
+            old_obj = await self.__run(self.__cache_store.get, obj.location)
+            if old_obj is not None:
+                obj.guid = old_obj.guid
+
+        mod = await self.__rest_store.set(obj, avoid_collisions)
+
+        # upload temporary array data to the locations of the persisted entity
+        uploads = []
+        for field_name in obj.datafile_fields:
+            field_val = obj[field_name]
+
+            if field_val is not None and field_val["data"] is not None:
+                path = self.__cache_store.file_path(field_val["data"], temporary=True)
+                if await self.__run(os.path.exists, path):
+                    uploads.append(self.__upload_file(field_val["data"], path, mod[field_name]["data"]))
+
+        await asyncio.gather(*uploads)
+
+        mod = await self.__run(self.__cache_store.set, mod)
+        return await self.__run(self.__driver.to_result, mod)
+
+    async def delete(self, entity):
+        """
+        Delete an object from the G-Node service.
+
+        :param entity: The entity to delete.
+        :type entity: object
+        """
+        obj = await self.__run(self.__driver.to_model, entity)
+        await self.__rest_store.delete(obj)
+        await self.__run(self.__cache_store.delete, obj)
+
+    async def permissions(self, entity, permissions=None):
+        """
+        Set or get permissions of an object from the G-Node service (see Session.permissions).
+
+        :param entity: The entity to get or set permissions from/to.
+        :type entity: object
+        :param permissions: new permissions to apply.
+        :type permissions: list
+
+        :returns: actual object permissions
+        :rtype: list
+        """
+        return await self.__rest_store.permissions(entity, permissions)
+
+    def clear_cache(self):
+        self.__cache_store.clear_cache()
+
+    def cache_stats(self):
+        """
+        Statistics about the in-memory cache of the session.
+
+        :returns: A dict with the number of cache hits and misses as well as the number and
+                  estimated size (in bytes) of all entities held in memory.
+        :rtype: dict
+        """
+        return self.__cache_store.memory_stats
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    #
+    # Helper methods
+    #
+
+    async def __get_objects(self, locations, refresh):
+        """
+        Get objects from the cache or, if they are missing or refresh is True, from the server.
+        The results are returned in the order of the given locations.
+        """
+        cached = await self.__run(self.__cache_store.get_many, locations)
+
+        async def fetch(location, obj):
+            if obj is None:
+                return await self.__rest_store.get(location)
+            elif refresh:
+                mod = await self.__rest_store.get(location, obj.guid)
+                return mod if mod is not None else obj
+            else:
+                return obj
+
+        results = await asyncio.gather(*[fetch(loc, obj) for loc, obj in zip(locations, cached)])
+        await self.__run(self.__cache_store.set_many, [obj for obj in results if obj is not None])
+        return list(results)
+
+    async def __get_arraydata(self, objects, locations_requested=None):
+        """
+        Download all missing array data of the given objects to the cache.
+        """
+        locations_requested = set() if locations_requested is None else locations_requested
+        downloads = []
+
+        for obj in objects:
+            for name in obj.datafile_fields:
+                value = obj[name]
+                if value is None or value["data"] is None or value["units"] is None:
+                    continue
+
+                location = value["data"]
+                if location not in locations_requested:
+                    locations_requested.add(location)
+                    if not await self.__run(self.__cache_store.has_file, location):
+                        path = self.__cache_store.file_path(location)
+                        downloads.append(self.__download_file(location, path))
+
+        await asyncio.gather(*downloads)
+
+    async def __get_recursive(self, location, refresh):
+        """
+        Load an object and all its children into the cache. All objects of one level of
+        the object tree are requested concurrently, while the array data of the previous
+        level is downloaded.
+        """
+        root = urlparse.urlparse(location).path.strip("/")
+
+        locations_done = set([root])
+        locations_todo = [root]
+        files_requested = set()
+        downloads = []
+
+        while len(locations_todo) > 0:
+            objects = [obj for obj in await self.__get_objects(locations_todo, refresh) if obj is not None]
+            downloads.append(asyncio.ensure_future(self.__get_arraydata(objects, files_requested)))
+
+            locations_todo = []
+            for obj in objects:
+                for field_name in obj.child_fields:
+                    field_val = obj[field_name]
+
+                    if field_val is not None and len(field_val) > 0 and \
+                       not (field_name == 'recordingchannelgroups' and obj.model == 'recordingchannel'):
+                        for val in field_val:
+                            val = urlparse.urlparse(val).path.strip("/")
+                            if val not in locations_done:
+                                locations_done.add(val)
+                                locations_todo.append(val)
+
+        await asyncio.gather(*downloads)
+
+    async def __download_file(self, location, path):
+        info = await self.__rest_store.download_file(location, path)
+        await self.__run(self.__cache_store.add_file, location, checksum=info["checksum"], etag=info["etag"])
+
+    async def __upload_file(self, location, path, new_location):
+        f = await self.__run(open, path, 'rb')
+        try:
+            await self.__rest_store.set_file(f, new_location)
+        finally:
+            await self.__run(f.close)
+        await self.__run(self.__cache_store.promote_file, location, new_location)
+
+    def __to_results(self, objects):
+        """
+        Convert objects to results, objects that were not found stay None.
+        """
+        return [self.__driver.to_result(obj) if obj is not None else None for obj in objects]
+
+    @staticmethod
+    async def __run(function, *args, **kwargs):
+        """
+        Run a function, that blocks on file operations, in the default executor of the event loop.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
@@ -80,6 +80,24 @@ class Configuration(dict):
         self['location'] = options.get('location', 'http://localhost:8000')
         self['cache_dir'] = options.get('cache_dir', appdirs.user_cache_dir(Configuration.NAME,
                                                                             appauthor=Configuration.ATHOR))
+        self['cache_backend'] = options.get('cache_backend', 'sqlite')
+        self['cache_memory_entries'] = options.get('cache_memory_entries', 10000)
+        self['cache_memory_bytes'] = options.get('cache_memory_bytes', None)
+        self['cache_object_entries'] = options.get('cache_object_entries', None)
+        self['cache_object_bytes'] = options.get('cache_object_bytes', None)
+        self['cache_file_entries'] = options.get('cache_file_entries', None)
+        self['cache_file_bytes'] = options.get('cache_file_bytes', None)
+        self['cache_eviction'] = options.get('cache_eviction', 'lru')
+        self['cache_janitor_interval'] = options.get('cache_janitor_interval', 0)
+        self['cache_pack_bytes'] = options.get('cache_pack_bytes', None)
+        self['array_compression'] = options.get('array_compression', None)
+        self['array_compression_level'] = options.get('array_compression_level', None)
+        self['array_shuffle'] = options.get('array_shuffle', False)
+        self['array_chunk_bytes'] = options.get('array_chunk_bytes', None)
+        self['array_chunk_layouts'] = options.get('array_chunk_layouts', {})
+        self['memory_map_arrays'] = options.get('memory_map_arrays', False)
+        self['max_workers'] = options.get('max_workers', 20)
+        self['prefetch_siblings'] = options.get('prefetch_siblings', 0)
         self['log_dir'] = options.get('log_file', os.path.join(appdirs.user_data_dir(Configuration.NAME,
                                                                                      appauthor=Configuration.ATHOR),
                                                                Configuration.NAME + '.log'))
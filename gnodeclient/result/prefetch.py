@@ -0,0 +1,162 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+"""
+This module defines prefetch policies. A prefetch policy is used by the result driver in order
+to predict which objects will be accessed next and loads them into the cache in the background,
+while the user works with already loaded results.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from gnodeclient.util.lru import LRUCache
+
+
+class PrefetchPolicy(object):
+    """
+    A prefetch policy for lists of lazy loaded objects. When a lazy loaded list of objects is
+    resolved, the children of the siblings following its first object are loaded in the background.
+    When the children of an object from such a list are accessed, the children of the following
+    siblings are loaded. While iterating over e.g. the segments of a block, the children of the
+    next segments are therefore already loaded into the cache.
+
+    Example:
+    >>> policy = PrefetchPolicy(store, siblings=5)
+    >>> driver = NativeDriver(store, prefetch=policy)
+    """
+
+    def __init__(self, store, siblings=5, max_workers=2, max_entries=10000):
+        """
+        Constructor.
+
+        :param store: The store that is used to load objects (e.g. CachingRestStore).
+        :type store: BasicStore
+        :param siblings: The number of following siblings, whose children are loaded ahead of access.
+        :type siblings: int
+        :param max_workers: The number of threads used for loading objects in the background.
+        :type max_workers: int
+        :param max_entries: The maximum number of objects, for which the position in a list is remembered.
+        :type max_entries: int
+        """
+        self.__store = store
+        self.__siblings = siblings
+        self.__positions = LRUCache(max_entries=max_entries)
+        self.__requested = LRUCache(max_entries=max_entries)
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__futures = set()
+        self.__closed = False
+        self.__errors = 0
+        self.__error = None
+        self.__lock = threading.RLock()
+
+    #
+    # Properties
+    #
+
+    @property
+    def siblings(self):
+        """
+        The number of following siblings, whose children are loaded ahead of access.
+
+        :rtype: int
+        """
+        return self.__siblings
+
+    @property
+    def errors(self):
+        """
+        The number of background loads, that failed.
+
+        :rtype: int
+        """
+        return self.__errors
+
+    @property
+    def error(self):
+        """
+        The error raised by the last failed background load or None.
+
+        :rtype: Exception
+        """
+        return self.__error
+
+    #
+    # Methods
+    #
+
+    def list_loaded(self, objects, owner=None):
+        """
+        Notifies the policy that a lazy loaded list was resolved.
+
+        :param objects: The model objects of the list.
+        :type objects: list
+        :param owner: The location of the object to which the list belongs.
+        :type owner: str
+        """
+        if owner is not None:
+            position = self.__positions.get(owner)
+            if position is not None:
+                siblings, index = position
+                self.__prefetch(siblings[index + 1:index + 1 + self.__siblings])
+
+        objects = tuple(obj for obj in objects if obj is not None)
+        for index, obj in enumerate(objects):
+            self.__positions.set(obj.location, (objects, index))
+
+        # the children of the first object are usually accessed right away by the caller
+        self.__prefetch(objects[1:self.__siblings + 1])
+
+    def shutdown(self):
+        """
+        Stop loading objects in the background: loads that did not start yet are cancelled and
+        running loads are waited for, thus the store can be closed afterwards.
+        """
+        with self.__lock:
+            self.__closed = True
+            futures = list(self.__futures)
+
+        for future in futures:
+            future.cancel()
+        self.__executor.shutdown(wait=True)
+
+    #
+    # Helper methods
+    #
+
+    def __prefetch(self, objects):
+        with self.__lock:
+            if self.__closed:
+                return
+
+            for obj in objects:
+                if obj.location not in self.__requested:
+                    self.__requested.set(obj.location, True)
+                    future = self.__executor.submit(self.__load_children, obj)
+                    self.__futures.add(future)
+                    future.add_done_callback(self.__done)
+
+    def __done(self, future):
+        with self.__lock:
+            self.__futures.discard(future)
+
+    # Errors are only counted here: they will be raised again, if the children are actually accessed
+    def __load_children(self, obj):
+        try:
+            for field_name in obj.child_fields:
+                locations = obj[field_name]
+                if locations is not None and len(locations) > 0:
+                    self.__store.get_list(locations, False)
+        except Exception as e:
+            with self.__lock:
+                self.__errors += 1
+                self.__error = e
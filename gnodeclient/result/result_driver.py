@@ -42,14 +42,22 @@ class ResultDriver(object):
     proxy objects from resource URL or location stings.
     """
 
-    def __init__(self, store):
+    def __init__(self, store, memory_map=False, prefetch=None):
         """
         Constructor
 
         :param store: A data source that is used for the creation of proxy objects.
         :type store: BasicStore
+        :param memory_map: If True, array data of results is mapped from cached files instead of
+                           being read into memory. Chunked or compressed arrays can not be mapped
+                           and are read into memory as a whole.
+        :type memory_map: bool
+        :param prefetch: A policy that loads objects ahead of access or None.
+        :type prefetch: PrefetchPolicy
         """
         self.__store = store
+        self.__memory_map = memory_map
+        self.__prefetch = prefetch
 
     #
     # Properties
@@ -65,6 +73,24 @@ class ResultDriver(object):
         """
         return self.__store
 
+    @property
+    def memory_map(self):
+        """
+        Readonly property, that indicates whether array data is mapped from cached files.
+
+        :rtype: bool
+        """
+        return self.__memory_map
+
+    @property
+    def prefetch(self):
+        """
+        Readonly property for the prefetch policy used by proxy objects.
+
+        :rtype: PrefetchPolicy
+        """
+        return self.__prefetch
+
     #
     # Methods
     #
@@ -146,6 +172,16 @@ class NativeDriver(ResultDriver):
         Model.VALUE: odml.value.Value,
     }
 
+    # Datafile fields, that native constructors can use without copying, mapped to the name of
+    # the respective units argument
+    NO_COPY_UNITS = {
+        (Model.ANALOGSIGNAL, "signal"): "units",
+        (Model.ANALOGSIGNALARRAY, "signal"): "units",
+        (Model.IRREGULARLYSAMPLEDSIGNAL, "signal"): "units",
+        (Model.IRREGULARLYSAMPLEDSIGNAL, "times"): "time_units",
+        (Model.SPIKETRAIN, "times"): "units",
+    }
+
     #
     # Methods
     #
@@ -170,8 +206,7 @@ class NativeDriver(ResultDriver):
             # collect kwargs for object construction
             kw = {}
 
-            for field_name in obj.obligatory_fields:
-                field = obj.get_field(field_name)
+            for field_name, field in obj.obligatory_fields.items():
                 field_val = getattr(obj, field_name)
 
                 if field.type_info == "data":
@@ -179,14 +214,20 @@ class NativeDriver(ResultDriver):
 
                 elif field.type_info == "datafile":
                     units = field_val["units"]
-                    data = self.store.get_array(field_val["data"])
-                    if units is not None:
-                        kw[field_name] = pq.Quantity(data, units)
+                    data = self.__get_array(field_val["data"])
+                    no_copy_units = NativeDriver.NO_COPY_UNITS.get((obj.model, field_name))
+                    if self.memory_map and no_copy_units is not None:
+                        kw[field_name] = data
+                        kw[no_copy_units] = units
+                        kw["copy"] = False
+                    elif units is not None:
+                        kw[field_name] = _quantity(data, units)
                     else:
-                        kw[field_name] = numpy.array(data)
+                        kw[field_name] = numpy.asarray(data)
 
                 elif obj.model == Model.PROPERTY and field.type_info == Model.VALUE:
-                    proxy = LazyProxy(lazy_list_loader(field_val, self.store, self, odml.base.SafeList))
+                    loader = lazy_list_loader(field_val, self.store, self, odml.base.SafeList, obj.location)
+                    proxy = LazyProxy(loader)
                     kw["value"] = proxy
 
                 else:
@@ -197,9 +238,8 @@ class NativeDriver(ResultDriver):
             setattr(native, "location", obj.location)
 
             # set remaining properties
-            for field_name in obj.optional_fields:
+            for field_name, field in obj.optional_fields.items():
                 field_val = getattr(obj, field_name)
-                field = obj.get_field(field_name)
                 if field.is_parent:
                     if field_val is not None:
                         proxy = LazyProxy(lazy_value_loader(field_val, self.store, self))
@@ -221,7 +261,7 @@ class NativeDriver(ResultDriver):
                         list_cls = odml.base.SafeList
 
                     if field_val is not None and len(field_val) > 0:
-                        proxy = LazyProxy(lazy_list_loader(field_val, self.store, self, list_cls))
+                        proxy = LazyProxy(lazy_list_loader(field_val, self.store, self, list_cls, obj.location))
                         # TODO think about a better way to assign attrs
                         if field.type_info in [Model.SECTION, Model.VALUE] and field_name != "metadata":
                             setattr(native, '_' + field_name, proxy)
@@ -238,8 +278,8 @@ class NativeDriver(ResultDriver):
                 elif field.type_info == "datafile":
                     if field_val["data"] is not None and field_val["units"] is not None:
                         units = field_val["units"]
-                        data = self.store.get_array(field_val["data"])
-                        q = pq.Quantity(data, units)
+                        data = self.__get_array(field_val["data"])
+                        q = _quantity(data, units)
                         setattr(native, field_name, q)
 
                 elif obj.model == 'value' and field_name in \
@@ -281,8 +321,7 @@ class NativeDriver(ResultDriver):
             raise TypeError("The type of the native object (%s) is not a compatible type!" % type(obj))
 
         # iterate over fields and set them on the model
-        for field_name in model_obj:
-            field = model_obj.get_field(field_name)
+        for field_name, field in model_obj.fields.items():
             if field.type_info != "datafile":  # non-data fields
                 if model_obj.model == 'section' and field_name \
                                             in ['document', 'section']:
@@ -356,7 +395,35 @@ class NativeDriver(ResultDriver):
                 if in_memory:
                     location_or_obj = data_array
                 else:
-                    location_or_obj = self.store.set_array(data_array, temporary=True)
+                    # an unchanged array is neither written nor uploaded again
+                    location_or_obj = None
+                    if getattr(obj, "location", None) is not None:
+                        location_or_obj = self.store.unchanged_array(obj.location, field_name, data_array)
+                    if location_or_obj is None:
+                        location_or_obj = self.store.set_array(data_array, temporary=True, model=model_obj.model)
                 model_obj[field_name] = {"units": units, "data": location_or_obj}
 
-        return model_obj
\ No newline at end of file
+        return model_obj
+
+    #
+    # Helper methods
+    #
+
+    def __get_array(self, location):
+        if self.memory_map:
+            return self.store.get_array(location, mmap=True)
+        else:
+            return self.store.get_array(location)
+
+
+# quantities before 0.16 copy the data of a new quantity, unless copy=False is passed
+_QUANTITY_COPIES = tuple(int(n) for n in pq.__version__.split(".")[:2]) < (0, 16)
+
+
+def _quantity(data, units):
+    """
+    Create a quantity, that uses the array data (e.g. a memory map) without copying it.
+    """
+    if _QUANTITY_COPIES:
+        return pq.Quantity(data, units, copy=False)
+    return pq.Quantity(numpy.asarray(data), units)
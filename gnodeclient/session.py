@@ -16,17 +16,35 @@ functions operate on a global, application wide session object.
 
 from __future__ import print_function, absolute_import, division
 
+import contextlib
 import os
+import quantities as pq
+
 from gnodeclient.conf import Configuration
+from gnodeclient.model.models import Model
+from gnodeclient.store.cache_store import CacheStore
 from gnodeclient.store.caching_rest_store import CachingRestStore
 from gnodeclient.result.result_driver import NativeDriver
+from gnodeclient.result.prefetch import PrefetchPolicy
 from gnodeclient.store.dumper import Dumper
+from gnodeclient.util.hdfio import ArrayFormat
 
 __all__ = ("Session", "create", "close")
 
 # A global session object.
 _MAIN_SESSION = None
 
+# The array field used by get_array_slice() if no field name is given.
+_DEFAULT_ARRAY_FIELDS = {
+    Model.ANALOGSIGNAL: "signal",
+    Model.ANALOGSIGNALARRAY: "signal",
+    Model.IRREGULARLYSAMPLEDSIGNAL: "signal",
+    Model.SPIKETRAIN: "times",
+    Model.EVENTARRAY: "times",
+    Model.EPOCHARRAY: "times",
+    Model.SPIKE: "waveform",
+}
+
 
 class Session(object):
     """
@@ -47,10 +65,20 @@ class Session(object):
 
         """
         self.__options = Configuration(options, file_name, persist_options)
+        array_format = create_array_format(self.__options)
         self.__store = CachingRestStore(location=self.__options["location"], user=self.__options["username"],
-                                        password=self.__options["password"], cache_location=self.options["cache_dir"])
+                                        password=self.__options["password"], cache_location=self.options["cache_dir"],
+                                        max_workers=self.__options["max_workers"], array_format=array_format,
+                                        cache_store=create_cache_store(self.__options, array_format))
         self.__store.connect()
-        self.__driver = NativeDriver(self.__store)
+
+        if self.__options["prefetch_siblings"] > 0:
+            self.__prefetch = PrefetchPolicy(self.__store, siblings=self.__options["prefetch_siblings"])
+        else:
+            self.__prefetch = None
+
+        self.__driver = NativeDriver(self.__store, memory_map=self.__options["memory_map_arrays"],
+                                     prefetch=self.__prefetch)
         self.__dumper = Dumper(self.__driver)
 
     #
@@ -91,7 +119,34 @@ class Session(object):
         objects = self.__store.select(model_name, raw_filters)
         return [self.__driver.to_result(obj) for obj in objects]
 
-    def get(self, location, refresh=False, recursive=False):
+    def iter_select(self, model_name, raw_filters=None, page_size=1000, prefetch=2):
+        """
+        Iterate over all objects from a certain kind from the G-Node service. Other than select()
+        this method does not load all results at once: the results are requested page by page,
+        while the following pages are fetched in the background.
+
+        Example:
+        >>> for event in session.iter_select('event', {'label__icontains': 'stimulus'}):
+        >>>     print(event.time)
+
+        :param model_name: The name of the model e.g. 'block' or 'spike'.
+        :type model_name: str
+        :param raw_filters: A set of filters as used by the G-Node REST API e.g. {'name_icontains': 'foo'}
+        :type raw_filters: dict
+        :param page_size: The number of objects requested at once.
+        :type page_size: int
+        :param prefetch: The number of pages that are requested ahead of consumption.
+        :type prefetch: int
+
+        :returns: A generator over all objects.
+        :rtype: generator
+        """
+        with contextlib.closing(self.__store.select_pages(model_name, raw_filters, page_size, prefetch)) as pages:
+            for page in pages:
+                for obj in page:
+                    yield self.__driver.to_result(obj)
+
+    def get(self, location, refresh=False, recursive=False, progress=None):
         """
         Get a specific object from the G-Node service. The object to obtain is specified by its location.
 
@@ -101,10 +156,13 @@ class Session(object):
         :type refresh: bool
         :param recursive: If True, load all child objects recursively to the cache.
         :type recursive: bool
+        :param progress: A function that is called during a recursive get with the number of fetched
+                         objects, the number of downloaded files and the number of files to download.
+        :type progress: function
 
         :returns: The requested object (Neo or odML).
         """
-        obj = self.__store.get(location, refresh, recursive)
+        obj = self.__store.get(location, refresh, recursive, progress)
         if obj is not None:
             res = self.__driver.to_result(obj)
         else:
@@ -112,6 +170,60 @@ class Session(object):
 
         return res
 
+    def get_array_slice(self, location, start=None, stop=None, field_name=None):
+        """
+        Get a part of the array data of an object e.g. a time window of a signal. Only the requested
+        part is read from the cache or, if supported by the server, downloaded.
+
+        For regularly sampled signals start and stop can be given as times (quantities), which are
+        converted into sample indices using t_start and sampling_rate of the signal. Otherwise start
+        and stop are indices along the first axis of the array. Times and indices can not be mixed.
+
+        :param location: The location of the object e.g. an analog signal.
+        :type location: str
+        :param start: The first index or the start time of the slice.
+        :type start: int|Quantity
+        :param stop: The index after the last element or the stop time of the slice.
+        :type stop: int|Quantity
+        :param field_name: The name of the array field e.g. 'signal' or 'times'. If not set, the main
+                           array of the object is used.
+        :type field_name: str
+
+        :returns: The requested part of the array.
+        :rtype: Quantity|numpy.ndarray
+
+        :raises: ValueError if start and stop are a time and an index.
+        """
+        times = [hasattr(value, "rescale") for value in (start, stop) if value is not None]
+        if any(times) and not all(times):
+            raise ValueError("Start and stop must be both times or both indices!")
+
+        obj = self.__store.get(location, False)
+        if obj is None:
+            return None
+
+        if field_name is None:
+            field_name = _DEFAULT_ARRAY_FIELDS.get(obj.model)
+        field = obj.get_field(field_name) if field_name is not None else None
+        if field is None or field.type_info != "datafile":
+            raise ValueError("The object has no array field '%s'!" % field_name)
+
+        field_val = obj[field_name]
+        if field_val is None or field_val["data"] is None:
+            return None
+
+        if any(times):
+            if obj.model not in (Model.ANALOGSIGNAL, Model.ANALOGSIGNALARRAY):
+                raise ValueError("Time based slices are only supported for regularly sampled signals!")
+            start = self.__time_to_index(obj, start)
+            stop = self.__time_to_index(obj, stop)
+
+        data = self.__store.get_array_slice(field_val["data"], start, stop)
+        if field_val["units"] is not None:
+            return pq.Quantity(data, field_val["units"], copy=False)
+        else:
+            return data
+
     def set(self, entity, avoid_collisions=False):
         """
         Save a modified or created object on the G-Node service.
@@ -187,6 +299,9 @@ class Session(object):
         """
         Close all connections and opened files used by the session.
         """
+        # running prefetches write to the cache, thus they are finished before the store is closed
+        if self.__prefetch is not None:
+            self.__prefetch.shutdown()
         self.__store.disconnect()
 
     def is_open(self):
@@ -195,6 +310,66 @@ class Session(object):
     def clear_cache(self):
         self.__store.cache_store.clear_cache()
 
+    def cache_stats(self):
+        """
+        Statistics about the cache of the session.
+
+        :returns: A dict with the number of cache hits and misses as well as the number and
+                  estimated size (in bytes) of all entities held in memory. The keys 'objects'
+                  and 'files' contain the same statistics together with the number of evictions
+                  for the entities and files in the cache on disk. If siblings are prefetched, the key
+                  'prefetch_errors' contains the number of background loads, that failed.
+        :rtype: dict
+        """
+        stats = dict(self.__store.cache_store.memory_stats)
+        stats.update(self.__store.cache_store.disk_stats)
+        if self.__prefetch is not None:
+            stats["prefetch_errors"] = self.__prefetch.errors
+        return stats
+
+    def pin(self, entity):
+        """
+        Protect a cached object and its array data from eviction until it is unpinned, e.g. while
+        the object is in use. Pins are counted: an object pinned twice must be unpinned twice.
+
+        :param entity: The object or its location.
+        :type entity: object|str
+        """
+        self.__store.cache_store.pin(self.__location(entity))
+
+    def unpin(self, entity):
+        """
+        Remove the pin from an object (see pin).
+
+        :param entity: The object or its location.
+        :type entity: object|str
+        """
+        self.__store.cache_store.unpin(self.__location(entity))
+
+    #
+    # Helper methods
+    #
+
+    @staticmethod
+    def __location(entity):
+        if hasattr(entity, "location"):
+            return entity.location
+        return entity
+
+    @staticmethod
+    def __time_to_index(obj, time):
+        if time is None:
+            return None
+
+        rate = pq.Quantity(obj.sampling_rate["data"], obj.sampling_rate["units"])
+        if obj.t_start is not None and obj.t_start["data"] is not None:
+            t_start = pq.Quantity(obj.t_start["data"], obj.t_start["units"])
+        else:
+            t_start = 0 * pq.s
+
+        index = ((time - t_start) * rate).simplified
+        return max(int(round(float(index))), 0)
+
 
 def create(username=None, password=None, location=None, file_name=None, persist_options=False):
     """
@@ -224,3 +399,40 @@ def close():
     if _MAIN_SESSION is not None:
         _MAIN_SESSION.close()
         _MAIN_SESSION = None
+
+
+def create_array_format(options):
+    """
+    Creates the format of cached and uploaded arrays from the options of a session.
+
+    :param options: The options of the session.
+    :type options: Configuration
+
+    :rtype: ArrayFormat
+    """
+    return ArrayFormat(compression=options["array_compression"], level=options["array_compression_level"],
+                       shuffle=options["array_shuffle"], chunk_bytes=options["array_chunk_bytes"],
+                       layouts=options["array_chunk_layouts"])
+
+
+def create_cache_store(options, array_format=None):
+    """
+    Creates the cache store of a session from its options, thus all kinds of sessions use the
+    same limits, eviction policy, packing and array format.
+
+    :param options: The options of the session.
+    :type options: Configuration
+    :param array_format: The format of cached arrays (by default created from the options).
+    :type array_format: ArrayFormat
+
+    :rtype: CacheStore
+    """
+    if array_format is None:
+        array_format = create_array_format(options)
+
+    return CacheStore(location=options["cache_dir"], backend=options["cache_backend"],
+                      memory_entries=options["cache_memory_entries"], memory_bytes=options["cache_memory_bytes"],
+                      object_entries=options["cache_object_entries"], object_bytes=options["cache_object_bytes"],
+                      file_entries=options["cache_file_entries"], file_bytes=options["cache_file_bytes"],
+                      eviction=options["cache_eviction"], janitor_interval=options["cache_janitor_interval"],
+                      pack_bytes=options["cache_pack_bytes"], array_format=array_format)
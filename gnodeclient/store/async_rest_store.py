@@ -0,0 +1,354 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+"""
+This module provides a store for the G-Node REST API, that is based on asyncio. All methods that
+communicate with the server are coroutines, so that many requests can be issued concurrently from
+a single event loop. The module requires Python 3.5 or newer and the aiohttp package.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import asyncio
+import hashlib
+import os
+import urllib.parse as urlparse
+
+import aiohttp
+
+import gnodeclient.store.convert as convert
+import gnodeclient.util.helper as helper
+from gnodeclient.model.models import Model
+from gnodeclient.store.basic_store import BasicStore
+from gnodeclient.store.rest_store import RestStore
+
+
+class AsyncRestStore(BasicStore):
+    """
+    Implementation of a store, that uses the G-Node REST API as data source and provides
+    coroutines for all operations. All requests share a pool of connections.
+    """
+
+    def __init__(self, location, user, password, api_prefix="api", api_name="v1", max_connections=100):
+        """
+        Constructor.
+
+        :param location: The location from where the data should be accessed.
+        :type location: str
+        :param user: The user name (might be ignored by some kinds of store)
+        :type user: str
+        :param password: The password (might be ignored by some kinds of store)
+        :type password: str
+        :param max_connections: The maximum number of simultaneously open connections.
+        :type max_connections: int
+        """
+        super(AsyncRestStore, self).__init__(location, user, password)
+        self.__session = None
+        self.api_prefix = api_prefix
+        self.api_name = api_name
+        self.max_connections = max_connections
+
+    #
+    # Methods
+    #
+
+    async def connect(self):
+        """
+        Connect to the G-Node REST API via HTTP. Note: almost all methods raise an
+        aiohttp.ClientResponseError if the communication fails.
+        """
+        url = urlparse.urljoin(self.location, RestStore.URL_LOGIN)
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+        try:
+            async with session.post(url, data={'username': self.user, 'password': self.password}) as response:
+                await self.raise_for_status(response)
+                status = response.status
+
+            if len(session.cookie_jar) == 0:
+                raise RuntimeError("Unable to authenticate for user '%s' (status: %d)!" % (self.user, status))
+        except Exception:
+            await session.close()
+            raise
+
+        self.__session = session
+
+    def is_connected(self):
+        """
+        Check if the store is connected.
+
+        :returns: bool
+        """
+        return self.__session is not None
+
+    async def disconnect(self):
+        """
+        Disconnect from the G-Node REST API, discard all session information and close all connections.
+        """
+        url = urlparse.urljoin(self.location, RestStore.URL_LOGOUT)
+
+        try:
+            async with self.__session.get(url) as response:
+                await self.raise_for_status(response)
+        finally:
+            await self.__session.close()
+            self.__session = None
+
+    async def select(self, model_name, raw_filters=None):
+        """
+        Select data from a certain type e.g. blocks or spiketrains from the G-Node REST API
+        and convert the results to a list of model objects.
+
+        :param model_name: The name of the model as string.
+        :type model_name: str
+        :param raw_filters: Filters as defined by the G-Node REST API.
+        :type raw_filters: dict
+
+        :returns: A list of (filtered) results.
+        :rtype: list
+        """
+        raw_filters = {} if raw_filters is None else raw_filters
+        params = dict((key, str(value)) for key, value in raw_filters.items())
+
+        url = urlparse.urljoin(self.location, Model.get_location(model_name))
+
+        async with self.__session.get(url, params=params) as response:
+            await self.raise_for_status(response)
+            content = await response.read()
+
+        raw_results = convert.json_to_collections(content, as_list=True)
+        return [convert.collections_to_model(obj) for obj in raw_results]
+
+    async def get(self, location, etag=None):
+        """
+        Get a single object from the G-Node REST API. If an etag is provided it will be included in
+        the request with 'If-none-match'. If the response is 304 the return value of this method will
+        be None.
+
+        :param location: The location of the object or the whole URL.
+        :type location: str
+        :param etag: The etag of the cached object.
+        :type etag: str
+
+        :returns: The found object or None if it was not updated or not found.
+        :rtype: Model
+        """
+        headers = {}
+        if etag is not None:
+            headers['If-none-match'] = etag
+
+        async with self.__session.get(self.__url(location), headers=headers) as response:
+            if response.status in (304, 404):
+                return None
+
+            await self.raise_for_status(response)
+            content = await response.read()
+
+        return convert.collections_to_model(convert.json_to_collections(content))
+
+    async def get_list(self, locations):
+        """
+        Get a list of objects that are referenced by their locations or complete URLs
+        from the G-Node REST API. All objects are requested concurrently.
+
+        :param locations: List with locations or URLs.
+        :type locations: list
+
+        :returns: A list of objects matching the list of locations, objects that were not
+                  found on the server (404) are None.
+        :rtype: list
+        """
+        async def fetch(location):
+            async with self.__session.get(self.__url(location)) as response:
+                if response.status == 404:
+                    return None
+
+                await self.raise_for_status(response)
+                content = await response.read()
+            return convert.collections_to_model(convert.json_to_collections(content))
+
+        results = await asyncio.gather(*[fetch(location) for location in locations])
+        return list(results)
+
+    async def get_file(self, location):
+        """
+        Get raw file data (bytestring) from the G-Node REST API.
+
+        :param location: The locations of all entities as path or URL.
+        :type location: str
+
+        :returns: The raw file data.
+        :rtype: bytes
+        """
+        async with self.__session.get(self.__url(location)) as response:
+            await self.raise_for_status(response)
+            return await response.read()
+
+    async def download_file(self, location, path):
+        """
+        Download a file from the G-Node REST API and write it to the given path. The file data is
+        streamed to disk in chunks and moved to its final path when the download is complete.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        :param path: The path where the file should be stored.
+        :type path: str
+
+        :returns: The checksum of the file data (see helper.checksum) and the etag reported by
+                  the server as dict with the keys 'checksum' and 'etag'.
+        :rtype: dict
+        """
+        loop = asyncio.get_event_loop()
+        tmppath = path + "." + helper.random_str(8, "tmp")
+        sha = hashlib.sha1()
+
+        def write(f, chunk):
+            sha.update(chunk)
+            f.write(chunk)
+
+        # writing and hashing blocks, thus it is done in the default executor of the event loop
+        try:
+            async with self.__session.get(self.__url(location)) as response:
+                await self.raise_for_status(response)
+                f = await loop.run_in_executor(None, open, tmppath, 'wb')
+                try:
+                    async for chunk in response.content.iter_chunked(RestStore.CHUNK_SIZE):
+                        await loop.run_in_executor(None, write, f, chunk)
+                finally:
+                    await loop.run_in_executor(None, f.close)
+                etag = response.headers.get("etag")
+            await loop.run_in_executor(None, helper.replace_file, tmppath, path)
+            return {"checksum": sha.hexdigest(), "etag": etag}
+        finally:
+            await loop.run_in_executor(None, _remove_file, tmppath)
+
+    async def set(self, entity, avoid_collisions=False):
+        """
+        Update or create an entity on the G-Node REST API. If an etag/guid is provided by the entity it
+        will be included in the header with 'If-match' if avoid_collisions is True.
+
+        :param entity: The entity to persist.
+        :type entity: Model
+        :param avoid_collisions: Try to avoid collisions (lost update problem)
+        :type avoid_collisions: bool
+
+        :returns: The updated entity.
+        :rtype: Model
+        """
+        if hasattr(entity, "location") and entity.location is not None:
+            method = 'PUT'
+            url = urlparse.urljoin(self.location, entity.location)
+        else:
+            method = 'POST'
+            url = urlparse.urljoin(self.location, Model.get_location(entity.model))
+
+        data = convert.model_to_json_response(entity)
+        headers = {'Content-Type': 'application/json'}
+        if avoid_collisions and entity.guid is not None:
+            headers['If-match'] = entity.guid
+
+        async with self.__session.request(method, url, data=data, headers=headers) as response:
+            if response.status == 304:
+                return entity
+
+            await self.raise_for_status(response)
+            content = await response.read()
+
+        return convert.collections_to_model(convert.json_to_collections(content))
+
+    async def set_file(self, data, location):
+        """
+        Save raw file data on the G-Node REST API. File handles are streamed to the server.
+
+        :param data: The raw data of the file or a file handle opened in binary mode.
+        :type data: bytes|file
+        :param location: The location of the file.
+        :type location: str
+        """
+        form = aiohttp.FormData()
+        form.add_field('raw_file', data, filename='raw_file', content_type='application/octet-stream')
+
+        async with self.__session.post(self.__url(location), data=form) as response:
+            await self.raise_for_status(response)
+
+    async def delete(self, entity_or_location):
+        """
+        Delete an entity from the G-Node REST API.
+
+        :param entity_or_location: The entity to delete.
+        :type entity_or_location: Model or string
+        """
+        if isinstance(entity_or_location, str):
+            url = urlparse.urljoin(self.location, entity_or_location)
+        elif hasattr(entity_or_location, "location") and entity_or_location.location is not None:
+            url = urlparse.urljoin(self.location, entity_or_location.location)
+        else:
+            raise RuntimeError("The entity has no location and can therefore not be deleted.")
+
+        async with self.__session.delete(url) as response:
+            await self.raise_for_status(response)
+
+    async def permissions(self, entity, permissions=None):
+        """
+        Set or get permissions of an object from the G-Node service (see RestStore.permissions).
+
+        :param entity: The entity to get or set permissions from/to.
+        :type entity: object
+        :param permissions: new permissions to apply.
+        :type permissions: list
+
+        :returns: actual object permissions
+        :rtype: list
+        """
+        if hasattr(entity, "location") and entity.location is not None:
+            base_url = entity.location
+            if not base_url.endswith('/'):
+                base_url += '/'
+            url = urlparse.urljoin(self.location, base_url + 'acl/')
+        else:
+            raise ValueError("Please submit object to the server before changing permissions")
+
+        if permissions is not None:
+            data = convert.permissions_to_json(permissions)
+            request = self.__session.put(url, data=data, headers={'Content-Type': 'application/json'})
+        else:
+            request = self.__session.get(url)
+
+        async with request as response:
+            await self.raise_for_status(response)
+            content = await response.read()
+
+        return convert.json_to_permissions(content)
+
+    @staticmethod
+    async def raise_for_status(response):
+        """
+        Raises an aiohttp.ClientResponseError containing the response body, if one occurred.
+        """
+        if 400 <= response.status < 600:
+            content = await response.text()
+            raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status,
+                                              message=content, headers=response.headers)
+
+    #
+    # Helper methods
+    #
+
+    def __url(self, location):
+        if location.startswith("http://") or location.startswith("https://"):
+            return location
+        else:
+            return urlparse.urljoin(self.location, location)
+
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
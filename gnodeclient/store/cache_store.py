@@ -22,38 +22,252 @@ import gnodeclient.util.helper as helper
 import gnodeclient.store.convert as convert
 from gnodeclient.store.basic_store import BasicStore
 from gnodeclient.util.cache import Cache
+from gnodeclient.util.janitor import Janitor
+from gnodeclient.util.lru import LRUCache
 from gnodeclient.conf import Configuration
 
 
 class CacheStore(BasicStore):
     """
-    A simple cache store.
+    A simple cache store. Entities read from or written to the cache are additionally kept in a
+    bounded in-memory LRU cache, so that repeated access to the same entity neither touches the file
+    system nor converts the entity again. The memory cache keeps copies of the entities and returns
+    copies, thus entities can be modified by the caller without changing the cached ones.
+
+    The number and size of the entities and files on disk can be limited (see Cache). Optionally
+    a Janitor compacts the cache in the background.
     """
 
-    def __init__(self, location=None):
+    def __init__(self, location=None, backend=Cache.SQLITE, memory_entries=10000, memory_bytes=None,
+                 object_entries=None, object_bytes=None, file_entries=None, file_bytes=None,
+                 eviction=Cache.LRU, janitor_interval=None, pack_bytes=None, array_format=None):
+        """
+        Constructor.
+
+        :param location: The location of the cache directory.
+        :type location: str
+        :param backend: The backend used for cached objects (Cache.SQLITE or Cache.PICKLE).
+        :type backend: str
+        :param memory_entries: Maximum number of entities kept in memory (None for no limit, 0 to disable).
+        :type memory_entries: int
+        :param memory_bytes: Maximum estimated size of all entities kept in memory (None for no limit).
+        :type memory_bytes: int
+        :param object_entries: Maximum number of entities in the cache on disk (None for no limit).
+        :type object_entries: int
+        :param object_bytes: Maximum size of all entities in the cache on disk (None for no limit).
+        :type object_bytes: int
+        :param file_entries: Maximum number of cached files (None for no limit).
+        :type file_entries: int
+        :param file_bytes: Maximum size of all cached files (None for no limit).
+        :type file_bytes: int
+        :param eviction: The eviction policy (Cache.LRU or Cache.LFU).
+        :type eviction: str
+        :param janitor_interval: The time in seconds between two compactions of the cache in
+                                 the background (None or 0 for no background compaction).
+        :type janitor_interval: float
+        :param pack_bytes: Files with array data up to this size are packed into a few container
+                           files (None to store each file separately).
+        :type pack_bytes: int
+        :param array_format: Chunking and compression of cached array data (None for contiguous
+                             and uncompressed datasets).
+        :type array_format: ArrayFormat
+        """
         super(CacheStore, self).__init__(location)
-        self.__cache = Cache(self.location, Configuration.NAME)
+        self.__backend = backend
+        self.__limits = {"object_entries": object_entries, "object_bytes": object_bytes,
+                         "file_entries": file_entries, "file_bytes": file_bytes, "policy": eviction,
+                         "pack_bytes": pack_bytes}
+        self.__janitor_interval = janitor_interval
+        self.__array_format = array_format
+        self.__cache = None
+        self.__janitor = None
+        self.__memory = LRUCache(memory_entries, memory_bytes)
+        self.connect()
+
+    #
+    # Properties
+    #
+
+    @property
+    def backend(self):
+        """
+        The name of the backend used for cached objects.
+        """
+        return self.__backend
+
+    @property
+    def disk_stats(self):
+        """
+        Hit, miss and eviction counters as well as the number and size of the entities and
+        files in the cache on disk (see Cache.stats).
+
+        :rtype: dict
+        """
+        return self.__cache.stats
+
+    @property
+    def memory_stats(self):
+        """
+        Hit and miss counters as well as the number and estimated size of the entities
+        in the memory cache.
+
+        :rtype: dict
+        """
+        return self.__memory.stats
+
+    #
+    # Methods
+    #
 
     def connect(self):
         if self.__cache is None:
-            self.__cache = Cache(self.location, Configuration.NAME)
+            self.__cache = Cache.create(self.backend, self.location, Configuration.NAME, **self.__limits)
+        if self.__janitor is None and self.__janitor_interval:
+            self.__janitor = Janitor(self.__cache, self.__janitor_interval)
+            self.__janitor.start()
 
     def is_connected(self):
         return self.__cache is not None
 
     def disconnect(self):
+        if self.__janitor is not None:
+            self.__janitor.stop()
+            self.__janitor = None
         if self.__cache is not None:
+            self.__cache.close()
             del self.__cache
         self.__cache = None
 
     def get(self, location, temporary=False):
+        key = self.__memory_key(location, temporary)
+        entity = self.__memory.get(key)
+        if entity is not None:
+            return entity.copy()
+
         obj = self.__cache.get(location, temporary)
         if obj is not None:
             entity = convert.collections_to_model(obj)
+            self.__memory.set(key, entity.copy())
             return entity
         else:
             return None
 
+    def get_many(self, locations, temporary=False):
+        """
+        Get several entities from the cache at once.
+
+        :param locations: The locations of all entities as path or URL.
+        :type locations: list
+
+        :returns: A list with an entity or None for each location.
+        :rtype: list
+        """
+        results = [self.__memory.get(self.__memory_key(loc, temporary)) for loc in locations]
+        results = [entity.copy() if entity is not None else None for entity in results]
+        missing = [loc for loc, entity in zip(locations, results) if entity is None]
+
+        if len(missing) > 0:
+            objects = self.__cache.get_many(missing, temporary)
+
+            for i, location in enumerate(locations):
+                obj = objects.get(location)
+                if results[i] is None and obj is not None:
+                    entity = convert.collections_to_model(obj)
+                    self.__memory.set(self.__memory_key(location, temporary), entity.copy())
+                    results[i] = entity
+
+        return results
+
+    def get_list(self, locations, temporary=False):
+        """
+        Get a list of entities from the cache (same as get_many).
+
+        :param locations: The locations of all entities as path or URL.
+        :type locations: list
+
+        :returns: A list with an entity or None for each location.
+        :rtype: list
+        """
+        return self.get_many(locations, temporary)
+
+    def file_path(self, location, temporary=False):
+        """
+        The path of the file in the cache, where the data of the given location is stored.
+        The directory of the file is created, thus the file can be written directly (e.g. by a download).
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+
+        :returns: The path of the cached file (the file may not exist).
+        :rtype: str
+        """
+        ident = helper.id_from_location(location)
+        return self.__cache.file_cache_path(ident, temporary, create=True)
+
+    def has_file(self, location, temporary=False):
+        """
+        Check if the file of the given location is in the cache without reading it.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+
+        :returns: True if the file is cached, False otherwise.
+        :rtype: bool
+        """
+        return self.__cache.has_file(location, temporary)
+
+    def add_file(self, location, temporary=False, checksum=None, etag=None):
+        """
+        Register a file, that was written to its path in the cache (see file_path), e.g. by a download.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        :param checksum: The checksum of the file, if None it is computed from the file.
+        :type checksum: str
+        :param etag: The etag of the file as reported by the server.
+        :type etag: str
+        """
+        self.__cache.add_file(location, temporary, checksum, etag)
+
+    def promote_file(self, location, new_location):
+        """
+        Turn a temporary file into the permanent file of another location without copying it,
+        e.g. after the file was uploaded to this location.
+
+        :param location: The location of the temporary file as path or URL.
+        :type location: str
+        :param new_location: The location of the permanent file as path or URL.
+        :type new_location: str
+
+        :returns: True if the file was promoted, False if the temporary file is not cached.
+        :rtype: bool
+        """
+        return self.__cache.promote_file(location, new_location)
+
+    def file_info(self, location, temporary=False):
+        """
+        Get size, checksum, etag and the time of the last access of a cached file.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+
+        :returns: The manifest entry of the file or None if the file is not cached.
+        :rtype: dict
+        """
+        return self.__cache.file_info(location, temporary)
+
+    def verify_file(self, location, temporary=False):
+        """
+        Check the size and checksum of a cached file. A damaged file is removed from the cache.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+
+        :returns: True if the file is intact, False otherwise.
+        :rtype: bool
+        """
+        return self.__cache.verify_file(location, temporary)
+
     def get_file(self, location, temporary=False):
         """
         Get raw file data (bytestring) from the cache.
@@ -67,12 +281,15 @@ class CacheStore(BasicStore):
         data = self.__cache.get_file(location, temporary)
         return data
 
-    def get_array(self, location, temporary=False):
+    def get_array(self, location, temporary=False, mmap=False):
         """
         Read array data from an hdf5 file in the cache.
 
         :param location: The locations of all entities as path or URL.
         :type location: str
+        :param mmap: Map the array from the file instead of reading it into memory (if possible).
+                     Packed arrays are always read into memory.
+        :type mmap: bool
 
         :returns: The raw file data.
         :rtype: numpy.ndarray|list
@@ -81,17 +298,137 @@ class CacheStore(BasicStore):
         path = self.__cache.file_cache_path(ident, temporary)
 
         if os.path.isfile(path):
-            data = hdfio.read_array_data(path)
+            data = hdfio.read_array_data(path, mmap)
+            self.__cache.touch_file(location, temporary)
+            return data
+
+        data = self.__cache.get_packed(location, temporary=temporary)
+        if data is not None:
+            return data
+        else:
+            # the manifest entry may be left from a file that was removed, packed arrays are kept
+            # even if their container can not be read at the moment
+            if not self.__cache.pack.contains(ident):
+                self.__cache.delete_file(location, temporary)
+            return None
+
+    def get_array_slice(self, location, start=None, stop=None, temporary=False):
+        """
+        Read a part of the array data from an hdf5 file in the cache.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        :param start: The index of the first row to read.
+        :type start: int
+        :param stop: The index after the last row to read.
+        :type stop: int
+
+        :returns: The array data or None if the file is not cached.
+        :rtype: numpy.ndarray
+        """
+        ident = helper.id_from_location(location)
+        path = self.__cache.file_cache_path(ident, temporary)
+
+        if os.path.isfile(path):
+            data = hdfio.read_array_slice(path, start, stop)
+            self.__cache.touch_file(location, temporary)
+            return data
+
+        data = self.__cache.get_packed(location, start, stop, temporary)
+        if data is not None:
             return data
         else:
+            # the manifest entry may be left from a file that was removed, packed arrays are kept
+            # even if their container can not be read at the moment
+            if not self.__cache.pack.contains(ident):
+                self.__cache.delete_file(location, temporary)
+            return None
+
+    def array_checksum(self, location, temporary=False):
+        """
+        Get the checksum of cached array data (see helper.array_checksum). The checksum is
+        recorded when the array is written by set_array, otherwise it is computed once from
+        the file and kept in the manifest.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+
+        :returns: The checksum or None if the file is not cached.
+        :rtype: str
+        """
+        info = self.__cache.file_info(location, temporary)
+        if info is None:
             return None
+        if info["array_checksum"] is not None:
+            return info["array_checksum"]
+
+        data = self.get_array(location, temporary, mmap=True)
+        if data is None:
+            return None
+
+        checksum = helper.array_checksum(data)
+        self.__cache.set_array_checksum(location, checksum, temporary)
+        return checksum
+
+    def unchanged_array(self, location, field_name, array_data):
+        """
+        Check if array data equals the cached array data of a field of an entity, thus the array
+        does not need to be written or uploaded again when the entity is saved.
+
+        :param location: The location of the entity as path or URL.
+        :type location: str
+        :param field_name: The name of the datafile field.
+        :type field_name: str
+        :param array_data: The array data of the field.
+        :type array_data: numpy.ndarray|list
+
+        :returns: The location of the cached array data or None if the entity or its array data
+                  is not cached or the array data has changed.
+        :rtype: str
+        """
+        entity = self.get(location)
+        if entity is None or field_name not in entity.datafile_fields:
+            return None
+
+        field_val = entity[field_name]
+        if field_val is None or field_val["data"] is None:
+            return None
+
+        checksum = self.array_checksum(field_val["data"])
+        if checksum is not None and checksum == helper.array_checksum(array_data):
+            return field_val["data"]
+        return None
 
     def set(self, entity, temporary=False):
         if entity is not None:
             obj = convert.model_to_collections(entity)
             self.__cache.set(entity.location, obj, temporary)
+            self.__memory.set(self.__memory_key(entity.location, temporary), entity.copy())
         return entity
 
+    def set_many(self, entities, temporary=False):
+        """
+        Save several entities in the cache at once.
+
+        :param entities: The entities to store.
+        :type entities: list
+
+        :returns: The stored entities.
+        :rtype: list
+        """
+        mapping = {}
+        for entity in entities:
+            if entity is not None:
+                mapping[entity.location] = convert.model_to_collections(entity)
+
+        self.__cache.set_many(mapping, temporary)
+
+        for entity in entities:
+            if entity is not None:
+                self.__memory.set(self.__memory_key(entity.location, temporary), entity.copy())
+
+        return entities
+
     def set_file(self, data, location=None, temporary=False):
         """
         Save raw file data in the cache.
@@ -111,7 +448,7 @@ class CacheStore(BasicStore):
 
         return location
 
-    def set_array(self, array_data, location=None, temporary=False):
+    def set_array(self, array_data, location=None, temporary=False, model=None):
         """
         Save array data in a cached HDF5 file.
 
@@ -119,6 +456,8 @@ class CacheStore(BasicStore):
         :type array_data: numpy.ndarray|list
         :param location: The location of the file.
         :type location: str
+        :param model: The name of the model the array belongs to (see ArrayFormat).
+        :type model: str
 
         :returns: The url to the uploaded file.
         :rtype: str
@@ -129,20 +468,100 @@ class CacheStore(BasicStore):
         else:
             ident = helper.id_from_location(location)
 
-        path = self.__cache.file_cache_path(ident, temporary)
-        hdfio.store_array_data(path, array_data)
+        # the checksum of the array is recorded as the checksum of the file, thus the file is not read
+        # again and comparing the array to a modified one does not read it either (see unchanged_array)
+        checksum = helper.array_checksum(array_data)
+
+        # the old file is replaced, not changed (see hdfio.store_array_data)
+        path = self.__cache.file_cache_path(ident, temporary, create=True)
+        hdfio.store_array_data(path, array_data, self.__array_format, model)
+        self.__cache.add_file(location, temporary, checksum=checksum, array_checksum=checksum)
 
         return location
 
     def delete(self, entity_or_location, temporary=False):
         if entity_or_location is not None:
             if type(entity_or_location) == str:
-                self.__cache.delete(entity_or_location, temporary)
+                location = entity_or_location
             else:
-                self.__cache.delete(entity_or_location.location, temporary)
+                location = entity_or_location.location
+
+            self.__memory.delete(self.__memory_key(location, temporary))
+            self.__cache.delete(location, temporary)
 
     def delete_file(self, location, temporary=False):
         self.__cache.delete_file(location, temporary)
 
+    def pin(self, location):
+        """
+        Protect an entity and its files from eviction, until it is unpinned. Only files referenced
+        by the cached version of the entity are pinned.
+
+        :param location: The location of the entity as path or URL.
+        :type location: str
+        """
+        for loc in self.__pin_locations(location):
+            self.__cache.pin(loc)
+
+    def unpin(self, location):
+        """
+        Remove the pin from an entity and its files (see pin).
+
+        :param location: The location of the entity as path or URL.
+        :type location: str
+        """
+        for loc in self.__pin_locations(location):
+            self.__cache.unpin(loc)
+
+    def pin_file(self, location):
+        """
+        Protect a single file from eviction, until it is unpinned.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        """
+        self.__cache.pin(location)
+
+    def unpin_file(self, location):
+        """
+        Remove the pin from a single file.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        """
+        self.__cache.unpin(location)
+
+    def compact(self):
+        """
+        Evict entities and files if the limits of the cache are exceeded and remove left over
+        incomplete files (see Cache.compact).
+
+        :returns: The number of evicted entities and files.
+        :rtype: int
+        """
+        return self.__cache.compact()
+
     def clear_cache(self, temporary=False):
+        if temporary:
+            self.__memory.clear(lambda key: key[1])
+        else:
+            self.__memory.clear()
         self.__cache.clear(temporary)
+
+    #
+    # Helper methods
+    #
+
+    def __pin_locations(self, location):
+        locations = [location]
+        obj = self.get(location)
+        if obj is not None:
+            for name in obj.datafile_fields:
+                value = obj[name]
+                if value is not None and value["data"] is not None:
+                    locations.append(value["data"])
+        return locations
+
+    @staticmethod
+    def __memory_key(location, temporary):
+        return helper.id_from_location(location), bool(temporary)
@@ -9,6 +9,9 @@
 
 from __future__ import print_function, absolute_import, division
 
+import contextlib
+import os
+
 try:
     import urlparse
 except ImportError:
@@ -18,7 +21,9 @@ except ImportError:
 from gnodeclient.model.models import Model
 from gnodeclient.store.basic_store import BasicStore
 from gnodeclient.store.cache_store import CacheStore
+from gnodeclient.store.download_manager import DownloadManager
 from gnodeclient.store.rest_store import RestStore
+from gnodeclient.util.cache import Cache
 
 
 class CachingRestStore(BasicStore):
@@ -26,9 +31,20 @@ class CachingRestStore(BasicStore):
     A store implementation, that uses an instance of BasicStore and CacheStore to implement
     an interface to the G-Node REST API with transparent caching of results. Further more it provides
     a recursive get method, which ensures the presence of all descendants of a certain entity in the cache.
+
+    Array data of fetched objects is downloaded in the background: get and get_list return as soon
+    as the objects are available and reading array data only waits for the download of the particular
+    file.
     """
 
-    def __init__(self, location, user, password, cache_location, api_prefix="api", api_name="v1"):
+    # The maximum number of objects requested at once during a recursive get
+    BATCH_SIZE = 1000
+
+    def __init__(self, location, user, password, cache_location, api_prefix="api", api_name="v1",
+                 cache_backend=Cache.SQLITE, cache_memory_entries=10000, cache_memory_bytes=None,
+                 max_workers=20, cache_object_entries=None, cache_object_bytes=None, cache_file_entries=None,
+                 cache_file_bytes=None, cache_eviction=Cache.LRU, cache_janitor_interval=None,
+                 cache_pack_bytes=None, array_format=None, cache_store=None):
         """
         Constructor.
 
@@ -41,12 +57,49 @@ class CachingRestStore(BasicStore):
         :param cache_location: The location of the cache, if not set a suitable system specific default
                                will be chosen.
         :type cache_location: str
+        :param cache_backend: The backend used for cached objects (Cache.SQLITE or Cache.PICKLE).
+        :type cache_backend: str
+        :param cache_memory_entries: Maximum number of entities kept in memory by the cache.
+        :type cache_memory_entries: int
+        :param cache_memory_bytes: Maximum estimated size of all entities kept in memory by the cache.
+        :type cache_memory_bytes: int
+        :param max_workers: The maximum number of concurrent requests and file downloads.
+        :type max_workers: int
+        :param cache_object_entries: Maximum number of entities in the cache on disk.
+        :type cache_object_entries: int
+        :param cache_object_bytes: Maximum size of all entities in the cache on disk.
+        :type cache_object_bytes: int
+        :param cache_file_entries: Maximum number of cached files.
+        :type cache_file_entries: int
+        :param cache_file_bytes: Maximum size of all cached files.
+        :type cache_file_bytes: int
+        :param cache_eviction: The eviction policy of the cache (Cache.LRU or Cache.LFU).
+        :type cache_eviction: str
+        :param cache_janitor_interval: The time in seconds between two compactions of the cache
+                                       in the background (None or 0 for no background compaction).
+        :type cache_janitor_interval: float
+        :param cache_pack_bytes: Files with array data up to this size are packed into a few
+                                 container files (None to store each file separately).
+        :type cache_pack_bytes: int
+        :param array_format: Chunking and compression of cached and uploaded array data (None for
+                             contiguous and uncompressed datasets).
+        :type array_format: ArrayFormat
+        :param cache_store: A cache store, that is used instead of a cache store created from the
+                            cache options above.
+        :type cache_store: CacheStore
         """
         super(CachingRestStore, self).__init__(location, user, password)
 
         self.__cache_location = cache_location
-        self.__rest_store = RestStore(location, user, password, api_prefix, api_name)
-        self.__cache_store = CacheStore(cache_location)
+        self.__max_workers = max_workers
+        self.__rest_store = RestStore(location, user, password, api_prefix, api_name, max_workers, array_format)
+        if cache_store is None:
+            cache_store = CacheStore(cache_location, cache_backend, cache_memory_entries, cache_memory_bytes,
+                                     cache_object_entries, cache_object_bytes, cache_file_entries,
+                                     cache_file_bytes, cache_eviction, cache_janitor_interval, cache_pack_bytes,
+                                     array_format)
+        self.__cache_store = cache_store
+        self.__downloads = DownloadManager(self.__rest_store, self.__cache_store, max_workers)
 
     #
     # Properties
@@ -64,6 +117,14 @@ class CachingRestStore(BasicStore):
     def cache_store(self):
         return self.__cache_store
 
+    @property
+    def max_workers(self):
+        return self.__max_workers
+
+    @property
+    def downloads(self):
+        return self.__downloads
+
     #
     # Methods
     #
@@ -74,6 +135,8 @@ class CachingRestStore(BasicStore):
         """
         self.rest_store.connect()
         self.cache_store.connect()
+        if self.__downloads is None:
+            self.__downloads = DownloadManager(self.rest_store, self.cache_store, self.max_workers)
 
     def is_connected(self):
         """
@@ -87,6 +150,9 @@ class CachingRestStore(BasicStore):
         """
         self.rest_store.disconnect()
         self.cache_store.disconnect()
+        if self.__downloads is not None:
+            self.__downloads.shutdown()
+            self.__downloads = None
 
     def select(self, model_name, raw_filters=None):
         """
@@ -107,13 +173,34 @@ class CachingRestStore(BasicStore):
         :rtype: list
         """
         results = self.rest_store.select(model_name, raw_filters=raw_filters)
-
-        for obj in results:
-            self.cache_store.set(obj)
+        self.cache_store.set_many(results)
 
         return results
 
-    def get(self, location, refresh=True, recursive=False):
+    def select_pages(self, model_name, raw_filters=None, page_size=1000, prefetch=2):
+        """
+        Select data from a certain type page by page (see RestStore.select_pages). The results
+        of each page are cached as soon as the page arrives.
+
+        :param model_name: The name of the model as string.
+        :type model_name: str
+        :param raw_filters: Filters as defined by the G-Node REST API.
+        :type raw_filters: dict
+        :param page_size: The number of results per page.
+        :type page_size: int
+        :param prefetch: The number of pages that are requested ahead of consumption.
+        :type prefetch: int
+
+        :returns: A generator over the pages of (filtered) results.
+        :rtype: generator
+        """
+        # closing the pages cancels pending requests, if the consumer stops early
+        with contextlib.closing(self.rest_store.select_pages(model_name, raw_filters, page_size, prefetch)) as pages:
+            for page in pages:
+                self.cache_store.set_many(page)
+                yield page
+
+    def get(self, location, refresh=True, recursive=False, progress=None):
         """
         Get a single entity from the G-Node REST API. If the entity is already in the cache and refresh
         is True the method will check (using etags) if the entity is still up-to-data and renew it if
@@ -126,6 +213,10 @@ class CachingRestStore(BasicStore):
         :type refresh: bool
         :param recursive: Recursively fetch all descendants into the cache.
         :type recursive: bool
+        :param progress: A function that is called during a recursive get with the number of
+                         fetched objects, the number of downloaded files and the number of files
+                         to download.
+        :type progress: function
 
         :returns: The entity matching the given location.
         :rtype: Model
@@ -135,59 +226,44 @@ class CachingRestStore(BasicStore):
         if obj is None:
             obj = self.rest_store.get(location)
             if obj is not None:
-                self.__get_arraydata(obj)
+                self.__get_arraydata([obj])
                 self.cache_store.set(obj)
         elif refresh:
             obj_refreshed = self.rest_store.get(location, obj.guid)
             if obj_refreshed is not None:
-                self.__get_arraydata(obj_refreshed)
+                self.__get_arraydata([obj_refreshed])
                 self.cache_store.set(obj_refreshed)
                 obj = obj_refreshed
 
         if recursive:
-            self.__get_recursive(location, refresh)
+            self.__get_recursive(location, refresh, progress)
 
         return obj
 
     def get_list(self, locations, refresh=True):
         """
         Get a list of objects that are referenced by their locations or complete URLs
-        from the G-Node REST API. All results are cached.
+        from the G-Node REST API. All results are cached and the download of their array
+        data is started in the background.
 
         :param locations: List with locations or URLs.
         :type locations: list
         :param refresh: Update cached entities if necessary.
         :type refresh: bool
 
-        :returns: A list of objects matching the list of locations.
+        :returns: A list of objects matching the list of locations, objects that were deleted
+                  on the server are None.
         :rtype: list
         """
-        results = []
-        locations_todo = []
-
-        if refresh:
-            locations_todo = locations
-        else:
-            for loc in locations:
-                obj = self.cache_store.get(loc)
-
-                if obj is None:
-                    locations_todo.append(loc)
-                else:
-                    results.append(obj)
-
-        objects = self.rest_store.get_list(locations_todo)
-
-        for obj in objects:
-            self.__get_arraydata(obj)
-            self.cache_store.set(obj)
-            results.append(obj)
+        results, objects = self.__get_objects(locations, refresh)
+        self.__get_arraydata(objects)
 
         return results
 
     def get_file(self, location, temporary=False):
         """
-        Get raw file data (bytestring) from the store.
+        Get raw file data (bytestring) from the store. If the file is not cached, the method
+        blocks until it is downloaded.
 
         :param location: The locations of all entities as path or URL.
         :type location: str
@@ -195,28 +271,98 @@ class CachingRestStore(BasicStore):
         :returns: The raw file data.
         :rtype: str
         """
-        data = self.cache_store.get_file(location, temporary)
-        if data is None and not temporary:
-            data = self.rest_store.get_file(location)
-            self.cache_store.set_file(data, location)
-        return data
+        if temporary:
+            return self.cache_store.get_file(location, temporary)
 
-    def get_array(self, location, temporary=False):
+        # the file must not be evicted between its download and reading it
+        self.cache_store.pin_file(location)
+        try:
+            self.__downloads.fetch(location)
+            data = self.cache_store.get_file(location)
+            if data is None:
+                # the file was listed in the manifest but is missing, thus it is downloaded again
+                self.__downloads.fetch(location)
+                data = self.cache_store.get_file(location)
+            return data
+        finally:
+            self.cache_store.unpin_file(location)
+
+    def get_array(self, location, temporary=False, mmap=False):
         """
-        Read array data from an hdf5 file.
+        Read array data from an hdf5 file. If the file is not cached, the method blocks until
+        it is downloaded.
 
         :param location: The locations of all entities as path or URL.
         :type location: str
+        :param mmap: Map the array from the cached file instead of reading it into memory (if possible).
+        :type mmap: bool
 
         :returns: The raw file data.
         :rtype: numpy.ndarray|list
         """
-        array_data = self.cache_store.get_array(location, temporary)
-        if array_data is None and not temporary:
-            data = self.rest_store.get_file(location)
-            self.cache_store.set_file(data, location)
-            array_data = self.cache_store.get_array(location)
-        return array_data
+        if temporary:
+            return self.cache_store.get_array(location, temporary, mmap)
+
+        self.cache_store.pin_file(location)
+        try:
+            self.__downloads.fetch(location)
+            data = self.cache_store.get_array(location, mmap=mmap)
+            if data is None:
+                # the file was listed in the manifest but is missing, thus it is downloaded again
+                self.__downloads.fetch(location)
+                data = self.cache_store.get_array(location, mmap=mmap)
+            return data
+        finally:
+            self.cache_store.unpin_file(location)
+
+    def get_array_slice(self, location, start=None, stop=None):
+        """
+        Read a part of the array data of a file. If the file is not cached, only the requested part
+        is fetched from the server using HTTP range requests. If the server does not support range
+        requests the whole file is downloaded into the cache. If the file is currently downloaded
+        in the background, the method waits for the download instead.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        :param start: The index of the first row to read.
+        :type start: int
+        :param stop: The index after the last row to read.
+        :type stop: int
+
+        :returns: The array data.
+        :rtype: numpy.ndarray
+        """
+        self.cache_store.pin_file(location)
+        try:
+            if self.__downloads.is_downloading(location):
+                self.__downloads.fetch(location)
+
+            array_data = self.cache_store.get_array_slice(location, start, stop)
+            if array_data is None:
+                array_data = self.rest_store.get_array_slice(location, start, stop)
+            if array_data is None:
+                self.__downloads.fetch(location)
+                array_data = self.cache_store.get_array_slice(location, start, stop)
+            return array_data
+        finally:
+            self.cache_store.unpin_file(location)
+
+    def unchanged_array(self, location, field_name, array_data):
+        """
+        Check if array data equals the cached array data of a field of an entity (see
+        CacheStore.unchanged_array). Only the cache is consulted.
+
+        :param location: The location of the entity as path or URL.
+        :type location: str
+        :param field_name: The name of the datafile field.
+        :type field_name: str
+        :param array_data: The array data of the field.
+        :type array_data: numpy.ndarray|list
+
+        :returns: The location of the cached array data or None if it is not cached or has changed.
+        :rtype: str
+        """
+        return self.cache_store.unchanged_array(location, field_name, array_data)
 
     def set(self, entity, avoid_collisions=False):
         """
@@ -243,21 +389,21 @@ class CachingRestStore(BasicStore):
 
         obj = self.rest_store.set(entity, avoid_collisions)
 
-        # handle temporal datafiles here (array data)
-        for field_name in entity:
-            field = entity.get_field(field_name)
+        # handle temporal datafiles here (array data), unchanged arrays keep their permanent
+        # location (see NativeDriver.to_model) and are not uploaded again
+        for field_name in entity.datafile_fields:
             field_val = entity[field_name]
 
-            if field.type_info == "datafile" and field_val is not None and \
-                            field_val["data"] is not None:
+            if field_val is not None and field_val["data"] is not None:
                 array_location = field_val["data"]
-                array = self.cache_store.get_array(array_location, temporary=True)
-                if array is not None:
-                    # TODO check if file upload is really needed (optimization)
+                path = self.cache_store.file_path(array_location, temporary=True)
+                if os.path.isfile(path):
                     new_array_location = obj[field_name]['data']
-                    self.rest_store.set_array(array, new_array_location)
-                    self.cache_store.set_array(array, new_array_location)
-                    self.cache_store.delete_file(array_location, temporary=True)
+                    # the temporary file was written in the same array format, thus it is uploaded as it is
+                    # and becomes the cached file of the new location
+                    with open(path, "rb") as f:
+                        self.rest_store.set_file(f, new_array_location)
+                    self.cache_store.promote_file(array_location, new_array_location)
                     entity[field_name]["data"] = new_array_location
 
         obj = self.cache_store.set(obj)
@@ -291,7 +437,7 @@ class CachingRestStore(BasicStore):
 
         return location
 
-    def set_array(self, array_data, location=None, old_location=None, temporary=False):
+    def set_array(self, array_data, location=None, old_location=None, temporary=False, model=None):
         """
         Save array data in the store.
 
@@ -299,6 +445,8 @@ class CachingRestStore(BasicStore):
         :type array_data: numpy.ndarray|list
         :param old_location: The old location of the file.
         :type old_location: str
+        :param model: The name of the model the array belongs to (see ArrayFormat).
+        :type model: str
 
         :returns: The url to the stored file.
         :rtype: str
@@ -310,10 +458,10 @@ class CachingRestStore(BasicStore):
             if not location:
                 raise ValueError('Need a location for permanent data storage')
 
-            self.rest_store.set_array(array_data, location)
-            self.cache_store.set_array(array_data, location)
+            self.rest_store.set_array(array_data, location, model)
+            self.cache_store.set_array(array_data, location, model=model)
         else:
-            location = self.cache_store.set_array(array_data, temporary=True)
+            location = self.cache_store.set_array(array_data, temporary=True, model=model)
 
         return location
 
@@ -373,37 +521,86 @@ class CachingRestStore(BasicStore):
     # Private functions
     #
 
-    # A little helper that makes sure that the array data of an object are on the cache
-    def __get_arraydata(self, model_obj):
-        for name in model_obj:
-            field = model_obj.get_field(name)
-            value = model_obj[name]
-            if field.type_info == "datafile" and value["data"] is not None and value["units"] is not None:
-                # TODO provide a better performing way for checking file existence
-                file_location = model_obj[name]["data"]
-                data = self.cache_store.get_file(file_location)
-                if data is None:
-                    data = self.rest_store.get_file(file_location)
-                    self.cache_store.set_file(data, file_location)
-
-    def __get_recursive(self, location, refresh):
-        locations_done = []
-        locations_todo = [urlparse.urlparse(location).path.strip("/")]
+    # Get objects from the cache or the server, the results are in the order of the given locations
+    def __get_objects(self, locations, refresh):
+        if refresh:
+            results = [None] * len(locations)
+        else:
+            results = self.cache_store.get_many(locations)
+
+        missing = [i for i, obj in enumerate(results) if obj is None]
+        if len(missing) > 0:
+            objects = self.rest_store.get_list([locations[i] for i in missing])
+            self.cache_store.set_many(objects)
+        else:
+            objects = []
+
+        # objects, that were deleted on the server, stay None
+        for i, obj in zip(missing, objects):
+            results[i] = obj
+
+        return results, [obj for obj in objects if obj is not None]
+
+    # Start downloads for all missing array data of the given objects and return the futures
+    def __get_arraydata(self, model_objs, locations_requested=None):
+        if locations_requested is None:
+            locations_requested = set()
+
+        futures = []
+        for model_obj in model_objs:
+            for name in model_obj.datafile_fields:
+                value = model_obj[name]
+                if value is None or value["data"] is None or value["units"] is None:
+                    continue
+
+                file_location = value["data"]
+                if file_location not in locations_requested:
+                    locations_requested.add(file_location)
+                    future = self.__downloads.submit(file_location)
+                    if future is not None:
+                        futures.append(future)
+
+        return futures
+
+    # Fetch all descendants of an object level by level. Array data is downloaded in the background
+    # while the next level is fetched.
+    def __get_recursive(self, location, refresh, progress=None):
+        root = urlparse.urlparse(location).path.strip("/")
+
+        locations_done = set([root])
+        locations_todo = [root]
+        files_requested = set()
+        downloads = []
+        objects_count = 0
 
         while len(locations_todo) > 0:
             more_locations = []
-            objects = self.get_list(locations_todo, refresh)
-            locations_done = locations_done + locations_todo
-
-            for obj in objects:
-                for field_name in obj.child_fields:
-                    field_val = obj[field_name]
-
-                    if field_val is not None and len(field_val) > 0 and\
-                       not (field_name == 'recordingchannelgroups' and obj.model == 'recordingchannel'):
-                        for val in field_val:
-                            val = urlparse.urlparse(val).path.strip("/")
-                            if val not in locations_done:
-                                more_locations.append(val)
 
-            locations_todo = more_locations
\ No newline at end of file
+            for i in range(0, len(locations_todo), CachingRestStore.BATCH_SIZE):
+                batch = locations_todo[i:i + CachingRestStore.BATCH_SIZE]
+                objects, fetched = self.__get_objects(batch, refresh)
+                objects = [obj for obj in objects if obj is not None]
+                downloads.extend(self.__get_arraydata(fetched, files_requested))
+                objects_count += len(objects)
+
+                for obj in objects:
+                    for field_name in obj.child_fields:
+                        field_val = obj[field_name]
+
+                        if field_val is not None and len(field_val) > 0 and\
+                           not (field_name == 'recordingchannelgroups' and obj.model == 'recordingchannel'):
+                            for val in field_val:
+                                val = urlparse.urlparse(val).path.strip("/")
+                                if val not in locations_done:
+                                    locations_done.add(val)
+                                    more_locations.append(val)
+
+                if progress is not None:
+                    progress(objects_count, len([f for f in downloads if f.done()]), len(downloads))
+
+            locations_todo = more_locations
+
+        for i, future in enumerate(downloads):
+            future.result()
+            if progress is not None:
+                progress(objects_count, i + 1, len(downloads))
@@ -9,6 +9,9 @@
 
 from __future__ import print_function, absolute_import, division
 
+import codecs
+import re
+
 try:
     import urlparse
 except ImportError:
@@ -23,6 +26,16 @@ except ImportError:
     import json
 
 
+# Kinds of fields, that are treated differently by the converters
+_PLAIN, _DATA, _DATAFILE, _MODEL, _CHILDREN, _PARENT, _LABELS = range(7)
+
+# Marks missing values in collections
+_MISSING = object()
+
+# Conversion plans for each model class, see _plan()
+_PLANS = {}
+
+
 def collections_to_model(collection, as_list=False):
     """
     Converts objects of nested collections (list, dict) as produced by the json module
@@ -62,32 +75,22 @@ def collections_to_model(collection, as_list=False):
         api, version, category, model_name, obj_id = location.strip('/').split('/')
         model_obj = Model.create(model_name)
 
-        for field_name in model_obj:
-            field = model_obj.get_field(field_name)
+        for kind, src_name, unit_name, setter in _plan(model_obj, "from_collections"):
+            value = obj.get(src_name, _MISSING)
 
-            if field.is_child:
-                obj_field_name = field.name_mapping or field.type_info + '_set'
-            else:
-                obj_field_name = field.name_mapping or field_name
-
-            if not obj_field_name in obj:
+            if value is _MISSING:
                 continue
-
-            if field.type_info in ['data', 'datafile']:
-                value = obj[obj_field_name]
-                field_val = {
-                    "units": obj.get(obj_field_name + '__unit', None),
-                    "data": float(value) if field.type_info == 'data' else value
-                }
-            elif field_name == 'model':
-                field_val = model_name
-            elif field.is_child and obj[obj_field_name] is not None:
-                field_val = [clean(ref) for ref in obj[obj_field_name]]
-            else:
-                field_val = obj[obj_field_name]
-
-            if field_val is not None:
-                model_obj[field_name] = field_val
+            elif kind == _PLAIN:
+                if value is not None:
+                    setter(model_obj, value)
+            elif kind == _DATA:
+                setter(model_obj, {"units": obj.get(unit_name, None), "data": float(value)})
+            elif kind == _DATAFILE:
+                setter(model_obj, {"units": obj.get(unit_name, None), "data": value})
+            elif kind == _MODEL:
+                setter(model_obj, model_name)
+            elif value is not None:
+                setter(model_obj, [clean(ref) for ref in value])
 
         models.append(model_obj)
 
@@ -111,25 +114,19 @@ def model_to_collections(model):
     :rtype: dict
     """
     result = {}
-    for field_name in model:
-        value = model[field_name]
-        field = model.get_field(field_name)
+    for kind, dst_name, unit_name, getter in _plan(model, "to_collections"):
+        value = getter(model)
 
         if isinstance(value, Model):
             value = model_to_collections(value)
-        elif model.model in (Model.EVENTARRAY, Model.EPOCHARRAY) and field_name == "labels":
+        elif kind == _LABELS:
             if value is not None:
                 value = value["data"]
-        elif field.type_info in ["data", "datafile"]:
-            result[field_name + '__unit'] = value["units"]
+        elif kind == _DATA or kind == _DATAFILE:
+            result[unit_name] = value["units"]
             value = value["data"]
 
-        if field.is_child:
-            field_name = field.name_mapping or field.type_info + "_set"
-        else:
-            field_name = field.name_mapping or field_name
-
-        result[field_name] = value
+        result[dst_name] = value
     return result
 
 
@@ -147,51 +144,114 @@ def model_to_json_response(model, exclude=("location", "model", "guid", "resourc
     :rtype: str
     """
     result = {}
-    for field_name in model:
-        if exclude is not None and field_name not in exclude:
-            field = model.get_field(field_name)
-            value = model[field_name]
+    if exclude is not None:
+        for kind, dst_name, unit_name, getter in _plan(model, "to_json", tuple(exclude)):
+            value = getter(model)
 
-            if field.type_info == "data":
+            if kind == _DATA:
                 if value is None:
-                    result[field_name] = None
+                    result[dst_name] = None
                 else:
-                    result[field_name] = value["data"]
-                    result[field_name + '__unit'] = value["units"]
+                    result[dst_name] = value["data"]
+                    result[unit_name] = value["units"]
 
-            elif field.type_info == "datafile":
-                if value is not None:  # TODO clean this up
-                    #if model.model in (Model.EPOCHARRAY, Model.EPOCHARRAY) and field_name == "labels":
-                    #    new_value = helper.id_from_location(value["data"])
-                    #else:
-                    #    new_value = {"units": value["units"], "data": helper.id_from_location(value["data"])}
-                    result[field_name + '__unit'] = value["units"]
+            elif kind == _DATAFILE:
+                if value is not None:
+                    result[unit_name] = value["units"]
 
-            elif field.is_child:
-                if model.model == Model.RECORDINGCHANNEL and field_name == "recordingchannelgroups":
-                    field_name = field.name_mapping or field.type_info + "_set"
-                    new_value = []
-                    if value is not None:
-                        for i in value:
-                            new_value.append(helper.id_from_location(i))
-                    result[field_name] = new_value
+            elif kind == _CHILDREN:
+                new_value = []
+                if value is not None:
+                    for i in value:
+                        new_value.append(helper.id_from_location(i))
+                result[dst_name] = new_value
 
-            elif field.is_parent:
-                field_name = field.name_mapping or field_name
+            elif kind == _PARENT:
                 if value is None:
-                    result[field_name] = None
+                    result[dst_name] = None
                 else:
-                    result[field_name] = helper.id_from_location(value)
+                    result[dst_name] = helper.id_from_location(value)
 
             else:
-                field_name = field.name_mapping or field_name
-                result[field_name] = value
+                result[dst_name] = value
 
     json_response = json.dumps(result)
 
     return json_response
 
 
+def _plan(model, direction, exclude=None):
+    """
+    Get the conversion plan for the class of a model, that is used by the converters above.
+    A plan is a tuple of steps, one for each field that needs to be converted. Each step is a
+    tuple (kind, name, unit_name, accessor) where name is the key of the field in the converted
+    representation and accessor is the setter or getter of the field. Plans are computed once
+    for each model class and direction.
+
+    :param model: A model of the class, for which the plan is needed.
+    :type model: Model
+    :param direction: One of "from_collections", "to_collections" or "to_json".
+    :type direction: str
+    :param exclude: Field names that are excluded (only for "to_json").
+    :type exclude: tuple
+
+    :returns: The conversion plan.
+    :rtype: tuple
+    """
+    key = (type(model), direction, exclude)
+    if key in _PLANS:
+        return _PLANS[key]
+
+    steps = []
+    for field_name, field in model.fields.items():
+        if field.is_child:
+            mapped_name = field.name_mapping or field.type_info + "_set"
+        else:
+            mapped_name = field.name_mapping or field_name
+        accessor = getattr(type(model), field_name)
+
+        if direction == "from_collections":
+            if field.type_info == "data":
+                kind = _DATA
+            elif field.type_info == "datafile":
+                kind = _DATAFILE
+            elif field_name == "model":
+                kind = _MODEL
+            elif field.is_child:
+                kind = _CHILDREN
+            else:
+                kind = _PLAIN
+            steps.append((kind, mapped_name, mapped_name + "__unit", accessor.fset))
+
+        elif direction == "to_collections":
+            if model.model in (Model.EVENTARRAY, Model.EPOCHARRAY) and field_name == "labels":
+                kind = _LABELS
+            elif field.type_info == "data":
+                kind = _DATA
+            elif field.type_info == "datafile":
+                kind = _DATAFILE
+            else:
+                kind = _PLAIN
+            steps.append((kind, mapped_name, field_name + "__unit", accessor.fget))
+
+        elif field_name not in exclude:
+            if field.type_info == "data":
+                steps.append((_DATA, field_name, field_name + "__unit", accessor.fget))
+            elif field.type_info == "datafile":
+                steps.append((_DATAFILE, field_name, field_name + "__unit", accessor.fget))
+            elif field.is_child:
+                if model.model == Model.RECORDINGCHANNEL and field_name == "recordingchannelgroups":
+                    steps.append((_CHILDREN, mapped_name, None, accessor.fget))
+            elif field.is_parent:
+                steps.append((_PARENT, mapped_name, None, accessor.fget))
+            else:
+                steps.append((_PLAIN, mapped_name, None, accessor.fget))
+
+    plan = tuple(steps)
+    _PLANS[key] = plan
+    return plan
+
+
 def json_to_collections(string, as_list=False):
     """
     Converts a json string from the REST API into a collection (list, dict) that
@@ -205,7 +265,7 @@ def json_to_collections(string, as_list=False):
     :returns: A list or dict that represents the parsed string.
     :rtype: dict|list
     """
-    collection = json.loads(string, encoding='UTF-8')
+    collection = json.loads(string)
 
     if 'selected' in collection:
         collection = collection['selected']
@@ -226,6 +286,188 @@ def json_to_collections(string, as_list=False):
     return collection
 
 
+def iter_json_to_collections(chunks):
+    """
+    Incrementally parses a json response from the REST API and yields the contained objects one
+    by one. If the response contains a list of selected objects, this list is parsed element by
+    element, so that only the current object has to be held in memory in its parsed form.
+
+    :param chunks: The json encoded response as string or as iterable of strings (e.g. from iter_content).
+    :type chunks: str|iterable
+
+    :returns: A generator over all dicts that represent the objects of the response.
+    :rtype: generator
+    """
+    scanner = _JsonScanner(chunks)
+
+    char = scanner.next_char()
+    if char == '[':
+        for obj in scanner.array_elements():
+            yield obj
+    elif char == '{':
+        members = {}
+        while True:
+            char = scanner.next_char()
+            if char == '}':
+                break
+            elif char == ',':
+                continue
+            elif char != '"':
+                raise ValueError("Invalid json: expected an object key")
+
+            scanner.unread_char()
+
+            key = scanner.value()
+            if scanner.next_char() != ':':
+                raise ValueError("Invalid json: expected ':' after object key")
+
+            if key == 'selected':
+                if scanner.peek_char() == '[':
+                    scanner.next_char()
+                    for obj in scanner.array_elements():
+                        yield obj
+                else:
+                    obj = scanner.value()
+                    if obj is not None:
+                        yield obj
+                return
+
+            members[key] = scanner.value()
+
+        yield members
+    elif char is not None:
+        raise ValueError("Invalid json: expected an object or a list")
+
+
+def iter_json_to_models(chunks):
+    """
+    Incrementally parses a json response from the REST API and converts each contained object
+    into a model as soon as it is parsed (see iter_json_to_collections).
+
+    :param chunks: The json encoded response as string or as iterable of strings (e.g. from iter_content).
+    :type chunks: str|iterable
+
+    :returns: A generator over all models of the response.
+    :rtype: generator
+    """
+    for obj in iter_json_to_collections(chunks):
+        yield collections_to_model(obj)
+
+
+class _JsonScanner(object):
+    """
+    Reads json values one after another from a stream of (byte) strings.
+    """
+
+    _WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+    _DELIMITERS = ",:]} \t\n\r"
+
+    def __init__(self, chunks):
+        if isinstance(chunks, (bytes, type(u""))):
+            chunks = [chunks]
+
+        self.__chunks = iter(chunks)
+        self.__decoder = json.JSONDecoder()
+        self.__utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.__buffer = u""
+        self.__pos = 0
+        self.__eof = False
+
+    def peek_char(self):
+        """The next none whitespace character or None if the end of the stream is reached."""
+        while True:
+            self.__pos = self._WHITESPACE_RE.match(self.__buffer, self.__pos).end()
+            if self.__pos < len(self.__buffer) or not self.__read():
+                break
+
+        if self.__pos < len(self.__buffer):
+            return self.__buffer[self.__pos]
+        else:
+            return None
+
+    def next_char(self):
+        """Consume the next none whitespace character."""
+        char = self.peek_char()
+        if char is not None:
+            self.__pos += 1
+        return char
+
+    def unread_char(self):
+        """Undo the last call of next_char()."""
+        self.__pos -= 1
+
+    def value(self):
+        """Decode the next json value."""
+        self.peek_char()
+        while True:
+            try:
+                obj, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+                # a value that is not followed by a delimiter (e.g. a number) might be incomplete
+                if self.__eof or (end < len(self.__buffer) and self.__buffer[end] in self._DELIMITERS):
+                    self.__pos = end
+                    return obj
+            except ValueError:
+                if self.__eof:
+                    raise
+
+            self.__read()
+
+    def array_elements(self):
+        """Decode all remaining elements of an array, whose opening bracket was consumed."""
+        scan_once = self.__decoder.scan_once
+        skip = self._WHITESPACE_RE.match
+        delimiters = self._DELIMITERS
+
+        while True:
+            # fast path: decode all complete elements, that are already in the buffer
+            buffer = self.__buffer
+            size = len(buffer)
+            pos = self.__pos
+            while True:
+                pos = skip(buffer, pos).end()
+                if pos < size and buffer[pos] == ',':
+                    pos = skip(buffer, pos + 1).end()
+                if pos >= size or buffer[pos] == ']':
+                    break
+                try:
+                    obj, end = scan_once(buffer, pos)
+                except (StopIteration, ValueError):
+                    break
+                if end >= size or buffer[end] not in delimiters:
+                    break
+                pos = self.__pos = end
+                yield obj
+            self.__pos = pos
+
+            # slow path: the end of the array or an element that needs more data
+            char = self.peek_char()
+            if char == ']':
+                self.__pos += 1
+                return
+            elif char == ',':
+                self.__pos += 1
+            elif char is None:
+                raise ValueError("Invalid json: unterminated list")
+            else:
+                yield self.value()
+
+    def __read(self):
+        if self.__eof:
+            return False
+
+        try:
+            chunk = next(self.__chunks)
+            if isinstance(chunk, bytes):
+                chunk = self.__utf8.decode(chunk)
+        except StopIteration:
+            chunk = self.__utf8.decode(b"", True)
+            self.__eof = True
+
+        self.__buffer = self.__buffer[self.__pos:] + chunk
+        self.__pos = 0
+        return True
+
+
 def permissions_to_json(permissions):
     """
     :param permissions: permission settings to convert, like
@@ -261,4 +503,4 @@ def json_to_permissions(string):
         }]
     :rtype: list
     """
-    return json.loads(string, encoding='UTF-8')
\ No newline at end of file
+    return json.loads(string)
\ No newline at end of file
@@ -0,0 +1,144 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+"""
+This module provides the DownloadManager, which downloads data files from the G-Node REST API
+into the cache in the background.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import gnodeclient.util.helper as helper
+
+
+class DownloadManager(object):
+    """
+    Downloads files from the G-Node REST API into the cache using a bounded pool of worker
+    threads. Each download is represented by a future. Files are only downloaded if they are
+    not already cached and concurrent requests for the same file share a single download.
+
+    Example:
+    >>> downloads = DownloadManager(rest_store, cache_store)
+    >>> downloads.submit(location)  # start the download in the background
+    >>> downloads.fetch(location)   # block until the file is in the cache
+    """
+
+    def __init__(self, rest_store, cache_store, max_workers=20):
+        """
+        Constructor.
+
+        :param rest_store: The store used for downloading files.
+        :type rest_store: RestStore
+        :param cache_store: The cache where downloaded files are stored.
+        :type cache_store: CacheStore
+        :param max_workers: The maximum number of concurrent downloads.
+        :type max_workers: int
+        """
+        self.__rest_store = rest_store
+        self.__cache_store = cache_store
+        self.__executor = ThreadPoolExecutor(max_workers)
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+
+    #
+    # Properties
+    #
+
+    @property
+    def in_flight(self):
+        """
+        The number of downloads, that are not yet finished.
+
+        :rtype: int
+        """
+        with self.__lock:
+            return len(self.__in_flight)
+
+    #
+    # Methods
+    #
+
+    def submit(self, location):
+        """
+        Start the download of a file, unless the file is cached or already being downloaded.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+
+        :returns: A future for the download or None if the file is already cached.
+        :rtype: Future
+        """
+        ident = helper.id_from_location(location)
+        started = False
+
+        with self.__lock:
+            future = self.__in_flight.get(ident)
+            if future is not None and future.done():
+                del self.__in_flight[ident]
+                future = None
+            if future is None and not self.__cache_store.has_file(location):
+                future = self.__executor.submit(self.__download, location)
+                self.__in_flight[ident] = future
+                started = True
+
+        # the callback is invoked right away if the download is already done, hence outside of the lock
+        if started:
+            future.add_done_callback(lambda f: self.__finished(ident, f))
+
+        return future
+
+    def fetch(self, location):
+        """
+        Make sure that a file is in the cache. If the file is being downloaded, this method
+        blocks until the download is complete, otherwise the download is started and awaited.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        """
+        future = self.submit(location)
+        if future is not None:
+            future.result()
+
+    def is_downloading(self, location):
+        """
+        Check if a file is currently being downloaded.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+
+        :returns: True if a download of the file is in progress.
+        :rtype: bool
+        """
+        with self.__lock:
+            return helper.id_from_location(location) in self.__in_flight
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads of the manager.
+
+        :param wait: Wait for all pending downloads to finish.
+        :type wait: bool
+        """
+        self.__executor.shutdown(wait)
+
+    #
+    # Helper methods
+    #
+
+    def __download(self, location):
+        info = self.__rest_store.download_file(location, self.__cache_store.file_path(location))
+        self.__cache_store.add_file(location, checksum=info["checksum"], etag=info["etag"])
+
+    def __finished(self, ident, future):
+        with self.__lock:
+            if self.__in_flight.get(ident) is future:
+                del self.__in_flight[ident]
@@ -9,8 +9,10 @@
 
 from __future__ import print_function, absolute_import, division
 
+import hashlib
 import os
 import tempfile
+from collections import deque
 
 try:
     import urlparse
@@ -24,7 +26,10 @@ from requests.exceptions import HTTPError
 import gnodeclient.store.convert as convert
 from gnodeclient.model.models import Model
 from gnodeclient.store.basic_store import BasicStore
-from gnodeclient.util.hdfio import store_array_data, read_array_data
+import gnodeclient.util.helper as helper
+from gnodeclient.util.multipart import MultipartStream
+from gnodeclient.util.hdfio import store_array_data, read_array_data, read_array_slice
+from gnodeclient.util.lru import LRUCache
 
 
 class RestStore(BasicStore):
@@ -36,7 +41,13 @@ class RestStore(BasicStore):
     URL_LOGIN = 'account/authenticate/'
     URL_LOGOUT = 'account/logout/'
 
-    def __init__(self, location, user, password, api_prefix, api_name):
+    CHUNK_SIZE = 1024 * 1024
+
+    # The filters used by the G-Node REST API for pagination
+    FILTER_MAX_RESULTS = 'max_results'
+    FILTER_OFFSET = 'offset'
+
+    def __init__(self, location, user, password, api_prefix, api_name, max_workers=20, array_format=None):
         """
         Constructor.
 
@@ -46,11 +57,18 @@ class RestStore(BasicStore):
         :type user: str
         :param password: The password (might be ignored by some kinds of store)
         :type password: str
+        :param max_workers: The maximum number of concurrent requests.
+        :type max_workers: int
+        :param array_format: Chunking and compression of uploaded array data (None for contiguous
+                             and uncompressed datasets).
+        :type array_format: ArrayFormat
         """
         super(RestStore, self).__init__(location, user, password)
         self.__session = None
         self.api_prefix = api_prefix
         self.api_name = api_name
+        self.max_workers = max_workers
+        self.array_format = array_format
 
     def raise_for_status(self, response):
         """Raises stored :class:`HTTPError`, if one occurred."""
@@ -67,7 +85,7 @@ class RestStore(BasicStore):
         """
         url = urlparse.urljoin(self.location, RestStore.URL_LOGIN)
 
-        session = FuturesSession(max_workers=20)
+        session = FuturesSession(max_workers=self.max_workers)
 
         future = session.post(url, {'username': self.user, 'password': self.password})
         response = future.result()
@@ -112,24 +130,88 @@ class RestStore(BasicStore):
         :returns: A list of (filtered) results.
         :rtype: list
         """
-        results = []
-
         raw_filters = {} if raw_filters is None else raw_filters
 
         location = Model.get_location(model_name)
         url = urlparse.urljoin(self.location, location)
 
         headers = {}
-        future = self.__session.get(url, headers=headers, params=raw_filters)
+        future = self.__session.get(url, headers=headers, params=raw_filters, stream=True)
         response = future.result()
         self.raise_for_status(response)
 
-        raw_results = convert.json_to_collections(response.content, as_list=True)
-        for obj in raw_results:
-            results.append(convert.collections_to_model(obj))
+        # parse and convert the results while they are read from the connection
+        try:
+            results = list(convert.iter_json_to_models(response.iter_content(RestStore.CHUNK_SIZE)))
+        finally:
+            response.close()
 
         return results
 
+    def select_pages(self, model_name, raw_filters=None, page_size=1000, prefetch=2):
+        """
+        Select data from a certain type page by page. This is a generator, that requests the
+        results using the pagination filters of the G-Node REST API and yields the results of
+        each page as a list of model objects. While a page is consumed, the following pages are
+        already requested in the background.
+
+        :param model_name: The name of the model as string.
+        :type model_name: str
+        :param raw_filters: Filters as defined by the G-Node REST API (pagination filters are ignored).
+        :type raw_filters: dict
+        :param page_size: The number of results per page.
+        :type page_size: int
+        :param prefetch: The number of pages that are requested ahead of consumption.
+        :type prefetch: int
+
+        :returns: A generator over the pages of (filtered) results.
+        :rtype: generator
+        """
+        raw_filters = {} if raw_filters is None else raw_filters
+
+        location = Model.get_location(model_name)
+        url = urlparse.urljoin(self.location, location)
+
+        def request_page(offset):
+            params = dict(raw_filters)
+            params[RestStore.FILTER_MAX_RESULTS] = page_size
+            params[RestStore.FILTER_OFFSET] = offset
+            return self.__session.get(url, params=params)
+
+        pending = deque()
+        next_offset = 0
+        for i in range(max(prefetch, 0) + 1):
+            pending.append(request_page(next_offset))
+            next_offset += page_size
+
+        first_uri = None
+        try:
+            while len(pending) > 0:
+                response = pending.popleft().result()
+                self.raise_for_status(response)
+
+                page = list(convert.iter_json_to_models(response.content))
+
+                # a page, that starts like the previous one, means that the server ignores the offset
+                if len(page) > 0 and first_uri is not None and page[0].resource_uri == first_uri:
+                    page = []
+
+                if len(page) < page_size:
+                    # the last page was reached, the requests for following pages are not needed
+                    while len(pending) > 0:
+                        pending.popleft().cancel()
+                else:
+                    first_uri = page[0].resource_uri
+                    pending.append(request_page(next_offset))
+                    next_offset += page_size
+
+                if len(page) > 0:
+                    yield page
+        finally:
+            # the consumer stopped early or a request failed
+            for future in pending:
+                future.cancel()
+
     def get(self, location, etag=None):
         """
         Get a single object from the G-Node REST API. If an etag is provided it will be included in
@@ -174,7 +256,8 @@ class RestStore(BasicStore):
         :param locations: List with locations or URLs.
         :type locations: list
 
-        :returns: A list of objects matching the list of locations.
+        :returns: A list of objects matching the list of locations, objects that were not
+                  found on the server (404) are None.
         :rtype: list
         """
         futures = []
@@ -191,9 +274,12 @@ class RestStore(BasicStore):
 
         for future in futures:
             response = future.result()
-            self.raise_for_status(response)
 
-            result = convert.collections_to_model(convert.json_to_collections(response.content))
+            if response.status_code == 404:
+                result = None
+            else:
+                self.raise_for_status(response)
+                result = convert.collections_to_model(convert.json_to_collections(response.content))
             results.append(result)
 
         return results
@@ -216,10 +302,45 @@ class RestStore(BasicStore):
         self.raise_for_status(response)
         return response.content
 
+    def download_file(self, location, path):
+        """
+        Download a file from the G-Node REST API and write it to the given path. The file data is
+        streamed to disk in chunks and moved to its final path when the download is complete, thus
+        the file at the path is never incomplete.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        :param path: The path where the file should be stored.
+        :type path: str
+
+        :returns: The checksum of the file data (see helper.checksum) and the etag reported by
+                  the server as dict with the keys 'checksum' and 'etag'.
+        :rtype: dict
+        """
+        url = urlparse.urljoin(self.location, location)
+
+        future = self.__session.get(url, stream=True)
+        response = future.result()
+        self.raise_for_status(response)
+
+        tmppath = path + "." + helper.random_str(8, "tmp")
+        sha = hashlib.sha1()
+        try:
+            with open(tmppath, 'wb') as f:
+                for chunk in response.iter_content(RestStore.CHUNK_SIZE):
+                    sha.update(chunk)
+                    f.write(chunk)
+            helper.replace_file(tmppath, path)
+            return {"checksum": sha.hexdigest(), "etag": response.headers.get("etag")}
+        finally:
+            response.close()
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+
     def get_array(self, location):
         """
-        Get raw file data from the G-Node REST API, store it temporarily as an HDF5 file
-        and extract the array data from the file.
+        Download an HDF5 file from the G-Node REST API to a temporary file and extract the
+        array data from the file.
 
         :param location: The locations of all entities as path or URL.
         :type location: str
@@ -228,14 +349,43 @@ class RestStore(BasicStore):
         :rtype: numpy.ndarray|list
         """
         fd, tmppath = tempfile.mkstemp()
-        with open(tmppath, 'w') as f:
-            f.write(self.get_file(location))
-
-        array_data = read_array_data(tmppath)
         os.close(fd)
-        os.remove(tmppath)
+
+        try:
+            self.download_file(location, tmppath)
+            array_data = read_array_data(tmppath)
+        finally:
+            os.remove(tmppath)
+
         return array_data
 
+    def get_array_slice(self, location, start=None, stop=None):
+        """
+        Read a part of the array data of a remote HDF5 file. The file is accessed with HTTP
+        range requests, so that only the blocks needed for the requested rows are transferred.
+
+        :param location: The location of the file as path or URL.
+        :type location: str
+        :param start: The index of the first row to read.
+        :type start: int
+        :param stop: The index after the last row to read.
+        :type stop: int
+
+        :returns: The array data or None if the server does not support range requests.
+        :rtype: numpy.ndarray
+        """
+        url = urlparse.urljoin(self.location, location)
+
+        remote_file = RemoteFile.open(self.__session, url)
+        if remote_file is None:
+            return None
+
+        try:
+            return read_array_slice(remote_file, start, stop)
+        except (TypeError, ValueError):
+            # h5py versions older than 2.9 can not read from file-like objects
+            return None
+
     def set(self, entity, avoid_collisions=False):
         """
         Update or create an entity on the G-Node REST API. If an etag/guid is provided by the entity it
@@ -276,32 +426,37 @@ class RestStore(BasicStore):
 
     def set_file(self, data, location):
         """
-        Save raw file data on the G-Node REST API.
+        Save raw file data on the G-Node REST API. File handles and iterables are streamed to the
+        server, so that the file data does not have to fit into memory.
 
-        :param data: The raw data of the file.
-        :type data: str
+        :param data: The raw data of the file, a file handle opened in binary mode or an iterable
+                     that yields chunks of the file data.
+        :type data: str|file|iterable
         """
-        files = {'raw_file': data}
+        url = urlparse.urljoin(self.location, location)
 
-        future = self.__session.post(location, files=files)
-        response = future.result()
+        response = self.__post_file(url, data)
         self.raise_for_status(response)
 
-    def set_array(self, array_data, location):
+    def set_array(self, array_data, location, model=None):
         """
         Create a temporary HDF5 file with the array data and upload the file
         data to the G-Node REST API.
 
         :param array_data: The raw data to store.
         :type array_data: numpy.ndarray|list
+        :param model: The name of the model the array belongs to (see ArrayFormat).
+        :type model: str
         """
         fd, tmppath = tempfile.mkstemp()
-        store_array_data(tmppath, array_data)
-        with open(tmppath, 'rb') as f:
-            self.set_file(f.read(), location)
-
         os.close(fd)
-        os.remove(tmppath)
+
+        try:
+            store_array_data(tmppath, array_data, self.array_format, model)
+            with open(tmppath, 'rb') as f:
+                self.set_file(f, location)
+        finally:
+            os.remove(tmppath)
 
     def set_delta(self, path):
         """
@@ -312,9 +467,7 @@ class RestStore(BasicStore):
         url = urlparse.urljoin(self.location, "/api/v1/in_bulk/")
 
         with open(path, 'rb') as f:
-            files = {'raw_file': f.read()}
-            future = self.__session.post(url, files=files)
-            response = future.result()
+            response = self.__post_file(url, f)
 
         self.raise_for_status(response)
         return convert.collections_to_model(convert.json_to_collections(response.content))
@@ -386,3 +539,142 @@ class RestStore(BasicStore):
         self.raise_for_status(response)
 
         return convert.json_to_permissions(response.content)
+
+    #
+    # Helper methods
+    #
+
+    def __post_file(self, url, data, field_name='raw_file'):
+        if isinstance(data, (bytes, str)) or not (hasattr(data, "read") or hasattr(data, "__iter__")):
+            future = self.__session.post(url, files={field_name: data})
+        else:
+            stream = MultipartStream(field_name, data)
+            headers = {'Content-Type': stream.content_type}
+            if stream.size is not None:
+                body = stream
+            else:
+                body = iter(stream)  # sent with chunked transfer encoding
+            future = self.__session.post(url, data=body, headers=headers)
+
+        return future.result()
+
+
+class RemoteFile(object):
+    """
+    A read-only file-like object, that reads a remote file block by block using HTTP range requests.
+    The most recently read blocks (up to MAX_BLOCKS) are kept in memory.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+    MAX_BLOCKS = 64
+
+    def __init__(self, session, url, size, first_block=None):
+        """
+        Constructor.
+
+        :param session: The session used for all requests.
+        :type session: FuturesSession
+        :param url: The URL of the remote file.
+        :type url: str
+        :param size: The size of the remote file in bytes.
+        :type size: int
+        :param first_block: The content of the first block, if already known.
+        :type first_block: str
+        """
+        self.__session = session
+        self.__url = url
+        self.__size = size
+        self.__pos = 0
+        self.__blocks = LRUCache(max_entries=RemoteFile.MAX_BLOCKS)
+        if first_block is not None:
+            self.__blocks.set(0, first_block)
+
+    @classmethod
+    def open(cls, session, url):
+        """
+        Check if the server supports range requests for the given URL and create a RemoteFile.
+
+        :param session: The session used for all requests.
+        :type session: FuturesSession
+        :param url: The URL of the remote file.
+        :type url: str
+
+        :returns: The remote file or None if range requests are not supported.
+        :rtype: RemoteFile
+        """
+        headers = {'Range': 'bytes=0-%d' % (cls.BLOCK_SIZE - 1)}
+        response = session.get(url, headers=headers, stream=True).result()
+
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code != 206 or '/' not in content_range:
+            response.close()
+            if 400 <= response.status_code < 600:
+                raise HTTPError(response.content, response=response)
+            return None
+
+        size = int(content_range.split('/')[-1])
+        return cls(session, url, size, response.content)
+
+    #
+    # Properties
+    #
+
+    @property
+    def size(self):
+        return self.__size
+
+    #
+    # Methods
+    #
+
+    def read(self, size=-1):
+        if size is None or size < 0 or self.__pos + size > self.__size:
+            size = max(self.__size - self.__pos, 0)
+
+        first = self.__pos // RemoteFile.BLOCK_SIZE
+        last = (self.__pos + size - 1) // RemoteFile.BLOCK_SIZE
+        blocks = self.__fetch(range(first, last + 1))
+
+        data = b"".join(blocks[i] for i in range(first, last + 1)) if size > 0 else b""
+        offset = self.__pos - first * RemoteFile.BLOCK_SIZE
+        self.__pos += size
+        return data[offset:offset + size]
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.__pos
+        elif whence == 2:
+            offset += self.__size
+        self.__pos = offset
+        return self.__pos
+
+    def tell(self):
+        return self.__pos
+
+    def close(self):
+        self.__blocks.clear()
+
+    #
+    # Helper methods
+    #
+
+    # Get the content of the given blocks from memory or from the server as dict
+    def __fetch(self, blocks):
+        result = {}
+        futures = []
+        for i in blocks:
+            result[i] = self.__blocks.get(i)
+            if result[i] is None:
+                first_byte = i * RemoteFile.BLOCK_SIZE
+                last_byte = min(first_byte + RemoteFile.BLOCK_SIZE, self.__size) - 1
+                headers = {'Range': 'bytes=%d-%d' % (first_byte, last_byte)}
+                futures.append((i, self.__session.get(self.__url, headers=headers)))
+
+        for i, future in futures:
+            response = future.result()
+            if response.status_code != 206:
+                raise HTTPError("Range request failed (status: %d)" % response.status_code, response=response)
+            result[i] = response.content
+            self.__blocks.set(i, response.content)
+
+        return result
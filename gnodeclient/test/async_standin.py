@@ -0,0 +1,121 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+"""
+A local stand-in for the G-Node REST API, that is served by aiohttp (see test_async). The module
+requires Python 3.5 or newer and the aiohttp package.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import json
+
+from aiohttp import web
+
+import gnodeclient.util.helper as helper
+from gnodeclient.model.models import Model
+from gnodeclient.store.rest_store import RestStore
+
+
+class StandInApi(object):
+    """
+    A local stand-in for the G-Node REST API, that is served by aiohttp: authentication, entities
+    with their parents and children, selects and the files of array data.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.files = {}
+        self.app = web.Application()
+        self.app.router.add_route("POST", "/" + RestStore.URL_LOGIN, self.login)
+        self.app.router.add_route("GET", "/" + RestStore.URL_LOGOUT, self.logout)
+        self.app.router.add_route("*", "/api/v1/{category}/{model}/", self.collection)
+        self.app.router.add_route("*", "/api/v1/{category}/{model}/{ident}", self.entity)
+        self.app.router.add_route("*", "/api/v1/{category}/{model}/{ident}/", self.entity)
+
+    async def login(self, request):
+        response = web.Response()
+        response.set_cookie("sessionid", "standin", path="/")
+        return response
+
+    async def logout(self, request):
+        return web.Response()
+
+    async def collection(self, request):
+        model_name = request.match_info["model"]
+
+        if request.method == "POST":
+            ident = helper.random_base32()
+            obj = self.save(model_name, ident, json.loads(await request.text()))
+            return web.json_response(self.present(obj), status=201)
+
+        filters = dict((key, value) for key, value in request.query.items()
+                       if key not in (RestStore.FILTER_OFFSET, RestStore.FILTER_MAX_RESULTS))
+        selected = [obj for obj in self.objects.values() if obj["model"] == model_name and
+                    all(str(obj.get(key)) == value for key, value in filters.items())]
+        return web.json_response({"selected": [self.present(obj) for obj in selected]})
+
+    async def entity(self, request):
+        model_name = request.match_info["model"]
+        ident = request.match_info["ident"]
+
+        if model_name == "datafile":
+            if request.method == "POST":
+                form = await request.post()
+                self.files[ident] = form["raw_file"].file.read()
+                return web.Response()
+            elif ident in self.files:
+                return web.Response(body=self.files[ident])
+        elif request.method == "PUT":
+            obj = self.save(model_name, ident, json.loads(await request.text()))
+            return web.json_response(self.present(obj))
+        elif request.method == "DELETE" and ident in self.objects:
+            del self.objects[ident]
+            return web.Response()
+        elif request.method == "GET" and ident in self.objects:
+            obj = self.objects[ident]
+            if request.headers.get("If-none-match") == obj["guid"]:
+                return web.Response(status=304)
+            return web.json_response(self.present(obj))
+
+        return web.Response(status=404)
+
+    def save(self, model_name, ident, body):
+        """
+        Create or update an entity: references to parents are resolved and array data gets the
+        location of a file.
+        """
+        model = Model.create(model_name)
+        location = Model.get_location(model_name) + ident + "/"
+        obj = self.objects.setdefault(ident, {})
+        obj.update(body)
+        obj.update({"model": model_name, "resource_uri": location, "location": location,
+                    "guid": helper.random_str(8)})
+
+        for field_name, field in model.fields.items():
+            name = field.name_mapping or field_name
+            if field.is_parent and obj.get(name) is not None:
+                # parents are referenced by their identifiers
+                obj[name] = Model.get_location(field.type_info) + obj[name].strip("/").split("/")[-1] + "/"
+            elif field.type_info == "datafile" and field_name + "__unit" in body and obj.get(field_name) is None:
+                obj[field_name] = Model.get_location("datafile") + helper.random_base32() + "/"
+
+        return obj
+
+    def present(self, obj):
+        """
+        The representation of an entity in responses, that includes the locations of its children.
+        """
+        result = dict(obj)
+        for field in Model.create(obj["model"]).fields.values():
+            if field.is_child:
+                result[field.type_info + "_set"] = [child["location"] for child in self.objects.values()
+                                                    if child["model"] == field.type_info and
+                                                    obj["location"] in child.values()]
+        return result
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+"""
+Benchmarks for performance critical parts of the client, that do not need a running server.
+
+Usage:
+> PYTHONPATH="./" python gnodeclient/test/benchmark.py [number of objects]
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+
+import gnodeclient.store.convert as convert
+from gnodeclient.model.models import Model
+from gnodeclient.result.result_driver import NativeDriver
+from gnodeclient.store.cache_store import CacheStore
+import gnodeclient.util.hdfio as hdfio
+from gnodeclient.util.cache import Cache
+
+
+def timed(name, count):
+    """
+    Decorator for benchmark functions: runs the function and prints the time needed per object.
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            result = func(*args, **kwargs)
+            duration = time.time() - start
+            print("%-30s %8.3f s  (%6.2f us per object)" % (name, duration, duration / count * 1e6))
+            return result
+        return wrapper
+    return decorator
+
+
+def fake_events(count):
+    """
+    Collections as returned by the REST API for a number of events.
+    """
+    return [{
+        "resource_uri": "/api/v1/electrophysiology/event/%d/" % i,
+        "location": "/api/v1/electrophysiology/event/%d/" % i,
+        "id": str(i),
+        "guid": "guid%d" % i,
+        "name": "event %d" % i,
+        "description": "",
+        "label": "event %d" % i,
+        "time": i * 0.1,
+        "time__unit": "s",
+        "segment": "/api/v1/electrophysiology/segment/1/",
+        "metadata": None
+    } for i in range(count)]
+
+
+def bench_conversion(count):
+    collections = fake_events(count)
+
+    models = timed("collections_to_model", count)(
+        lambda: [convert.collections_to_model(c) for c in collections])()
+    timed("model_to_collections", count)(
+        lambda: [convert.model_to_collections(m) for m in models])()
+    timed("model_to_json_response", count)(
+        lambda: [convert.model_to_json_response(m) for m in models])()
+
+    return models
+
+
+def bench_fields(models):
+    count = len(models)
+
+    def access_categories():
+        for m in models:
+            m.child_fields, m.parent_fields, m.datafile_fields, m.optional_fields, m.obligatory_fields
+
+    def iterate_fields():
+        for m in models:
+            for field_name in m:
+                m[field_name]
+
+    timed("field categories", count)(access_categories)()
+    timed("field iteration", count)(iterate_fields)()
+
+
+def bench_memory(count):
+    try:
+        import resource
+    except ImportError:
+        print("%-30s (not available on this platform)" % "memory per object")
+        return
+
+    collections = fake_events(count)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    models = [convert.collections_to_model(c) for c in collections]
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is given in kilobytes on linux
+    print("%-30s %8.1f bytes" % ("memory per object", (after - before) * 1024 / len(models)))
+
+
+def bench_file_lookup(count, lookups=10000):
+    """
+    Look up cached files in a flat directory and in the nested layout of the cache, the time
+    per lookup of the nested layout should not depend on the number of files.
+    """
+    location = tempfile.mkdtemp()
+    try:
+        cache = Cache(location, "cache")
+        flat_dir = os.path.join(location, "flat")
+        os.mkdir(flat_dir)
+
+        idents = ["F%09d" % i for i in range(count)]
+        for ident in idents:
+            open(os.path.join(flat_dir, ident), "wb").close()
+            open(cache.file_cache_path(ident, False, create=True), "wb").close()
+
+        sample = [random.choice(idents) for _ in range(lookups)]
+        timed("lookup flat (%d files)" % count, lookups)(
+            lambda: [os.path.isfile(os.path.join(flat_dir, ident)) for ident in sample])()
+        timed("lookup nested (%d files)" % count, lookups)(
+            lambda: [os.path.isfile(cache.file_cache_path(ident, False)) for ident in sample])()
+        cache.close()
+    finally:
+        shutil.rmtree(location)
+
+
+def disk_usage(path):
+    """
+    The space used by all files in a directory, hard links are counted once.
+    """
+    usage = 0
+    inodes = set()
+    for dir_path, _, f_names in os.walk(path):
+        for f_name in f_names:
+            st = os.stat(os.path.join(dir_path, f_name))
+            if st.st_ino == 0 or st.st_ino not in inodes:
+                inodes.add(st.st_ino)
+                usage += getattr(st, "st_blocks", 0) * 512 or st.st_size
+    return usage
+
+
+def bench_array_pack(count):
+    """
+    Store and read small arrays (e.g. spike waveforms) in separate files and packed.
+    """
+    location = "/api/v1/electrophysiology/datafile/W%09d/"
+    waveform = numpy.random.random(32)
+
+    for pack_bytes in (None, 65536):
+        mode = "packed" if pack_bytes else "files"
+        tmp = tempfile.mkdtemp()
+        try:
+            store = CacheStore(tmp, pack_bytes=pack_bytes)
+            timed("set_array %s" % mode, count)(
+                lambda: [store.set_array(waveform, location % i) for i in range(count)])()
+            store.compact()
+            timed("get_array %s" % mode, count)(
+                lambda: [store.get_array(location % i) for i in range(count)])()
+            print("%-30s %8.1f bytes per array" % ("footprint %s" % mode, disk_usage(tmp) / count))
+            store.disconnect()
+        finally:
+            shutil.rmtree(tmp)
+
+
+def bench_dedup(count):
+    """
+    Cache arrays and a copy of them at new locations (e.g. a copied experiment): the copy should
+    not need additional space.
+    """
+    location = "/api/v1/electrophysiology/datafile/%s%09d/"
+    arrays = [numpy.random.random(1000) for _ in range(count)]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        store = CacheStore(tmp)
+        for i, array in enumerate(arrays):
+            store.set_array(array, location % ("A", i))
+        original = disk_usage(tmp)
+
+        timed("set_array copy", count)(
+            lambda: [store.set_array(array, location % ("B", i)) for i, array in enumerate(arrays)])()
+        print("%-30s %8.1f %%" % ("disk usage after copy", disk_usage(tmp) / original * 100))
+        store.disconnect()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_array_format(rows, windows=1000):
+    """
+    Write and read a signal of 4 channels with different chunk layouts and compression filters:
+    prints the throughput, the size of the file relative to the raw data and the time needed
+    for reading a window of 1000 samples.
+    """
+    signal = numpy.cumsum(numpy.random.normal(size=(rows, 4)), axis=0).astype(numpy.float32)
+    mbytes = signal.nbytes / 1e6
+    formats = [
+        ("contiguous", None),
+        ("chunked", hdfio.ArrayFormat(chunk_bytes=hdfio.ArrayFormat.CHUNK_BYTES)),
+        ("gzip", hdfio.ArrayFormat(compression="gzip")),
+        ("gzip shuffle", hdfio.ArrayFormat(compression="gzip", shuffle=True)),
+        ("lzf", hdfio.ArrayFormat(compression="lzf")),
+        ("lzf shuffle", hdfio.ArrayFormat(compression="lzf", shuffle=True)),
+    ]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "signal.h5")
+        for name, array_format in formats:
+            start = time.time()
+            hdfio.store_array_data(path, signal, array_format, Model.ANALOGSIGNALARRAY)
+            write = time.time() - start
+
+            start = time.time()
+            hdfio.read_array_data(path)
+            read = time.time() - start
+
+            offsets = numpy.random.randint(0, rows - 1000, windows)
+            start = time.time()
+            for offset in offsets:
+                hdfio.read_array_slice(path, offset, offset + 1000)
+            window = (time.time() - start) / windows
+
+            print("%-14s write %7.1f MB/s  read %7.1f MB/s  size %5.1f %%  window %7.1f us" %
+                  (name, mbytes / write, mbytes / read, os.path.getsize(path) / signal.nbytes * 100, window * 1e6))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_unchanged_array(rows, count=10):
+    """
+    Convert a cached signal back to a model (see Session.set) with unchanged and with modified
+    array data: an unchanged array is neither written to a temporary file nor uploaded.
+    """
+    location = "/api/v1/electrophysiology/analogsignal/ABC0000001/"
+    data_location = "/api/v1/electrophysiology/datafile/ABC0000002/"
+
+    tmp = tempfile.mkdtemp()
+    try:
+        store = CacheStore(tmp)
+        store.set_array(numpy.random.random(rows), data_location)
+        signal = Model.create(Model.ANALOGSIGNAL)
+        signal.location = location
+        signal.signal = {"units": "mV", "data": data_location}
+        signal.sampling_rate = {"units": "Hz", "data": 1000.0}
+        signal.t_start = {"units": "s", "data": 0.0}
+        store.set(signal)
+
+        driver = NativeDriver(store)
+        native = driver.to_result(signal)
+        timed("to_model unchanged", count)(lambda: [driver.to_model(native) for _ in range(count)])()
+        modified = native.copy()
+        modified.location = location
+        modified[0] = -1 * modified.units
+        timed("to_model modified", count)(lambda: [driver.to_model(modified) for _ in range(count)])()
+        store.disconnect()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def main(count=100000):
+    print("Benchmarks with %d objects:" % count)
+    bench_memory(count)
+    models = bench_conversion(count)
+    bench_fields(models)
+    for files in (count // 100, count // 10, count):
+        bench_file_lookup(files)
+    bench_array_pack(count // 10)
+    bench_dedup(count // 100)
+    bench_array_format(count * 10)
+    bench_unchanged_array(count * 10)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -13,8 +13,13 @@
 # > PYTHONPATH="./" python tests/test_all.py
 
 import unittest
+from gnodeclient.test.test_async import TestAsyncSession
+from gnodeclient.test.test_cache import TestCache, TestCacheFaults
+from gnodeclient.test.test_convert import TestConvert
 from gnodeclient.test.test_hdfio import TestHDFIO
+from gnodeclient.test.test_multipart import TestMultipart
 from gnodeclient.test.test_remote import TestRestAPI
+from gnodeclient.test.test_rest_store import TestRestStore
 from gnodeclient.test.test_dumper import TestDumper
 
 
@@ -22,9 +27,15 @@ class TestAll(unittest.TestSuite):
 
     def __init__(self):
         super(TestAll, self).__init__()
+        self.addTests(unittest.makeSuite(TestCache))
+        self.addTests(unittest.makeSuite(TestCacheFaults))
+        self.addTests(unittest.makeSuite(TestConvert))
         self.addTests(unittest.makeSuite(TestDumper))
         self.addTests(unittest.makeSuite(TestHDFIO))
+        self.addTests(unittest.makeSuite(TestMultipart))
         self.addTests(unittest.makeSuite(TestRestAPI))
+        self.addTests(unittest.makeSuite(TestRestStore))
+        self.addTests(unittest.makeSuite(TestAsyncSession))
 
     def test(self, verbosity=2):
         unittest.TextTestRunner(verbosity=verbosity).run(self)
@@ -0,0 +1,116 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import quantities as pq
+from neo import Block, Segment, AnalogSignal
+
+try:
+    import asyncio
+    from aiohttp.test_utils import TestServer
+    from gnodeclient.async_session import AsyncSession
+    from gnodeclient.store.async_rest_store import AsyncRestStore
+    from gnodeclient.test.async_standin import StandInApi
+except (ImportError, SyntaxError):
+    AsyncSession = None
+
+
+@unittest.skipIf(AsyncSession is None, "AsyncSession requires python 3.5 and aiohttp")
+class TestAsyncSession(unittest.TestCase):
+    """
+    Unit tests for the async session object, that use a local stand-in for the G-Node server.
+    """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.tmp = tempfile.mkdtemp()
+
+        self.api = StandInApi()
+        self.server = TestServer(self.api.app, host="127.0.0.1")
+        self.wait(self.server.start_server())
+
+        options = {"location": str(self.server.make_url("/")), "username": "bob", "password": "pass",
+                   "cache_dir": os.path.join(self.tmp, "cache"), "cache_pack_bytes": 100000}
+        self.session = AsyncSession(options, os.path.join(self.tmp, "gnodeclient.conf"))
+        self.wait(self.session.open())
+
+        self.block = self.wait(self.session.set(Block(name="async block")))
+        self.segments = []
+        for i in range(3):
+            segment = Segment(name="async segment %d" % i)
+            segment.block = self.block
+            segment = self.wait(self.session.set(segment))
+
+            signal = AnalogSignal(np.random.rand(100) * pq.mV, sampling_rate=1 * pq.kHz, name="signal %d" % i)
+            signal.segment = segment
+            self.wait(self.session.set(signal))
+            self.segments.append(segment)
+
+    def tearDown(self):
+        self.wait(self.session.delete(self.block))
+        self.wait(self.session.close())
+        self.wait(self.server.close())
+        self.loop.close()
+        shutil.rmtree(self.tmp)
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_get(self):
+        block = self.wait(self.session.get(self.block.location))
+        self.assertEqual(block.location, self.block.location)
+
+    def test_get_list(self):
+        locations = [segment.location for segment in self.segments]
+        segments = self.wait(self.session.get_list(locations))
+        self.assertEqual([segment.location for segment in segments], locations)
+
+    def test_get_deleted(self):
+        # a segment is deleted on the server by someone else
+        del self.api.objects[self.segments[1].location.strip("/").split("/")[-1]]
+        self.session.clear_cache()
+
+        locations = [segment.location for segment in self.segments]
+        segments = self.wait(self.session.get_list(locations))
+        self.assertEqual([segment is None for segment in segments], [False, True, False])
+
+        store = AsyncRestStore(self.session.options["location"], "bob", "pass")
+        self.wait(store.connect())
+        objects = self.wait(store.get_list(locations))
+        self.assertEqual([obj is None for obj in objects], [False, True, False])
+        self.wait(store.disconnect())
+
+    def test_get_recursive(self):
+        self.session.clear_cache()
+        block = self.wait(self.session.get(self.block.location, recursive=True))
+
+        self.assertEqual(len(block.segments), 3)
+        for segment in block.segments:
+            self.assertEqual(len(segment.analogsignals), 1)
+            self.assertEqual(len(segment.analogsignals[0]), 100)
+
+        # the cache is configured by the same options as the cache of a Session
+        packs = [f_name for _, _, f_names in os.walk(self.session.options["cache_dir"])
+                 for f_name in f_names if f_name.endswith(".h5")]
+        self.assertTrue(len(packs) > 0)
+
+    def test_select(self):
+        results = self.wait(self.session.select("block", {"name": "async block"}))
+        self.assertTrue(len(results) > 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAsyncSession)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,843 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+from __future__ import print_function, absolute_import, division
+
+import contextlib
+import errno
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import h5py
+import numpy
+
+from gnodeclient.model.models import Model
+from gnodeclient.result.prefetch import PrefetchPolicy
+from gnodeclient.result.result_driver import NativeDriver
+from gnodeclient.store.cache_store import CacheStore
+from gnodeclient.store.download_manager import DownloadManager
+import gnodeclient.util.cache as cache_module
+import gnodeclient.util.hdfio as hdfio
+import gnodeclient.util.helper as helper
+from gnodeclient.util.cache import Cache, SQLiteCache
+from gnodeclient.util.janitor import Janitor
+from gnodeclient.util.lru import LRUCache
+from gnodeclient.util.manifest import FileManifest
+from gnodeclient.util.pack import ArrayPack
+
+
+class Pickled(object):
+    """
+    Counts how often it is pickled.
+    """
+
+    count = 0
+
+    def __getstate__(self):
+        Pickled.count += 1
+        return {}
+
+
+class TestCache(unittest.TestCase):
+    """
+    Unit tests for the cache backends.
+    """
+
+    LOCATION = "/api/v1/electrophysiology/block/%s/"
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def check_backend(self, cache):
+        loc = TestCache.LOCATION % "ABC0000001"
+        obj = {"name": "foo", "segment_set": ["bar"]}
+
+        self.assertIsNone(cache.get(loc))
+
+        cache.set(loc, obj)
+        self.assertEqual(cache.get(loc), obj)
+        self.assertIsNone(cache.get(loc, temporary=True))
+
+        cache.set(loc, {"name": "tmp"}, temporary=True)
+        self.assertEqual(cache.get(loc, temporary=True), {"name": "tmp"})
+
+        cache.clear(temporary=True)
+        self.assertIsNone(cache.get(loc, temporary=True))
+        self.assertEqual(cache.get(loc), obj)
+
+        self.assertTrue(cache.delete(loc))
+        self.assertFalse(cache.delete(loc))
+        self.assertIsNone(cache.get(loc))
+
+        cache.set(loc, obj)
+        cache.clear()
+        self.assertIsNone(cache.get(loc))
+
+    def check_bulk(self, cache):
+        mapping = dict((TestCache.LOCATION % ("ABC%07d" % i), {"index": i}) for i in range(1200))
+        cache.set_many(mapping)
+
+        missing = TestCache.LOCATION % "XYZ0000001"
+        results = cache.get_many(list(mapping.keys()) + [missing])
+
+        self.assertEqual(results, mapping)
+        self.assertEqual(cache.get(TestCache.LOCATION % "ABC0000042"), {"index": 42})
+        self.assertEqual(cache.get_many(list(mapping.keys()), temporary=True), {})
+
+    def test_pickle_backend(self):
+        cache = Cache.create(Cache.PICKLE, self.location, "cache")
+        self.check_backend(cache)
+        self.check_bulk(cache)
+        cache.close()
+
+    def test_sqlite_backend(self):
+        cache = Cache.create(Cache.SQLITE, self.location, "cache")
+        self.assertTrue(isinstance(cache, SQLiteCache))
+        self.check_backend(cache)
+        self.check_bulk(cache)
+        cache.close()
+
+    def test_concurrent_writes(self):
+        cache = Cache.create(Cache.PICKLE, self.location, "cache")
+
+        # all objects are stored in the same shard
+        def write(thread):
+            for i in range(50):
+                cache.set(TestCache.LOCATION % ("ABC%03d%04d" % (thread, i)), {"index": i})
+
+        threads = [threading.Thread(target=write, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        locations = [TestCache.LOCATION % ("ABC%03d%04d" % (t, i)) for t in range(4) for i in range(50)]
+        self.assertEqual(len(cache.get_many(locations)), 200)
+        cache.close()
+
+    def test_object_sizes(self):
+        # without object limits each object is only pickled for the shard write
+        cache = Cache.create(Cache.PICKLE, self.location, "cache")
+        Pickled.count = 0
+        cache.set(TestCache.LOCATION % "ABC0000001", Pickled())
+        cache.set_many({TestCache.LOCATION % "ABC0000002": Pickled()})
+        self.assertEqual(Pickled.count, 3)
+        self.assertIsNone(cache.stats["objects"]["bytes"])
+        cache.close()
+
+        cache = Cache.create(Cache.PICKLE, self.location, "limited", object_entries=10)
+        cache.set(TestCache.LOCATION % "ABC0000001", {"name": "foo"})
+        cache.set_many({TestCache.LOCATION % "ABC0000002": {"name": "bar"}})
+        self.assertEqual(cache.stats["objects"]["entries"], 2)
+        self.assertTrue(cache.stats["objects"]["bytes"] > 0)
+        cache.close()
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, Cache.create, "foo", self.location, "cache")
+
+    def test_migration(self):
+        old_cache = Cache.create(Cache.PICKLE, self.location, "cache")
+        for i in range(20):
+            old_cache.set(TestCache.LOCATION % ("ABC%07d" % i), {"index": i})
+        old_cache.set(TestCache.LOCATION % "TMP0000001", {"index": -1}, temporary=True)
+        old_cache.close()
+
+        cache = Cache.create(Cache.SQLITE, self.location, "cache")
+
+        self.assertEqual(os.listdir(cache.obj_dir), [])
+        self.assertEqual(os.listdir(cache.obj_dir_tmp), [])
+        for i in range(20):
+            self.assertEqual(cache.get(TestCache.LOCATION % ("ABC%07d" % i)), {"index": i})
+        self.assertEqual(cache.get(TestCache.LOCATION % "TMP0000001", temporary=True), {"index": -1})
+        cache.close()
+
+    def test_lru(self):
+        lru = LRUCache(max_entries=3)
+        for i in range(3):
+            lru.set(i, "value %d" % i)
+
+        self.assertEqual(lru.get(0), "value 0")
+        lru.set(3, "value 3")
+
+        self.assertEqual(len(lru), 3)
+        self.assertFalse(1 in lru)
+        self.assertIsNone(lru.get(1))
+        self.assertEqual(lru.stats["hits"], 1)
+        self.assertEqual(lru.stats["misses"], 1)
+
+        lru = LRUCache(max_bytes=2000)
+        for i in range(100):
+            lru.set(i, "x" * 100)
+        self.assertTrue(0 < len(lru) < 100)
+        self.assertTrue(lru.size <= 2000)
+
+    def test_memory_tier(self):
+        store = CacheStore(self.location)
+        loc = TestCache.LOCATION % "ABC0000001"
+
+        block = Model.create(Model.BLOCK)
+        block.location = loc
+        block.name = "foo"
+        store.set(block)
+
+        # the memory tier returns copies, changes of the caller are not cached
+        cached = store.get(loc)
+        self.assertFalse(cached is block)
+        self.assertEqual(cached.name, "foo")
+        self.assertEqual(store.memory_stats["hits"], 1)
+        block.name = "bar"
+        cached.name = "bar"
+        cached.segments.append("/api/v1/electrophysiology/segment/ABC0000002/")
+        self.assertEqual(store.get(loc).name, "foo")
+        self.assertEqual(store.get(loc).segments, [])
+
+        store.delete(loc)
+        self.assertIsNone(store.get(loc))
+
+        store.set(block)
+        store.clear_cache()
+        self.assertIsNone(store.get(loc))
+        self.assertEqual(store.memory_stats["entries"], 0)
+        store.disconnect()
+
+    def test_manifest(self):
+        cache = Cache.create(Cache.SQLITE, self.location, "cache")
+        loc = "/api/v1/electrophysiology/datafile/ABC0000001/"
+
+        self.assertFalse(cache.has_file(loc))
+        cache.set_file(loc, b"some data")
+        self.assertTrue(cache.has_file(loc))
+        self.assertFalse(cache.has_file(loc, temporary=True))
+
+        info = cache.file_info(loc)
+        self.assertEqual(info["size"], 9)
+        self.assertEqual(info["checksum"], helper.checksum(b"some data"))
+        self.assertTrue(cache.verify_file(loc))
+
+        # damaged files are detected and removed
+        with open(cache.file_cache_path(info["ident"], False), "wb") as f:
+            f.write(b"other data")
+        self.assertFalse(cache.verify_file(loc))
+        self.assertFalse(cache.has_file(loc))
+
+        # files written by older versions are moved and added when the cache is opened
+        with open(os.path.join(cache.file_dir, "ABC0000002"), "wb") as f:
+            f.write(b"old")
+        cache.close()
+
+        cache = Cache.create(Cache.SQLITE, self.location, "cache")
+        self.assertEqual(cache.file_info("/api/v1/electrophysiology/datafile/ABC0000002/")["size"], 3)
+        self.assertEqual(cache.get_file("/api/v1/electrophysiology/datafile/ABC0000002/"), b"old")
+        cache.clear()
+        self.assertEqual(cache.manifest.entries(), [])
+        cache.close()
+
+    def test_file_layout(self):
+        cache = Cache.create(Cache.PICKLE, self.location, "cache")
+        loc = "/api/v1/electrophysiology/datafile/%s/"
+
+        cache.set_file(loc % "ABC0000001", b"data")
+        cache.set_file(loc % "ABC0000002", b"temp", temporary=True)
+        path = cache.file_cache_path("ABC0000001", False)
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(len(os.path.relpath(path, cache.file_dir).split(os.sep)), Cache.SHARD_DEPTH + 1)
+
+        # a flat cache written by an older version
+        cache.close()
+        for temporary, file_dir in ((False, cache.file_dir), (True, cache.file_dir_tmp)):
+            for f_name in ("ABC0000003", "ABC0000004"):
+                with open(os.path.join(file_dir, f_name), "wb") as f:
+                    f.write(f_name.encode("ascii"))
+
+        cache = Cache.create(Cache.PICKLE, self.location, "cache")
+        for f_name in ("ABC0000003", "ABC0000004"):
+            self.assertEqual(cache.get_file(loc % f_name), f_name.encode("ascii"))
+            self.assertEqual(cache.get_file(loc % f_name, temporary=True), f_name.encode("ascii"))
+            self.assertFalse(os.path.exists(os.path.join(cache.file_dir, f_name)))
+        self.assertEqual(cache.get_file(loc % "ABC0000001"), b"data")
+        self.assertEqual(cache.manifest.count(), 3)
+        self.assertEqual(cache.manifest.count(temporary=True), 3)
+
+        # cleared directories are removed in the background
+        cache.clear()
+        self.assertEqual(os.listdir(cache.file_dir), [])
+        self.assertIsNone(cache.get_file(loc % "ABC0000001"))
+        cache.set_file(loc % "ABC0000001", b"new")
+        self.assertEqual(cache.get_file(loc % "ABC0000001"), b"new")
+        cache.close()
+        self.assertEqual(sorted(f for f in os.listdir(cache.base_dir) if "trash" in f), [])
+
+    def test_array_pack(self):
+        loc = "/api/v1/electrophysiology/datafile/ABC%07d/"
+        store = CacheStore(self.location, pack_bytes=10000, file_entries=8)
+
+        for i in range(10):
+            store.set_array(numpy.arange(i + 1) * 1.5, loc % i)
+        store.set_array(numpy.zeros(10000), loc % 100)
+        store.set_array(numpy.ones(3), loc % 200, temporary=True)
+
+        # small arrays are packed, large and temporary ones are stored in files, evicted arrays are removed
+        self.assertEqual(store.disk_stats["files"]["packed"], 6)
+        self.assertFalse(os.path.exists(store.file_path(loc % 9)))
+        self.assertTrue(os.path.exists(store.file_path(loc % 100)))
+        self.assertTrue(os.path.exists(store.file_path(loc % 200, temporary=True)))
+        self.assertFalse(store.has_file(loc % 0))
+
+        numpy.testing.assert_array_equal(store.get_array(loc % 9, mmap=True), numpy.arange(10) * 1.5)
+        numpy.testing.assert_array_equal(store.get_array_slice(loc % 9, 2, 4), [3.0, 4.5])
+        numpy.testing.assert_array_equal(store.get_array(loc % 200, temporary=True), numpy.ones(3))
+        self.assertTrue(store.verify_file(loc % 9))
+
+        # raw data of a packed array is exported to an HDF5 file
+        path = os.path.join(self.location, "export.h5")
+        with open(path, "wb") as f:
+            f.write(store.get_file(loc % 5))
+        numpy.testing.assert_array_equal(hdfio.read_array_data(path), numpy.arange(6) * 1.5)
+
+        store.delete_file(loc % 5)
+        self.assertIsNone(store.get_array(loc % 5))
+        self.assertEqual(store.disk_stats["files"]["packed"], 5)
+        store.clear_cache()
+        self.assertEqual(store.disk_stats["files"]["packed"], 0)
+        store.disconnect()
+
+        # containers of removed arrays are deleted by compact
+        pack = ArrayPack(os.path.join(self.location, "packs"), os.path.join(self.location, "pack.db"),
+                         container_bytes=0)
+        self.assertTrue(pack.put("ABC0000001", path))
+        self.assertTrue(pack.put("ABC0000002", path))
+        self.assertFalse(pack.put("ABC0000003", os.path.join(self.location, "pack.db")))
+        self.assertEqual(len(self.containers(pack.directory)), 2)
+
+        pack.remove_many(["ABC0000001"])
+        self.assertEqual(pack.compact(), 1)
+        self.assertEqual(pack.idents(), set(["ABC0000002"]))
+        numpy.testing.assert_array_equal(pack.get("ABC0000002", 1, 3), [1.5, 3.0])
+        self.assertEqual(len(self.containers(pack.directory)), 1)
+        pack.close()
+
+    def test_shared_pack(self):
+        path = os.path.join(self.location, "array.h5")
+        hdfio.store_array_data(path, numpy.arange(10.0))
+        pack_dir = os.path.join(self.location, "packs")
+        db_path = os.path.join(self.location, "pack.db")
+
+        # packs of two processes use the same containers
+        pack = ArrayPack(pack_dir, db_path)
+        other = ArrayPack(pack_dir, db_path)
+        self.assertTrue(pack.put("ABC0000001", path))
+        numpy.testing.assert_array_equal(other.get("ABC0000001"), numpy.arange(10.0))
+        self.assertTrue(other.put("ABC0000002", path))
+        numpy.testing.assert_array_equal(pack.get("ABC0000002", 2, 4), [2.0, 3.0])
+
+        # new arrays are appended in place, a failed append removes its dataset again
+        container = self.containers(pack.directory)[0]
+        inode = os.stat(container).st_ino
+        with inject(h5py.Group, "copy", fail):
+            self.assertFalse(pack.put("ABC0000003", path))
+        self.assertFalse(pack.contains("ABC0000003"))
+        with h5py.File(container, "r") as f:
+            self.assertEqual(sorted(f.keys()), ["ABC0000001", "ABC0000002"])
+        self.assertTrue(pack.put("ABC0000003", path))
+        self.assertEqual(os.stat(container).st_ino, inode)
+
+        # a replacement is written to a copy, thus a failed replacement leaves the container unchanged
+        with open(container, "rb") as f:
+            data = f.read()
+        with inject(helper, "replace_file", fail):
+            self.assertFalse(pack.put("ABC0000003", path))
+        self.assertTrue(pack.contains("ABC0000003"))
+        self.assertEqual(self.containers(pack.directory), [container])
+        with open(container, "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertTrue(pack.put("ABC0000003", path))
+        self.assertNotEqual(os.stat(container).st_ino, inode)
+
+        # arrays of a container, that can not be read, are kept
+        with open(container, "wb") as f:
+            f.write(b"damaged")
+        self.assertIsNone(other.get("ABC0000001"))
+        self.assertFalse(other.export("ABC0000001", os.path.join(self.location, "export.h5")))
+        self.assertTrue(other.contains("ABC0000001"))
+        with open(container, "wb") as f:
+            f.write(data)
+        numpy.testing.assert_array_equal(other.get("ABC0000001"), numpy.arange(10.0))
+
+        # arrays of a container, that is gone, are removed
+        os.remove(container)
+        self.assertIsNone(pack.get("ABC0000001"))
+        self.assertFalse(pack.contains("ABC0000001"))
+        pack.close()
+        other.close()
+
+        # the cache keeps packed arrays, that can not be read at the moment
+        loc = "/api/v1/electrophysiology/datafile/ABC%07d/"
+        store = CacheStore(os.path.join(self.location, "cache"), pack_bytes=10000)
+        store.set_array(numpy.arange(10.0), loc % 1)
+        container = self.containers(os.path.join(self.location, "cache"))[0]
+        os.rename(container, container + ".bak")
+        with open(container, "wb") as f:
+            f.write(b"damaged")
+        self.assertIsNone(store.get_array(loc % 1))
+        self.assertIsNone(store.get_file(loc % 1))
+        self.assertTrue(store.has_file(loc % 1))
+        os.rename(container + ".bak", container)
+        numpy.testing.assert_array_equal(store.get_array(loc % 1), numpy.arange(10.0))
+        store.disconnect()
+
+    def test_pack_processes(self):
+        path = os.path.join(self.location, "array.h5")
+        hdfio.store_array_data(path, numpy.arange(10.0))
+        pack_dir = os.path.join(self.location, "packs")
+        db_path = os.path.join(self.location, "pack.db")
+
+        # writes of several processes are serialised, thus no array is lost
+        script = ("import sys; from gnodeclient.util.pack import ArrayPack; "
+                  "pack = ArrayPack(sys.argv[1], sys.argv[2]); "
+                  "sys.exit(0 if all([pack.put('P%s%06d' % (sys.argv[4], i), sys.argv[3]) for i in range(20)]) else 1)")
+        processes = [subprocess.Popen([sys.executable, "-c", script, pack_dir, db_path, path, str(n)])
+                     for n in range(3)]
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+
+        pack = ArrayPack(pack_dir, db_path)
+        self.assertEqual(pack.count(), 60)
+        for ident in pack.idents():
+            numpy.testing.assert_array_equal(pack.get(ident), numpy.arange(10.0))
+        pack.close()
+
+    def containers(self, directory):
+        """
+        The paths of all container files of packs in a directory.
+        """
+        return sorted(os.path.join(dir_path, f_name) for dir_path, _, f_names in os.walk(directory)
+                      for f_name in f_names if f_name.endswith(".h5"))
+
+    def test_dedup(self):
+        loc = "/api/v1/electrophysiology/datafile/ABC%07d/"
+        store = CacheStore(self.location)
+        array = numpy.arange(100.0)
+
+        # the same content is stored once
+        store.set_array(array, loc % 1)
+        store.set_array(array, loc % 2)
+        store.set_array(array + 1, loc % 3)
+        inode = os.stat(store.file_path(loc % 1)).st_ino
+        self.assertEqual(os.stat(store.file_path(loc % 2)).st_ino, inode)
+        self.assertNotEqual(os.stat(store.file_path(loc % 3)).st_ino, inode)
+
+        # writing to a shared file replaces the link, thus the other file keeps its content
+        hdfio.store_array_data(store.file_path(loc % 1), array + 2)
+        numpy.testing.assert_array_equal(store.get_array(loc % 2), array)
+        numpy.testing.assert_array_equal(store.get_array(loc % 1), array + 2)
+        store.set_array(array, loc % 1)
+
+        store.delete_file(loc % 1)
+        numpy.testing.assert_array_equal(store.get_array(loc % 2), array)
+
+        # promoting a temporary file moves it
+        temp_loc = store.set_array(array * 2, temporary=True)
+        inode = os.stat(store.file_path(temp_loc, temporary=True)).st_ino
+        self.assertTrue(store.promote_file(temp_loc, loc % 4))
+        self.assertFalse(store.has_file(temp_loc, temporary=True))
+        self.assertFalse(os.path.exists(store.file_path(temp_loc, temporary=True)))
+        self.assertEqual(os.stat(store.file_path(loc % 4)).st_ino, inode)
+        numpy.testing.assert_array_equal(store.get_array(loc % 4), array * 2)
+        self.assertFalse(store.promote_file(temp_loc, loc % 5))
+        store.disconnect()
+
+        # packed arrays with the same content share their dataset
+        store = CacheStore(os.path.join(self.location, "packed"), pack_bytes=10000)
+        for i in range(3):
+            store.set_array(array, loc % i)
+        self.assertEqual(store.disk_stats["files"]["packed"], 3)
+        store.delete_file(loc % 0)
+        numpy.testing.assert_array_equal(store.get_array(loc % 1), array)
+        numpy.testing.assert_array_equal(store.get_array(loc % 2), array)
+        store.disconnect()
+
+    def test_unchanged_array(self):
+        loc = "/api/v1/electrophysiology/analogsignal/ABC0000001/"
+        data_loc = "/api/v1/electrophysiology/datafile/ABC0000002/"
+        store = CacheStore(self.location)
+        array = numpy.arange(100.0)
+
+        # the checksum is recorded on write, computed for other files and discarded on replace
+        store.set_array(array, data_loc)
+        self.assertEqual(store.file_info(data_loc)["array_checksum"], helper.array_checksum(array))
+        self.assertEqual(store.file_info(data_loc)["checksum"], helper.array_checksum(array))
+        self.assertTrue(store.verify_file(data_loc))
+        hdfio.store_array_data(store.file_path(data_loc), array + 1)
+        store.add_file(data_loc)
+        self.assertIsNone(store.file_info(data_loc)["array_checksum"])
+        self.assertEqual(store.array_checksum(data_loc), helper.array_checksum(array + 1))
+        self.assertEqual(store.file_info(data_loc)["array_checksum"], helper.array_checksum(array + 1))
+        self.assertIsNone(store.array_checksum("/api/v1/electrophysiology/datafile/ABC0000003/"))
+
+        signal = Model.create(Model.ANALOGSIGNAL)
+        signal.location = loc
+        signal.signal = {"units": "mV", "data": data_loc}
+        signal.sampling_rate = {"units": "Hz", "data": 1000.0}
+        signal.t_start = {"units": "s", "data": 0.0}
+        store.set(signal)
+
+        self.assertEqual(store.unchanged_array(loc, "signal", array + 1), data_loc)
+        self.assertIsNone(store.unchanged_array(loc, "signal", array))
+        self.assertIsNone(store.unchanged_array(loc, "signal", (array + 1).astype("float32")))
+        self.assertIsNone(store.unchanged_array(TestCache.LOCATION % "ABC0000004", "signal", array))
+
+        # damaged files written from arrays are detected by the checksum of the array
+        damaged_loc = "/api/v1/electrophysiology/datafile/ABC0000005/"
+        store.set_array(array, damaged_loc)
+        size = os.path.getsize(store.file_path(damaged_loc))
+        with open(store.file_path(damaged_loc), "wb") as f:
+            f.write(b"x" * size)
+        self.assertFalse(store.verify_file(damaged_loc))
+
+        # only arrays of numbers and byte strings have a checksum
+        self.assertIsNone(helper.array_checksum(numpy.array([{"a": 1}, None])))
+        self.assertIsNone(store.unchanged_array(loc, "signal", numpy.array([{"a": 1}, None])))
+        self.assertIsNotNone(helper.array_checksum(numpy.array([b"abc", b"de"])))
+
+        # the driver writes only changed arrays to temporary files
+        driver = NativeDriver(store)
+        native = driver.to_result(signal)
+        self.assertEqual(driver.to_model(native).signal["data"], data_loc)
+        native[0] = 42 * native.units
+        temp_loc = driver.to_model(native).signal["data"]
+        self.assertNotEqual(temp_loc, data_loc)
+        self.assertTrue(store.has_file(temp_loc, temporary=True))
+        store.disconnect()
+
+    def test_shared_manifest(self):
+        db_path = os.path.join(self.location, "files.db")
+        manifest = FileManifest(db_path)
+        other = FileManifest(db_path)
+
+        # the totals include the changes of other processes
+        manifest.add_many([("ABC%07d" % i, 100, None, None) for i in range(5)], False)
+        other.add("ABC0000000", False, 50)
+        other.add("ABC0000009", True, 10)
+        self.assertEqual((manifest.count(), manifest.total_size()), (5, 450))
+        self.assertEqual((manifest.count(True), manifest.total_size(True)), (1, 10))
+        self.assertEqual(other.remove_many(["ABC0000001", "ABC0000001", "ABC0000008"], False), 1)
+        self.assertEqual((manifest.count(), manifest.total_size()), (4, 350))
+        other.clear(temporary=True)
+        self.assertEqual((manifest.count(True), manifest.total_size(True)), (0, 0))
+        manifest.close()
+        other.close()
+
+        # the totals of manifests written before the totals were kept are counted once
+        conn = sqlite3.connect(db_path)
+        conn.executescript("DROP TRIGGER files_added; DROP TRIGGER files_removed; DROP TRIGGER files_changed; "
+                           "DROP TABLE files_totals; DELETE FROM files WHERE ident = 'ABC0000002';")
+        conn.close()
+        manifest = FileManifest(db_path)
+        self.assertEqual((manifest.count(), manifest.total_size()), (3, 250))
+        self.assertEqual((manifest.count(True), manifest.total_size(True)), (0, 0))
+        manifest.close()
+
+    def test_memory_map(self):
+        store = CacheStore(self.location)
+        times_loc = "/api/v1/electrophysiology/datafile/ABC0000001/"
+        waveforms_loc = "/api/v1/electrophysiology/datafile/ABC0000002/"
+        store.set_array(numpy.arange(10.0), times_loc)
+        store.set_array(numpy.ones((10, 1, 20)), waveforms_loc)
+
+        train = Model.create(Model.SPIKETRAIN)
+        train.location = "/api/v1/electrophysiology/spiketrain/ABC0000003/"
+        train.times = {"units": "s", "data": times_loc}
+        train.waveforms = {"units": "mV", "data": waveforms_loc}
+        train.t_start = {"units": "s", "data": 0.0}
+        train.t_stop = {"units": "s", "data": 10.0}
+
+        # mapped arrays are not copied into memory, thus they stay read-only
+        native = NativeDriver(store, memory_map=True).to_result(train)
+        self.assertFalse(native.waveforms.flags.writeable)
+        numpy.testing.assert_array_equal(native.waveforms.magnitude, numpy.ones((10, 1, 20)))
+        native = NativeDriver(store).to_result(train)
+        self.assertTrue(native.waveforms.flags.writeable)
+        store.disconnect()
+
+    def test_lazy_children(self):
+        store = CacheStore(self.location)
+        segment_loc = "/api/v1/electrophysiology/segment/ABC%07d/"
+
+        block = Model.create(Model.BLOCK)
+        block.location = TestCache.LOCATION % "ABC0000001"
+        block.segments = [segment_loc % 2, segment_loc % 3]
+        store.set(block)
+        segment = Model.create(Model.SEGMENT)
+        segment.location = segment_loc % 2
+        segment.name = "cached"
+        store.set(segment)
+
+        # children, that are not found (e.g. deleted on the server), are missing in the list
+        native = NativeDriver(store).to_result(block)
+        self.assertEqual([child.name for child in native.segments], ["cached"])
+
+        # prefetching is finished before the store is closed and ignores later lists
+        policy = PrefetchPolicy(store)
+        native = NativeDriver(store, prefetch=policy).to_result(block)
+        self.assertEqual(len(native.segments), 1)
+        policy.shutdown()
+        policy.list_loaded([segment])
+        self.assertEqual(policy.errors, 0)
+
+        # failed background loads are counted
+        started = threading.Event()
+
+        def get_list(*args, **kwargs):
+            started.set()
+            fail()
+
+        policy = PrefetchPolicy(store)
+        with inject(store, "get_list", get_list):
+            policy.list_loaded([segment, block])
+            self.assertTrue(started.wait(5))
+            policy.shutdown()
+        self.assertEqual(policy.errors, 1)
+        self.assertIsInstance(policy.error, OSError)
+        store.disconnect()
+
+    def test_eviction(self):
+        loc = "/api/v1/electrophysiology/datafile/ABC%07d/"
+        cache = Cache.create(Cache.SQLITE, self.location, "cache", file_entries=10, object_bytes=None)
+
+        for i in range(10):
+            cache.set_file(loc % i, b"x" * 100)
+        cache.pin(loc % 0)
+        cache.get_file(loc % 1)
+
+        cache.set_file(loc % 10, b"x" * 100)
+        self.assertEqual(cache.stats["files"]["entries"], 9)
+        self.assertEqual(cache.stats["files"]["evictions"], 2)
+        self.assertTrue(cache.has_file(loc % 0))
+        self.assertTrue(cache.has_file(loc % 1))
+        self.assertFalse(cache.has_file(loc % 2))
+        self.assertFalse(os.path.exists(cache.file_cache_path("ABC0000002", False)))
+
+        # temporary files are never evicted
+        for i in range(20):
+            cache.set_file(loc % (100 + i), b"x", temporary=True)
+        self.assertEqual(cache.manifest.count(temporary=True), 20)
+        cache.close()
+
+        obj_loc = TestCache.LOCATION
+        cache = Cache.create(Cache.PICKLE, self.location, "pickle", object_entries=5, policy=Cache.LFU)
+        for i in range(5):
+            cache.set(obj_loc % ("ABC%07d" % i), {"index": i})
+        cache.get_many([obj_loc % ("ABC%07d" % i) for i in range(1, 5)])
+
+        cache.set(obj_loc % "ABC0000005", {"index": 5})
+        self.assertIsNone(cache.get(obj_loc % "ABC0000000"))
+        self.assertEqual(cache.get(obj_loc % "ABC0000005"), {"index": 5})
+        self.assertTrue(cache.stats["objects"]["entries"] <= 5)
+        cache.close()
+
+        self.assertRaises(ValueError, Cache.create, Cache.SQLITE, self.location, "cache", policy="foo")
+
+    def test_janitor(self):
+        cache = Cache.create(Cache.SQLITE, self.location, "cache")
+        stale = os.path.join(cache.file_dir, "ABC0000001.tmp_abc")
+        with open(stale, "wb") as f:
+            f.write(b"incomplete")
+        os.utime(stale, (0, 0))
+
+        janitor = Janitor(cache, interval=0.01)
+        janitor.start()
+        while janitor.runs == 0:
+            time.sleep(0.01)
+        janitor.stop()
+
+        self.assertIsNone(janitor.error)
+        self.assertFalse(os.path.exists(stale))
+        cache.close()
+
+    def test_download_manager(self):
+
+        class SlowStore(object):
+            def __init__(self):
+                self.downloads = 0
+                self.release = threading.Event()
+
+            def download_file(self, location, path):
+                self.downloads += 1
+                self.release.wait(5)
+                with open(path, "wb") as f:
+                    f.write(b"data")
+                return {"checksum": None, "etag": "foo"}
+
+        store = CacheStore(self.location)
+        rest_store = SlowStore()
+        downloads = DownloadManager(rest_store, store, max_workers=2)
+        loc = "/api/v1/electrophysiology/datafile/ABC0000001/"
+
+        self.assertFalse(store.has_file(loc))
+        future = downloads.submit(loc)
+        self.assertTrue(downloads.submit(loc) is future)
+        self.assertTrue(downloads.is_downloading(loc))
+
+        rest_store.release.set()
+        downloads.fetch(loc)
+        self.assertTrue(store.has_file(loc))
+        self.assertEqual(store.get_file(loc), b"data")
+        self.assertEqual(store.file_info(loc)["etag"], "foo")
+        self.assertIsNone(downloads.submit(loc))
+        self.assertEqual(rest_store.downloads, 1)
+
+        downloads.shutdown()
+        store.disconnect()
+
+
+@contextlib.contextmanager
+def inject(obj, name, replacement):
+    """
+    Replace (or add) an attribute of a module or object while the context is active.
+    """
+    missing = object()
+    original = getattr(obj, name, missing)
+    setattr(obj, name, replacement)
+    try:
+        yield
+    finally:
+        if original is missing:
+            delattr(obj, name)
+        else:
+            setattr(obj, name, original)
+
+
+def fail(*args, **kwargs):
+    raise OSError(errno.ENOSPC, "injected fault")
+
+
+class TestCacheFaults(unittest.TestCase):
+    """
+    Fault injection tests for the cache: a failed or interrupted write must leave the previous
+    content of a file intact and reads must not modify the cache.
+    """
+
+    LOCATION = "/api/v1/electrophysiology/datafile/%s/"
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.cache = Cache.create(Cache.PICKLE, self.location, "cache")
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.location)
+
+    def listing(self):
+        return sorted((d, sorted(f_names)) for d, _, f_names in os.walk(self.cache.base_dir))
+
+    def check_write_fault(self, obj, name, replacement):
+        loc = TestCacheFaults.LOCATION % "ABC0000001"
+        obj_loc = TestCache.LOCATION % "ABC0000001"
+        self.cache.set_file(loc, b"old data")
+        self.cache.set(obj_loc, {"name": "old"})
+        before = self.listing()
+
+        with inject(obj, name, replacement):
+            self.assertRaises(EnvironmentError, self.cache.set_file, loc, b"new data")
+            self.assertRaises(EnvironmentError, self.cache.set, obj_loc, {"name": "new"})
+
+        self.assertEqual(self.cache.get_file(loc), b"old data")
+        self.assertEqual(self.cache.get(obj_loc), {"name": "old"})
+        self.assertEqual(self.listing(), before)
+
+    def test_fault_on_write(self):
+        real_open = open
+
+        # the disk runs full after a part of the data was written
+        def faulty_open(path, mode="r"):
+            f = real_open(path, mode)
+            if "w" in mode:
+                f.write(b"partial")
+                f.close()
+                raise IOError(errno.ENOSPC, "injected fault")
+            return f
+
+        self.check_write_fault(cache_module, "open", faulty_open)
+
+    def test_fault_on_sync(self):
+        self.check_write_fault(os, "fsync", fail)
+
+    def test_fault_on_replace(self):
+        self.check_write_fault(helper, "replace_file", fail)
+
+    def test_fault_on_serialize(self):
+        obj_loc = TestCache.LOCATION % "ABC0000001"
+        self.cache.set(obj_loc, {"name": "old"})
+        before = self.listing()
+
+        self.assertRaises(Exception, self.cache.set, TestCache.LOCATION % "ABC0000002", {"lock": threading.Lock()})
+
+        self.assertEqual(self.cache.get(obj_loc), {"name": "old"})
+        self.assertEqual(self.listing(), before)
+
+    def test_crash_during_write(self):
+        loc = TestCacheFaults.LOCATION % "ABC0000001"
+        self.cache.set_file(loc, b"old data")
+
+        # a process killed while writing leaves an incomplete temporary file behind
+        leftover = self.cache.file_cache_path("ABC0000001", False) + ".tmp_crashed"
+        with open(leftover, "wb") as f:
+            f.write(b"new da")
+        os.utime(leftover, (0, 0))
+
+        self.assertEqual(self.cache.get_file(loc), b"old data")
+        self.assertEqual(self.cache.scan_files(), 0)
+        self.assertEqual(self.cache.manifest.count(), 1)
+
+        self.cache.compact()
+        self.assertFalse(os.path.exists(leftover))
+        self.assertEqual(self.cache.get_file(loc), b"old data")
+
+    def test_truncated_shard(self):
+        # shard files written by older versions could be truncated by a crash
+        obj_loc = TestCache.LOCATION % "ABC0000001"
+        open(self.cache.obj_cache_path("ABC0000001", False), "wb").close()
+
+        self.assertIsNone(self.cache.get(obj_loc))
+        self.cache.set(obj_loc, {"name": "new"})
+        self.assertEqual(self.cache.get(obj_loc), {"name": "new"})
+
+    def test_read_without_copy(self):
+        loc = TestCacheFaults.LOCATION % "ABC0000001"
+        obj_loc = TestCache.LOCATION % "ABC0000001"
+        self.cache.set_file(loc, b"data")
+        self.cache.set(obj_loc, {"name": "foo"})
+        before = self.listing()
+        mtime = os.path.getmtime(self.cache.file_cache_path("ABC0000001", False))
+
+        with inject(shutil, "copy2", fail):
+            with inject(helper, "replace_file", fail):
+                self.assertEqual(self.cache.get_file(loc), b"data")
+                self.assertEqual(self.cache.get(obj_loc), {"name": "foo"})
+                self.assertEqual(self.cache.get_many([obj_loc]), {obj_loc: {"name": "foo"}})
+
+        self.assertEqual(self.listing(), before)
+        self.assertEqual(os.path.getmtime(self.cache.file_cache_path("ABC0000001", False)), mtime)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(TestCache))
+    suite.addTests(unittest.makeSuite(TestCacheFaults))
+    unittest.TextTestRunner(verbosity=2).run(suite)
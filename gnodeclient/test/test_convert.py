@@ -0,0 +1,89 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+import json
+import unittest
+
+import gnodeclient.store.convert as convert
+from gnodeclient.model.models import Model
+
+
+class TestConvert(unittest.TestCase):
+    """
+    Unit tests for the conversion of REST API responses.
+    """
+
+    def setUp(self):
+        self.objects = [{
+            "resource_uri": "/api/v1/electrophysiology/event/%d/" % i,
+            "location": "/api/v1/electrophysiology/event/%d/" % i,
+            "label": u"\u00e9vent [%d]" % i,
+            "time": i * 0.5,
+            "time__unit": "s",
+            "guid": None
+        } for i in range(50)]
+
+    def check_iter(self, text):
+        expected = convert.json_to_collections(text, as_list=True)
+
+        for size in (1, 3, 64, len(text)):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(list(convert.iter_json_to_collections(chunks)), expected)
+
+    def test_iter_json(self):
+        responses = [
+            {"selected": self.objects, "selected_range": [0, 49]},
+            {"selected_range": [0, 49], "selected": self.objects},
+            {"selected": []},
+            {"selected": None},
+            {"selected": self.objects[0]},
+            self.objects,
+            self.objects[0]
+        ]
+
+        for response in responses:
+            self.check_iter(json.dumps(response).encode("utf-8"))
+            self.check_iter(json.dumps(response, indent=2).encode("utf-8"))
+
+    def test_iter_json_invalid(self):
+        for text in (b'{"selected": [{"a": 1}', b'{"selected" [1]}', b'selected'):
+            self.assertRaises(ValueError, list, convert.iter_json_to_collections(text))
+
+    def test_iter_models(self):
+        text = json.dumps({"selected": self.objects})
+        models = list(convert.iter_json_to_models([text[:100], text[100:]]))
+
+        self.assertEqual([m.location for m in models], [o["location"] for o in self.objects])
+        self.assertEqual(models[7].time, {"data": 3.5, "units": "s"})
+
+    def test_roundtrip(self):
+        for model_name in Model._MODEL_MAP:
+            model = Model.create(model_name)
+            model.location = Model.get_location(model_name) + "ABC123/"
+            model.resource_uri = model.location
+
+            for field_name, field in model.fields.items():
+                if field.type_info == "data":
+                    model[field_name] = {"data": 1.5, "units": "ms"}
+                elif field.type_info == "datafile":
+                    units = None if field_name == "labels" else "mV"
+                    model[field_name] = {"data": "/api/v1/electrophysiology/datafile/F1/", "units": units}
+                elif field.is_child:
+                    model[field_name] = ["/api/v1/metadata/section/S1/"]
+                elif field.is_parent:
+                    model[field_name] = "/api/v1/metadata/section/S2/"
+
+            result = convert.collections_to_model(convert.model_to_collections(model))
+            for field_name in model:
+                self.assertEqual(result[field_name], model[field_name], "%s.%s" % (model_name, field_name))
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestConvert)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -10,10 +10,12 @@
 import os
 import unittest
 import numpy as np
+import h5py
 import appdirs
 from gnodeclient.conf import Configuration
+from gnodeclient.model.models import Model
 
-from gnodeclient.util.hdfio import store_array_data, read_array_data
+from gnodeclient.util.hdfio import store_array_data, read_array_data, read_array_slice, ArrayFormat, chunk_shape
 
 
 class TestHDFIO(unittest.TestCase):
@@ -37,6 +39,66 @@ class TestHDFIO(unittest.TestCase):
         store_array_data(testpath, testarray)
         self.assertTrue((read_array_data(testpath) == testarray).all())
 
+    def test_hdf5_mmap(self):
+        basepath = appdirs.user_cache_dir(appname=Configuration.NAME, appauthor=Configuration.ATHOR)
+        testpath = os.path.join(basepath, 'bla.hdf5')
+
+        if not os.path.isdir(basepath):
+            os.makedirs(basepath, 0o0750)
+
+        testarray = np.arange(200.0).reshape((100, 2))
+        store_array_data(testpath, testarray)
+
+        data = read_array_data(testpath, mmap=True)
+        self.assertTrue(isinstance(data, np.memmap))
+        self.assertTrue((data == testarray).all())
+
+    def test_hdf5_slice(self):
+        basepath = appdirs.user_cache_dir(appname=Configuration.NAME, appauthor=Configuration.ATHOR)
+        testpath = os.path.join(basepath, 'bla.hdf5')
+
+        if not os.path.isdir(basepath):
+            os.makedirs(basepath, 0o0750)
+
+        testarray = np.arange(200.0).reshape((100, 2))
+        store_array_data(testpath, testarray)
+
+        self.assertTrue((read_array_slice(testpath, 10, 20) == testarray[10:20]).all())
+        self.assertTrue((read_array_slice(testpath, stop=5) == testarray[:5]).all())
+
+    def test_hdf5_compression(self):
+        basepath = appdirs.user_cache_dir(appname=Configuration.NAME, appauthor=Configuration.ATHOR)
+        testpath = os.path.join(basepath, 'bla.hdf5')
+
+        if not os.path.isdir(basepath):
+            os.makedirs(basepath, 0o0750)
+
+        testarray = np.arange(40000.0).reshape((10000, 4))
+        array_format = ArrayFormat(compression="gzip", shuffle=True, chunk_bytes=8000)
+        store_array_data(testpath, testarray, array_format, Model.ANALOGSIGNALARRAY)
+
+        with h5py.File(testpath, 'r') as f:
+            self.assertEqual(f['arraydata'].compression, 'gzip')
+            self.assertEqual(f['arraydata'].chunks, (250, 4))
+
+        data = read_array_data(testpath, mmap=True)
+        self.assertFalse(isinstance(data, np.memmap))
+        self.assertTrue((data == testarray).all())
+        self.assertTrue((read_array_slice(testpath, 1000, 1010) == testarray[1000:1010]).all())
+
+        # small arrays are stored contiguously
+        store_array_data(testpath, testarray[:10], array_format)
+        self.assertTrue(isinstance(read_array_data(testpath, mmap=True), np.memmap))
+
+        array_format = ArrayFormat(compression="lzf", layouts={Model.ANALOGSIGNALARRAY: ArrayFormat.CHANNEL_MAJOR})
+        self.assertEqual(array_format.dataset_options(testarray, Model.ANALOGSIGNALARRAY),
+                         {"chunks": (8192, 1), "compression": "lzf"})
+        self.assertEqual(chunk_shape((10, 3, 5), 8, 1000), (8, 3, 5))
+        self.assertEqual(chunk_shape((10,), 8, 8000), (10,))
+
+        self.assertRaises(ValueError, ArrayFormat, compression="zip")
+        self.assertRaises(ValueError, ArrayFormat, layouts={Model.SPIKE: "space"})
+
 if __name__ == "__main__":
     suite = unittest.TestSuite()
     suite.addTests(unittest.makeSuite(TestHDFIO))
@@ -0,0 +1,71 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+from __future__ import print_function, absolute_import, division
+
+import io
+import unittest
+
+from gnodeclient.util.multipart import MultipartStream
+
+
+class TestMultipart(unittest.TestCase):
+    """
+    Unit tests for streamed multipart/form-data bodies.
+    """
+
+    def expected_body(self, stream, data):
+        boundary = stream.content_type.split("boundary=")[1]
+        return (b'--' + boundary.encode("ascii") + b'\r\n'
+                b'Content-Disposition: form-data; name="raw_file"; filename="data.h5"\r\n'
+                b'Content-Type: application/octet-stream\r\n\r\n' +
+                data +
+                b'\r\n--' + boundary.encode("ascii") + b'--\r\n')
+
+    def test_file_source(self):
+        data = b"0123456789" * 1000
+        source = io.BytesIO(b"skipped" + data)
+        source.read(7)
+
+        stream = MultipartStream("raw_file", source, "data.h5")
+        self.assertTrue(stream.content_type.startswith("multipart/form-data; boundary="))
+
+        # only the remaining data of the file is sent
+        expected = self.expected_body(stream, data)
+        self.assertEqual(stream.size, len(expected))
+        self.assertEqual(len(stream), len(expected))
+
+        body = stream.read(100) + stream.read(5000) + stream.read()
+        self.assertEqual(body, expected)
+        self.assertEqual(stream.tell(), len(expected))
+        self.assertEqual(stream.read(), b"")
+
+    def test_iterable_source(self):
+        chunks = [b"abc", b"", b"defgh", b"i"]
+        stream = MultipartStream("raw_file", iter(chunks), "data.h5")
+
+        # bodies of iterables are sent with chunked transfer encoding
+        self.assertIsNone(stream.size)
+        self.assertRaises(TypeError, len, stream)
+
+        body = b"".join(stream)
+        self.assertEqual(body, self.expected_body(stream, b"".join(chunks)))
+
+    def test_chunks(self):
+        data = b"x" * (MultipartStream.CHUNK_SIZE + 10)
+        stream = MultipartStream("raw_file", io.BytesIO(data), "data.h5")
+
+        parts = list(stream)
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(len(parts[0]), MultipartStream.CHUNK_SIZE)
+        self.assertEqual(b"".join(parts), self.expected_body(stream, data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -106,6 +106,17 @@ class TestRestAPI(unittest.TestCase):
             msg = "Result has wrong type (%s)!" % type(elem)
             self.assertTrue(isinstance(elem, type(data)), msg)
 
+    def test_iter_select(self):
+        for model_name in self.remote_assets.keys():
+            results = self.get_remote_objs(model_name)
+            filters = {
+                'id__in': ",".join([id_from_location(x.location) for x in self.remote_assets[model_name]])
+            }
+            iterated = list(self.session.iter_select(model_name, filters, page_size=1))
+
+            msg = "iter_select('%s') and select('%s') differ!" % (model_name, model_name)
+            self.assertEqual(sorted(x.location for x in iterated), sorted(x.location for x in results), msg)
+
     def test_get_by_id(self):
         for model_name, objects in self.remote_assets.items():
 
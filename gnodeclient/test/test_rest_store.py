@@ -0,0 +1,284 @@
+# Python G-Node Client
+#
+# Copyright (C) 2013  A. Stoewer
+#                     A. Sobolev
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License (see LICENSE.txt).
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import shutil
+import tempfile
+import json
+import threading
+import time
+import unittest
+
+import numpy
+from requests_futures.sessions import FuturesSession
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    import urlparse
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    import urllib.parse as urlparse
+
+from gnodeclient.model.models import Model
+from gnodeclient.result.result_driver import NativeDriver
+from gnodeclient.store.caching_rest_store import CachingRestStore
+from gnodeclient.store.rest_store import RestStore, RemoteFile
+from gnodeclient.util.hdfio import store_array_data
+from gnodeclient.util.proxy import lazy_list_loader
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answers requests like the G-Node REST API: authentication, paginated selects of events,
+    files with range requests, the creation of entities and uploads of files.
+    """
+
+    def do_POST(self):
+        self.server.requests.append(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/" + RestStore.URL_LOGIN:
+            self.respond(200, b"", {"Set-Cookie": "sessionid=standin; Path=/"})
+        elif self.path in self.server.created:
+            obj = json.loads(body.decode("utf-8"))
+            obj.update(self.server.created[self.path])
+            self.respond(201, json.dumps(obj).encode("utf-8"))
+        elif "/datafile/" in self.path:
+            self.server.uploads[self.path] = body
+            self.respond(200, b"")
+        else:
+            self.respond(404, b"")
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        url = urlparse.urlparse(self.path)
+        if self.path == "/" + RestStore.URL_LOGOUT:
+            self.respond(200, b"")
+        elif url.path == Model.get_location(Model.EVENT):
+            self.respond_events(dict(urlparse.parse_qsl(url.query)))
+        elif self.path in self.server.files:
+            self.respond_file(self.server.files[self.path])
+        else:
+            self.respond(404, b"")
+
+    def respond_events(self, params):
+        offset = 0 if self.server.ignore_offset else int(params.get(RestStore.FILTER_OFFSET, 0))
+        max_results = int(params.get(RestStore.FILTER_MAX_RESULTS, self.server.events))
+        if offset > 0:
+            time.sleep(self.server.delay)
+
+        selected = [{"resource_uri": "%sEVT%07d/" % (Model.get_location(Model.EVENT), i), "label": "event %d" % i}
+                    for i in range(offset, min(offset + max_results, self.server.events))]
+        self.respond(200, json.dumps({"selected": selected}).encode("utf-8"))
+
+    def respond_file(self, data):
+        header = self.headers.get("Range")
+        if header is None:
+            self.respond(200, data)
+        else:
+            first, last = [int(byte) for byte in header.split("=")[1].split("-")]
+            last = min(last, len(data) - 1)
+            self.respond(206, data[first:last + 1],
+                         {"Content-Range": "bytes %d-%d/%d" % (first, last, len(data))})
+
+    def respond(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    A local HTTP server, that stands in for the G-Node REST API.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StandInHandler)
+        self.files = {}
+        self.uploads = {}
+        self.created = {}
+        self.events = 0
+        self.ignore_offset = False
+        self.delay = 0
+        self.requests = []
+
+    @property
+    def location(self):
+        return "http://127.0.0.1:%d/" % self.server_address[1]
+
+    def offsets(self):
+        """
+        The offsets of all requested pages.
+        """
+        return sorted(int(dict(urlparse.parse_qsl(urlparse.urlparse(path).query))[RestStore.FILTER_OFFSET])
+                      for path in self.requests if RestStore.FILTER_OFFSET in path)
+
+
+class TestRestStore(unittest.TestCase):
+    """
+    Unit tests for the REST store, that use a local stand-in for the G-Node server.
+    """
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        # a single worker, thus prefetched requests wait in the queue of the session
+        self.store = RestStore(self.server.location, "bob", "pass", "api", "v1", max_workers=1)
+        self.store.connect()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.store.disconnect()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def add_array(self, path, array):
+        f_name = os.path.join(self.tmp, "array.h5")
+        store_array_data(f_name, array)
+        with open(f_name, "rb") as f:
+            self.server.files[path] = f.read()
+
+    def test_select_pages(self):
+        # a full last page is followed by an empty one
+        self.server.events = 20
+        pages = list(self.store.select_pages(Model.EVENT, page_size=10, prefetch=0))
+        self.assertEqual([len(page) for page in pages], [10, 10])
+        self.assertEqual(self.server.offsets(), [0, 10, 20])
+
+        self.server.events = 25
+        self.server.requests = []
+        pages = list(self.store.select_pages(Model.EVENT, page_size=10, prefetch=2))
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([event.label for page in pages for event in page], ["event %d" % i for i in range(25)])
+        # prefetched requests after the last page are cancelled or answered with empty pages
+        self.assertEqual(self.server.offsets()[:3], [0, 10, 20])
+        self.assertTrue(max(self.server.offsets()) <= 40)
+
+    def test_select_pages_ignored_offset(self):
+        # a server, that ignores the offset, returns the first page again: the generator ends
+        self.server.events = 25
+        self.server.ignore_offset = True
+        pages = list(self.store.select_pages(Model.EVENT, page_size=10, prefetch=2))
+        self.assertEqual([[event.label for event in page] for page in pages], [["event %d" % i for i in range(10)]])
+
+    def test_select_pages_cancel(self):
+        self.server.events = 5
+        self.server.delay = 0.2
+
+        # the first page is the last one: prefetched requests, that did not start, are cancelled
+        pages = list(self.store.select_pages(Model.EVENT, page_size=10, prefetch=3))
+        self.assertEqual([len(page) for page in pages], [5])
+        time.sleep(0.5)
+        self.assertTrue(set(self.server.offsets()) <= set([0, 10]))
+
+        # the consumer stops early
+        self.server.events = 100
+        self.server.requests = []
+        pages = self.store.select_pages(Model.EVENT, page_size=10, prefetch=3)
+        self.assertEqual(len(next(pages)), 10)
+        pages.close()
+        time.sleep(0.5)
+        self.assertTrue(set(self.server.offsets()) <= set([0, 10]))
+
+    def test_remote_file(self):
+        data = os.urandom(RemoteFile.BLOCK_SIZE * (RemoteFile.MAX_BLOCKS + 8) + 100)
+        self.server.files["/datafile/ABC0000001/"] = data
+        remote_file = RemoteFile.open(FuturesSession(), self.server.location + "datafile/ABC0000001/")
+        self.assertEqual(remote_file.size, len(data))
+
+        # windows larger and smaller than a block, each block is requested only once
+        window = RemoteFile.BLOCK_SIZE * 3 // 2
+        read = b"".join(remote_file.read(window) for _ in range(0, len(data), window))
+        self.assertEqual(read, data)
+        self.assertEqual(len(self.server.requests) - 1, RemoteFile.MAX_BLOCKS + 9)
+
+        # only the latest blocks are kept in memory
+        remote_file.seek(0)
+        self.assertEqual(remote_file.read(10), data[:10])
+        self.assertEqual(len(self.server.requests) - 1, RemoteFile.MAX_BLOCKS + 10)
+        remote_file.seek(-10, 2)
+        self.assertEqual(remote_file.read(), data[-10:])
+        self.assertEqual(len(self.server.requests) - 1, RemoteFile.MAX_BLOCKS + 10)
+
+        # reads, that span more blocks than are kept in memory
+        remote_file.seek(5)
+        self.assertEqual(remote_file.read(), data[5:])
+        remote_file.close()
+
+    def test_get_array_slice(self):
+        array = numpy.arange(200000.0).reshape(-1, 2)
+        self.add_array("/datafile/ABC0000002/", array)
+
+        numpy.testing.assert_array_equal(self.store.get_array_slice("/datafile/ABC0000002/", 1000, 1010),
+                                         array[1000:1010])
+        # only a few blocks of the file are transferred (after the login)
+        self.assertTrue(len(self.server.requests) < 10)
+
+    def test_deleted_children(self):
+        store = CachingRestStore(self.server.location, "bob", "pass", os.path.join(self.tmp, "cache"), max_workers=1)
+        store.connect()
+
+        locations = [Model.get_location(Model.SEGMENT) + "SEG%07d/" % i for i in range(3)]
+        for i in (0, 2):
+            self.server.files[locations[i]] = json.dumps({"resource_uri": locations[i], "location": locations[i],
+                                                          "name": "segment %d" % i}).encode("utf-8")
+
+        # objects, that were deleted on the server, are None and missing in lazy loaded lists
+        self.assertEqual([obj.name if obj is not None else None for obj in store.get_list(locations)],
+                         ["segment 0", None, "segment 2"])
+        store.cache_store.clear_cache()
+        children = lazy_list_loader(locations, store, NativeDriver(store), list)()
+        self.assertEqual([child.name for child in children], ["segment 0", "segment 2"])
+        store.disconnect()
+
+    def test_set_array(self):
+        store = CachingRestStore(self.server.location, "bob", "pass", os.path.join(self.tmp, "cache"), max_workers=1)
+        store.connect()
+
+        array = numpy.arange(1000.0)
+        temp_loc = store.set_array(array, temporary=True)
+        with open(store.cache_store.file_path(temp_loc, temporary=True), "rb") as f:
+            content = f.read()
+
+        signal = Model.create(Model.ANALOGSIGNAL)
+        signal.signal = {"units": "mV", "data": temp_loc}
+        signal.sampling_rate = {"units": "Hz", "data": 1000.0}
+        signal.t_start = {"units": "s", "data": 0.0}
+        data_loc = "/api/v1/electrophysiology/datafile/DAT0000001/"
+        sig_loc = Model.get_location(Model.ANALOGSIGNAL) + "SIG0000001/"
+        self.server.created[Model.get_location(Model.ANALOGSIGNAL)] = {"resource_uri": sig_loc, "location": sig_loc,
+                                                                      "signal": data_loc}
+
+        store.set(signal)
+
+        # the cached temporary file is uploaded and becomes the cached file of the new location
+        self.assertTrue(content in self.server.uploads[data_loc])
+        self.assertFalse(store.cache_store.has_file(temp_loc, temporary=True))
+        numpy.testing.assert_array_equal(store.cache_store.get_array(data_loc), array)
+        store.disconnect()
+
+
+if __name__ == "__main__":
+    unittest.main()
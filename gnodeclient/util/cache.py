@@ -1,7 +1,11 @@
 from __future__ import print_function, absolute_import, division
 
+import hashlib
 import os
 import shutil
+import sqlite3
+import threading
+import time
 import appdirs
 
 try:
@@ -16,20 +20,83 @@ except ImportError:
     # python > 3.1 has not module urlparse
     import urllib.parse as urlparse
 
+import gnodeclient.util.hdfio as hdfio
 import gnodeclient.util.helper as helper
+import gnodeclient.util.manifest as manifest
+from gnodeclient.util.manifest import FileManifest
+from gnodeclient.util.pack import ArrayPack
 
 
 class Cache(object):
     """
     A file system based cache that uses pickle to store python objects and file data.
+    Objects are stored in shard files named by the first two characters of their identifier.
+    Files are distributed over nested directories named by the leading characters of the hash
+    of their identifier (e.g. files/3f/a2/ABC0000001), thus looking up a file does not get slower
+    as the cache grows. Files of caches with a flat layout are moved when the cache is opened.
+    Optionally small HDF5 files are packed into a few container files (see ArrayPack).
+
+    The content of cached files is stored only once: the manifest refers from each location to the
+    checksum of its content and a file with the same content as a cached file is replaced by a hard
+    link to it. The content is removed when the last of its references is deleted. Limits apply to the
+    size of all references. On filesystems without hard links the files are kept as they are.
+    All cached files are recorded in a manifest (see FileManifest), which answers questions about
+    their existence, size and checksum without reading them.
+
+    The number and size of cached objects and files can be limited separately. If a limit is
+    exceeded, objects or files are evicted according to the eviction policy (Cache.LRU or Cache.LFU)
+    until the cache is filled to EVICTION_RATIO of its limits. Pinned objects and files as well as
+    temporary ones (e.g. local changes) are never evicted.
     """
 
     FILE_DIR = 'files'
     FILE_DIR_TMP = 'files_tmp'
     OBJ_DIR = 'objects'
     OBJ_DIR_TMP = 'objects_tmp'
+    PACK_DIR = 'packs'
+    MANIFEST_FILE = 'files.db'
 
-    def __init__(self, location, base_dir):
+    PICKLE = "pickle"
+    SQLITE = "sqlite"
+
+    LRU = manifest.LRU
+    LFU = manifest.LFU
+
+    # The fraction of the limits to which the cache is filled after an eviction
+    EVICTION_RATIO = 0.9
+    # The age in seconds after which incomplete files are removed by compact()
+    STALE_FILE_AGE = 3600
+    # The number of nested directories of the file layout and the length of their names
+    SHARD_DEPTH = 2
+    SHARD_WIDTH = 2
+
+    _BACKEND_MAP = {}
+
+    @classmethod
+    def create(cls, backend, location, base_dir, **limits):
+        """
+        Creates a cache that uses the given backend for storing objects.
+
+        :param backend: The name of the backend e.g. Cache.PICKLE or Cache.SQLITE.
+        :type backend: str
+        :param location: The location of the base directory.
+        :type location: str
+        :param base_dir: The name of the base directory.
+        :type base_dir: str
+        :param limits: Limits and options passed to the constructor (e.g. file_bytes).
+        :type limits: dict
+
+        :returns: A new cache instance.
+        :rtype: Cache
+
+        :raises: ValueError if the backend is not known.
+        """
+        if backend not in cls._BACKEND_MAP:
+            raise ValueError("Unknown cache backend: %s" % backend)
+        return cls._BACKEND_MAP[backend](location, base_dir, **limits)
+
+    def __init__(self, location, base_dir, object_entries=None, object_bytes=None, file_entries=None,
+                 file_bytes=None, policy=LRU, pack_bytes=None):
         """
         Cache initialisation
 
@@ -37,16 +104,69 @@ class Cache(object):
         :type location: str
         :param base_dir: The name of the base directory.
         :type base_dir: str
+        :param object_entries: The maximum number of cached objects (None for no limit).
+        :type object_entries: int
+        :param object_bytes: The maximum size of all cached objects in bytes (None for no limit).
+        :type object_bytes: int
+        :param file_entries: The maximum number of cached files (None for no limit).
+        :type file_entries: int
+        :param file_bytes: The maximum size of all cached files in bytes (None for no limit).
+        :type file_bytes: int
+        :param policy: The eviction policy (Cache.LRU or Cache.LFU).
+        :type policy: str
+        :param pack_bytes: Files with array data up to this size in bytes are packed into container
+                           files (None to store all files separately). Temporary files are never packed.
+        :type pack_bytes: int
+
+        :raises: ValueError if the policy is not known.
         """
+        if policy not in (Cache.LRU, Cache.LFU):
+            raise ValueError("Unknown eviction policy: %s" % policy)
+
         self.__base_dir = os.path.join(location, base_dir)
 
         self.__file_dir = os.path.join(self.base_dir, Cache.FILE_DIR)
         self.__file_dir_tmp = os.path.join(self.base_dir, Cache.FILE_DIR_TMP)
         self.__obj_dir = os.path.join(self.base_dir, Cache.OBJ_DIR)
         self.__obj_dir_tmp = os.path.join(self.base_dir, Cache.OBJ_DIR_TMP)
+        self.__pack_dir = os.path.join(self.base_dir, Cache.PACK_DIR)
+
+        self.__limits = {"objects": (object_entries, object_bytes), "files": (file_entries, file_bytes)}
+        self.__track_objects = object_entries is not None or object_bytes is not None
+        self.__policy = policy
+        self.__pack_bytes = pack_bytes
+        self.__stats = {"objects": {"hits": 0, "misses": 0, "evictions": 0},
+                        "files": {"hits": 0, "misses": 0, "evictions": 0}}
+        self.__pinned = {}
+        self.__evict_lock = threading.RLock()
+        # shards are read, updated and written, thus concurrent updates (e.g. by prefetching threads)
+        # would lose each other's changes
+        self.__shard_lock = threading.RLock()
+        self.__dirs = set()
+        self.__last_sweep = 0
+        self.__removals = []
 
         self.ensure_dirs()
 
+        manifest_path = os.path.join(self.base_dir, Cache.MANIFEST_FILE)
+        self.__manifest = FileManifest(manifest_path)
+        self.__object_manifest = FileManifest(manifest_path, table="objects")
+        # packed arrays stay readable, if packing is turned off
+        self.__pack = ArrayPack(self.__pack_dir, manifest_path)
+
+        self._open()
+
+        # walking all files is expensive, thus it is only done for new manifests and migrated caches
+        migrated = self.__migrate_files()
+        if migrated > 0 or self.__manifest.count(False) + self.__manifest.count(True) == 0:
+            self.scan_files()
+
+        # objects are only recorded if they are limited, the manifest is rebuilt when limits are set again
+        if self.__track_objects:
+            self.scan_objects()
+        else:
+            self.__object_manifest.clear()
+
     #
     # Properties
     #
@@ -93,6 +213,64 @@ class Cache(object):
         """
         return self.__obj_dir_tmp
 
+    @property
+    def pack_dir(self):
+        """
+        The path to the directory where packed arrays are stored.
+        """
+        return self.__pack_dir
+
+    @property
+    def pack(self):
+        """
+        The pack of small arrays.
+        """
+        return self.__pack
+
+    @property
+    def manifest(self):
+        """
+        The manifest of all cached files.
+        """
+        return self.__manifest
+
+    @property
+    def object_manifest(self):
+        """
+        The manifest of all cached objects (only size and access are recorded). Objects are only
+        recorded if their number or size is limited.
+        """
+        return self.__object_manifest
+
+    @property
+    def policy(self):
+        """
+        The eviction policy (Cache.LRU or Cache.LFU).
+        """
+        return self.__policy
+
+    @property
+    def stats(self):
+        """
+        Hit, miss and eviction counters as well as the number and size (in bytes) of all cached
+        objects and files. Temporary objects and files are not included. The number and size
+        of objects is None, if objects are not limited.
+
+        :returns: A dict with the keys 'objects' and 'files' each containing a dict with the keys
+                  'hits', 'misses', 'evictions', 'entries' and 'bytes'. The files additionally
+                  contain the number of packed files as 'packed'.
+        :rtype: dict
+        """
+        stats = {}
+        for kind, entries in (("objects", self.__object_manifest), ("files", self.__manifest)):
+            stats[kind] = dict(self.__stats[kind])
+            stats[kind]["entries"] = entries.count()
+            stats[kind]["bytes"] = entries.total_size()
+        if not self.__track_objects:
+            stats["objects"]["entries"] = stats["objects"]["bytes"] = None
+        stats["files"]["packed"] = self.__pack.count()
+        return stats
+
     #
     # Methods
     #
@@ -115,9 +293,11 @@ class Cache(object):
         ident = helper.id_from_location(location)
         f_name = self.obj_cache_path(ident, temporary)
 
-        all_data = self._secure_read(f_name, {})
-        all_data[ident] = data
-        self._secure_write(f_name, all_data)
+        with self.__shard_lock:
+            all_data = self._secure_read(f_name, {})
+            all_data[ident] = data
+            self._secure_write(f_name, all_data)
+        self._objects_written({ident: self.__object_size(data)}, temporary)
 
     def get(self, location, temporary=False):
         """
@@ -140,8 +320,61 @@ class Cache(object):
             if ident in all_data:
                 result = all_data[ident]
 
+        self._objects_read([ident] if result is not None else [], 1, temporary)
         return result
 
+    def set_many(self, mapping, temporary=False):
+        """
+        Caches several objects at once. Objects that are stored in the same shard are written
+        with a single read and write operation.
+
+        :param mapping: A dict that maps locations (or identifiers) to objects.
+        :type mapping: dict
+        """
+        groups = {}
+        for location, data in mapping.items():
+            ident = helper.id_from_location(location)
+            groups.setdefault(self.obj_cache_path(ident, temporary), {})[ident] = data
+
+        sizes = {}
+        for f_name, group in groups.items():
+            with self.__shard_lock:
+                all_data = self._secure_read(f_name, {})
+                all_data.update(group)
+                self._secure_write(f_name, all_data)
+            for ident, data in group.items():
+                sizes[ident] = self.__object_size(data)
+
+        self._objects_written(sizes, temporary)
+
+    def get_many(self, locations, temporary=False):
+        """
+        Get several objects from the cache at once. Each shard is only read once.
+
+        :param locations: A list of urls or paths that end with a unique identifier.
+        :type locations: list
+
+        :returns: A dict that maps each location that was found in the cache to its object.
+        :rtype: dict
+        """
+        results = {}
+        groups = {}
+        for location in locations:
+            ident = helper.id_from_location(location)
+            if len(ident) > 0:
+                groups.setdefault(self.obj_cache_path(ident, temporary), []).append((location, ident))
+
+        found = []
+        for f_name, group in groups.items():
+            all_data = self._secure_read(f_name, {})
+            for location, ident in group:
+                if ident in all_data:
+                    results[location] = all_data[ident]
+                    found.append(ident)
+
+        self._objects_read(found, len(locations), temporary)
+        return results
+
     def delete(self, location, temporary=False):
         """
         Delete an object form the cache.
@@ -153,16 +386,8 @@ class Cache(object):
         :rtype: bool
         """
         ident = helper.id_from_location(location)
-        f_name = self.obj_cache_path(ident, temporary)
-
-        all_data = self._secure_read(f_name, {})
-
-        if ident in all_data:
-            del all_data[ident]
-            self._secure_write(f_name, all_data)
-            return True
-        else:
-            return False
+        self.__object_manifest.remove(ident, temporary)
+        return self._delete_objects([ident], temporary) > 0
 
     def set_file(self, location, data, temporary=False):
         """
@@ -174,9 +399,164 @@ class Cache(object):
         :type data: str
         """
         ident = helper.id_from_location(location)
-        f_name = self.file_cache_path(ident, temporary)
+        f_name = self.file_cache_path(ident, temporary, create=True)
 
+        checksum = helper.checksum(data)
         self._secure_write(f_name, data, False)
+        self.__share_file(ident, temporary, f_name, checksum)
+        self.__manifest.add(ident, temporary, len(data), checksum)
+        self.__enforce_limits([ident])
+
+    def add_file(self, location, temporary=False, checksum=None, etag=None, array_checksum=None):
+        """
+        Add a file, that was written directly to its path in the cache (see file_cache_path), to the
+        manifest. If no checksum is given, it is computed from the file. If a file with the same content
+        is cached, the file is replaced by a link to it. Small HDF5 files are packed, if packing is enabled.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+        :param checksum: The checksum of the file (see helper.checksum). For files written from an array
+                         the checksum of the array can be used instead, if it is passed as array_checksum
+                         as well.
+        :type checksum: str
+        :param etag: The etag of the file as reported by the server.
+        :type etag: str
+        :param array_checksum: The checksum of the array data in the file (see set_array_checksum).
+        :type array_checksum: str
+        """
+        ident = helper.id_from_location(location)
+        f_name = self.file_cache_path(ident, temporary)
+        size = os.path.getsize(f_name)
+
+        if checksum is None:
+            checksum = helper.file_checksum(f_name)
+        self.__share_file(ident, temporary, f_name, checksum)
+        self.__manifest.add(ident, temporary, size, checksum, etag)
+        if array_checksum is not None:
+            self.__manifest.set_array_checksum(ident, temporary, array_checksum)
+        if not temporary and self.__pack_bytes is not None and size <= self.__pack_bytes:
+            self.__pack_file(ident, f_name, checksum)
+        self.__enforce_limits([ident])
+
+    def promote_file(self, location, new_location):
+        """
+        Turn a temporary file into a permanent file of another location, e.g. after it was uploaded.
+        The file is moved and its checksums are kept, thus the content is neither copied nor read.
+
+        :param location: The location of the temporary file.
+        :type location: str
+        :param new_location: The location of the permanent file.
+        :type new_location: str
+
+        :returns: True if the file was promoted, False if the temporary file is not cached.
+        :rtype: bool
+        """
+        ident = helper.id_from_location(location)
+        new_ident = helper.id_from_location(new_location)
+        f_name = self.file_cache_path(ident, True)
+        entry = self.__manifest.get(ident, True)
+
+        if not os.path.isfile(f_name):
+            return False
+        if entry is None:
+            entry = {"size": os.path.getsize(f_name), "checksum": helper.file_checksum(f_name), "etag": None,
+                     "array_checksum": None}
+
+        new_f_name = self.file_cache_path(new_ident, False, create=True)
+        helper.replace_file(f_name, new_f_name)
+        self.__manifest.remove(ident, True)
+        self.__manifest.add(new_ident, False, entry["size"], entry["checksum"], entry["etag"])
+        if entry["array_checksum"] is not None:
+            self.__manifest.set_array_checksum(new_ident, False, entry["array_checksum"])
+        if self.__pack_bytes is not None and entry["size"] <= self.__pack_bytes:
+            self.__pack_file(new_ident, new_f_name, entry["checksum"])
+        self.__enforce_limits([new_ident])
+        return True
+
+    def has_file(self, location, temporary=False):
+        """
+        Check if a file is in the cache without reading it.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+
+        :returns: True if the file is cached, False otherwise.
+        :rtype: bool
+        """
+        cached = self.__manifest.contains(helper.id_from_location(location), temporary)
+        if not cached and not temporary:
+            self.__stats["files"]["misses"] += 1
+        return cached
+
+    def file_info(self, location, temporary=False):
+        """
+        Get the manifest entry of a cached file.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+
+        :returns: A dict with the keys ident, temporary, size, checksum, etag, last_access, hits
+                  and array_checksum or None if the file is not cached.
+        :rtype: dict
+        """
+        return self.__manifest.get(helper.id_from_location(location), temporary)
+
+    def set_array_checksum(self, location, array_checksum, temporary=False):
+        """
+        Record the checksum of the array data in a cached file (see helper.array_checksum). The
+        checksum is kept until the file is replaced or deleted.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+        :param array_checksum: The checksum of the array.
+        :type array_checksum: str
+
+        :returns: True if the checksum was recorded, False if the file is not cached.
+        :rtype: bool
+        """
+        return self.__manifest.set_array_checksum(helper.id_from_location(location), temporary, array_checksum)
+
+    def touch_file(self, location, temporary=False):
+        """
+        Record an access to a cached file in the manifest.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+        """
+        self.__manifest.touch(helper.id_from_location(location), temporary)
+        if not temporary:
+            self.__stats["files"]["hits"] += 1
+
+    def verify_file(self, location, temporary=False):
+        """
+        Check the integrity of a cached file by comparing its size and checksum with the manifest.
+        A damaged file is removed from the cache.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+
+        :returns: True if the file is intact, False if it was damaged or is not cached.
+        :rtype: bool
+        """
+        ident = helper.id_from_location(location)
+        f_name = self.file_cache_path(ident, temporary)
+        entry = self.__manifest.get(ident, temporary)
+
+        if entry is not None and not temporary and not os.path.isfile(f_name) and self.__pack.contains(ident):
+            # the original file of a packed array is gone, thus only the dataset can be checked
+            return self.__pack.get(ident) is not None
+
+        intact = entry is not None and os.path.isfile(f_name) and os.path.getsize(f_name) == entry["size"]
+        if intact and entry["checksum"] is not None and entry["checksum"] == entry["array_checksum"]:
+            # files written from arrays are recorded with the checksum of the array (see add_file)
+            intact = helper.array_checksum(hdfio.read_array_data(f_name, mmap=True)) == entry["checksum"]
+        elif intact and entry["checksum"] is not None:
+            intact = helper.file_checksum(f_name) == entry["checksum"]
+
+        if not intact:
+            self.delete_file(location, temporary)
+
+        return intact
 
     def get_file(self, location, temporary=False):
         """
@@ -193,10 +573,49 @@ class Cache(object):
 
         if os.path.isfile(f_name):
             data = self._secure_read(f_name, serialize=False)
+            self.touch_file(location, temporary)
             return data
-        else:
+
+        if not temporary:
+            # packed arrays are exported to a new HDF5 file
+            f_name_tmp = self.file_cache_path(ident, temporary, create=True) + "." + helper.random_str(8, "tmp")
+            try:
+                if self.__pack.export(ident, f_name_tmp):
+                    data = self._secure_read(f_name_tmp, serialize=False)
+                    self.touch_file(location, temporary)
+                    return data
+            finally:
+                if os.path.exists(f_name_tmp):
+                    os.remove(f_name_tmp)
+
+            if self.__pack.contains(ident):
+                return None     # the container can not be read at the moment
+
+        self.__manifest.remove(ident, temporary)
+        return None
+
+    def get_packed(self, location, start=None, stop=None, temporary=False):
+        """
+        Read a packed array or some of its rows (see ArrayPack.get).
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+        :param start: The index of the first row to read.
+        :type start: int
+        :param stop: The index after the last row to read.
+        :type stop: int
+
+        :returns: The array or None if it is not packed.
+        :rtype: numpy.ndarray
+        """
+        if temporary:
             return None
 
+        data = self.__pack.get(helper.id_from_location(location), start, stop)
+        if data is not None:
+            self.touch_file(location, temporary)
+        return data
+
     def delete_file(self, location, temporary=False):
         """
         Delete file data form the cache.
@@ -210,11 +629,13 @@ class Cache(object):
         ident = helper.id_from_location(location)
         f_name = self.file_cache_path(ident, temporary)
 
+        self.__manifest.remove(ident, temporary)
+        packed = not temporary and self.__pack.remove_many([ident]) > 0
         if os.path.isfile(f_name):
             os.remove(f_name)
             return True
         else:
-            return False
+            return packed
 
     def clear(self, temporary=False):
         """
@@ -225,12 +646,202 @@ class Cache(object):
         else:
             dirs = (self.file_dir, self.obj_dir, self.file_dir_tmp, self.obj_dir_tmp)
 
+        # directories are renamed and removed in the background, thus the cache can be used right away
         for d in dirs:
             if os.path.exists(d):
-                shutil.rmtree(d)
+                trash = d + "." + helper.random_str(8, "trash")
+                try:
+                    os.rename(d, trash)
+                except OSError:
+                    shutil.rmtree(d)
+                else:
+                    self.__remove_dir(trash)
+
+        if not temporary:
+            self.__pack.clear()
 
+        self.__dirs.clear()
+        self.__manifest.clear(temporary)
+        self.__object_manifest.clear(temporary)
         self.ensure_dirs()
 
+    def close(self):
+        """
+        Release all resources held by the cache and wait until directories removed by clear() are gone.
+        """
+        for thread in self.__removals:
+            thread.join()
+        self.__removals = []
+
+        self.__pack.close()
+        self.__manifest.close()
+        self.__object_manifest.close()
+
+    def pin(self, location):
+        """
+        Protect an object or file from eviction until it is unpinned. Pins are counted, thus
+        an object pinned twice must be unpinned twice.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+        """
+        ident = helper.id_from_location(location)
+        with self.__evict_lock:
+            self.__pinned[ident] = self.__pinned.get(ident, 0) + 1
+
+    def unpin(self, location):
+        """
+        Remove a pin from an object or file (see pin).
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+        """
+        ident = helper.id_from_location(location)
+        with self.__evict_lock:
+            count = self.__pinned.get(ident, 0) - 1
+            if count > 0:
+                self.__pinned[ident] = count
+            else:
+                self.__pinned.pop(ident, None)
+
+    def is_pinned(self, location):
+        """
+        Check if an object or file is pinned.
+
+        :param location: An url or path that ends with a unique identifier or the identifier itself.
+        :type location: str
+
+        :rtype: bool
+        """
+        with self.__evict_lock:
+            return helper.id_from_location(location) in self.__pinned
+
+    def evict(self):
+        """
+        Evict objects and files according to the eviction policy until the cache is filled to
+        EVICTION_RATIO of its limits. Nothing is evicted, if no limit is exceeded.
+
+        :returns: The number of evicted objects and files.
+        :rtype: int
+        """
+        with self.__evict_lock:
+            count = self.__evict("objects", self.__object_manifest, self._delete_objects)
+            count += self.__evict("files", self.__manifest, self.__delete_files)
+        return count
+
+    def compact(self):
+        """
+        Enforce the limits of the cache (see evict), remove incomplete files left behind by interrupted
+        downloads or writes and write pending access times to the manifests. This method is meant to
+        be called periodically e.g. by a Janitor.
+
+        Searching incomplete files requires walking all cached files, therefore it is done at most
+        once in STALE_FILE_AGE. Small files, that are not yet packed, are packed at the same time
+        and containers with many removed arrays are rewritten (see ArrayPack.compact).
+
+        :returns: The number of evicted objects and files.
+        :rtype: int
+        """
+        count = self.evict()
+
+        now = time.time()
+        if now - self.__last_sweep > Cache.STALE_FILE_AGE:
+            self.__last_sweep = now
+            for d in (self.file_dir, self.file_dir_tmp, self.obj_dir, self.obj_dir_tmp):
+                for dir_path, _, f_names in os.walk(d):
+                    for f_name in f_names:
+                        f_path = os.path.join(dir_path, f_name)
+                        try:
+                            if "." in f_name and now - os.path.getmtime(f_path) > Cache.STALE_FILE_AGE:
+                                os.remove(f_path)
+                        except OSError:
+                            pass    # removed or replaced in the meantime
+
+            # directories left behind by clear(), if the process ended before they were removed
+            for f_name in os.listdir(self.base_dir):
+                if ".trash_" in f_name:
+                    shutil.rmtree(os.path.join(self.base_dir, f_name), ignore_errors=True)
+
+            self.pack_files()
+
+        self.__pack.compact()
+        self.__manifest.flush()
+        self.__object_manifest.flush()
+        return count
+
+    def scan_files(self):
+        """
+        Bring the manifest in line with the files in the cache: files that are missing in the manifest
+        (e.g. from a cache created by an older version) are added without a checksum and entries of
+        files that do not exist any more are removed.
+
+        :returns: The number of added and removed entries.
+        :rtype: int
+        """
+        count = 0
+        for temporary, file_dir in ((False, self.file_dir), (True, self.file_dir_tmp)):
+            idents = set()
+            for dir_path, _, f_names in os.walk(file_dir):
+                for f_name in f_names:
+                    # incomplete downloads and writes have a suffix
+                    if "." in f_name:
+                        continue
+
+                    idents.add(f_name)
+                    if not self.__manifest.contains(f_name, temporary):
+                        self.__manifest.add(f_name, temporary, os.path.getsize(os.path.join(dir_path, f_name)))
+                        count += 1
+
+            if not temporary:
+                idents.update(self.__pack.idents())
+
+            for entry in self.__manifest.entries(temporary):
+                if entry["ident"] not in idents:
+                    self.__manifest.remove(entry["ident"], temporary)
+                    count += 1
+
+        return count
+
+    def pack_files(self):
+        """
+        Pack all cached files up to the size given by pack_bytes, that are not yet packed
+        (e.g. files cached before packing was enabled).
+
+        :returns: The number of packed files.
+        :rtype: int
+        """
+        if self.__pack_bytes is None:
+            return 0
+
+        count = 0
+        packed = self.__pack.idents()
+        for entry in self.__manifest.entries(False):
+            if entry["size"] <= self.__pack_bytes and entry["ident"] not in packed:
+                f_name = self.file_cache_path(entry["ident"], False)
+                if os.path.isfile(f_name) and self.__pack_file(entry["ident"], f_name, entry["checksum"]):
+                    count += 1
+        return count
+
+    def scan_objects(self):
+        """
+        Add all cached objects to the object manifest, if the manifest is empty (e.g. for a cache
+        created by an older version).
+
+        :returns: The number of added entries.
+        :rtype: int
+        """
+        if self.__object_manifest.count(False) > 0 or self.__object_manifest.count(True) > 0:
+            return 0
+
+        entries = {False: [], True: []}
+        for ident, temporary, size in self._object_sizes():
+            entries[temporary].append((ident, size, None, None))
+
+        for temporary, group in entries.items():
+            self.__object_manifest.add_many(group, temporary)
+
+        return len(entries[False]) + len(entries[True])
+
     def obj_cache_path(self, ident, temporary):
         prefix = ident[0:2]
         if temporary:
@@ -238,14 +849,37 @@ class Cache(object):
         else:
             return os.path.join(self.obj_dir, prefix)
 
-    def file_cache_path(self, ident, temporary):
-        if temporary:
-            return os.path.join(self.file_dir_tmp, ident)
-        else:
-            return os.path.join(self.file_dir, ident)
+    def file_cache_path(self, ident, temporary, create=False):
+        """
+        The path of a cached file, e.g. files/3f/a2/ABC0000001 (see SHARD_DEPTH and SHARD_WIDTH).
+
+        :param ident: The identifier of the file.
+        :type ident: str
+        :param temporary: True if the file is stored in the temporary part of the cache.
+        :type temporary: bool
+        :param create: Create the directory of the file, so that the file can be written.
+        :type create: bool
+
+        :returns: The path of the file (the file may not exist).
+        :rtype: str
+        """
+        digest = hashlib.md5(ident.encode("utf-8")).hexdigest()
+        width = Cache.SHARD_WIDTH
+        shards = [digest[i * width:(i + 1) * width] for i in range(Cache.SHARD_DEPTH)]
+
+        f_dir = os.path.join(self.file_dir_tmp if temporary else self.file_dir, *shards)
+        if create and f_dir not in self.__dirs:
+            try:
+                os.makedirs(f_dir, 0o0750)
+            except OSError:
+                if not os.path.isdir(f_dir):
+                    raise
+            self.__dirs.add(f_dir)
+
+        return os.path.join(f_dir, ident)
 
     def ensure_dirs(self):
-        dirs = (self.base_dir, self.file_dir, self.obj_dir, self.file_dir_tmp, self.obj_dir_tmp)
+        dirs = (self.base_dir, self.file_dir, self.obj_dir, self.file_dir_tmp, self.obj_dir_tmp, self.pack_dir)
         for d in dirs:
             if not os.path.isdir(d):
                 os.makedirs(d, 0o0750)
@@ -256,67 +890,430 @@ class Cache(object):
     # Helper methods
     #
 
-    def _secure_read(self, f_name, default=None, serialize=True):
-        f_handle = None
-        f_name_tmp = os.path.join(self.base_dir, helper.random_str(20, "tmp"))
+    def _open(self):
+        """
+        Prepare the storage of objects, called by the constructor before the manifests are checked.
+        """
+        pass
 
-        try:
-            if os.path.exists(f_name):
-                shutil.copy2(f_name, f_name_tmp)
-                f_handle = open(f_name, "rb")
+    def _object_sizes(self):
+        """
+        Iterate over all cached objects.
 
-                if serialize:
-                    try:
-                        data = pickle.load(f_handle)
-                    except EOFError:
-                        data = default
-                else:
-                    data = f_handle.read()
+        :returns: A generator over tuples (ident, temporary, size).
+        :rtype: generator
+        """
+        for temporary, obj_dir in ((False, self.obj_dir), (True, self.obj_dir_tmp)):
+            for f_name in os.listdir(obj_dir):
+                f_path = os.path.join(obj_dir, f_name)
+                # incomplete writes have a suffix
+                if "." not in f_name and os.path.isfile(f_path):
+                    for ident, data in self._secure_read(f_path, {}).items():
+                        yield ident, temporary, len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+    def _delete_objects(self, idents, temporary):
+        """
+        Delete several objects from the storage.
 
-            else:
-                data = default
+        :param idents: The identifiers of the objects.
+        :type idents: list
 
-        except Exception as e:
-            if f_handle is not None and not f_handle.closed:
-                f_handle.close()
-            if os.path.exists(f_name_tmp):
-                if os.path.exists(f_name):
-                    os.remove(f_name)
-                os.rename(f_name_tmp, f_name)
-            raise e
+        :returns: The number of deleted objects.
+        :rtype: int
+        """
+        groups = {}
+        for ident in idents:
+            groups.setdefault(self.obj_cache_path(ident, temporary), []).append(ident)
+
+        count = 0
+        for f_name, group in groups.items():
+            with self.__shard_lock:
+                all_data = self._secure_read(f_name, {})
+                deleted = [ident for ident in group if all_data.pop(ident, None) is not None]
+                if len(deleted) > 0:
+                    self._secure_write(f_name, all_data)
+                    count += len(deleted)
+
+        return count
+
+    def _objects_read(self, idents, requested, temporary):
+        """
+        Record the access to objects, that were read from the storage.
 
-        else:
-            if f_handle is not None and not f_handle.closed:
-                f_handle.close()
-            if os.path.exists(f_name_tmp):
-                os.remove(f_name_tmp)
+        :param idents: The identifiers of all objects found.
+        :type idents: list
+        :param requested: The number of requested objects.
+        :type requested: int
+        """
+        if self.__track_objects:
+            self.__object_manifest.touch_many(idents, temporary)
 
-        return data
+        if not temporary:
+            self.__stats["objects"]["hits"] += len(idents)
+            self.__stats["objects"]["misses"] += requested - len(idents)
 
-    def _secure_write(self, f_name, data, serialize=True):
-        f_handle = None
-        f_name_tmp = os.path.join(self.base_dir, helper.random_str(20, "tmp"))
+    def _objects_written(self, sizes, temporary):
+        """
+        Record objects, that were written to the storage, and enforce the limits of the cache.
 
+        :param sizes: A dict that maps identifiers to the size of the stored object.
+        :type sizes: dict
+        """
+        if self.__track_objects:
+            self.__object_manifest.add_many([(ident, size, None, None) for ident, size in sizes.items()],
+                                            temporary)
+        self.__enforce_limits(sizes.keys())
+
+    # The size of an object is only recorded, if objects are limited; measuring it pickles the object again
+    def __object_size(self, data):
+        if not self.__track_objects:
+            return 0
+        return len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+    # Evict if a limit is exceeded, the objects or files just written are kept (with LFU they would come first)
+    def __enforce_limits(self, written):
+        for kind, entries in (("objects", self.__object_manifest), ("files", self.__manifest)):
+            max_entries, max_bytes = self.__limits[kind]
+            if (max_entries is not None and entries.count() > max_entries) or \
+               (max_bytes is not None and entries.total_size() > max_bytes):
+                with self.__evict_lock:
+                    self.__evict("objects", self.__object_manifest, self._delete_objects, written)
+                    self.__evict("files", self.__manifest, self.__delete_files, written)
+                break
+
+    def __evict(self, kind, entries, delete, keep=()):
+        max_entries, max_bytes = self.__limits[kind]
+        count, size = entries.count(), entries.total_size()
+
+        if not ((max_entries is not None and count > max_entries) or (max_bytes is not None and size > max_bytes)):
+            return 0
+
+        goal_entries = count if max_entries is None else int(max_entries * Cache.EVICTION_RATIO)
+        goal_bytes = size if max_bytes is None else int(max_bytes * Cache.EVICTION_RATIO)
+
+        keep = set(keep)
+        victims = []
+        for entry in entries.entries(False, self.__policy):
+            if count <= goal_entries and size <= goal_bytes:
+                break
+            if entry["ident"] not in self.__pinned and entry["ident"] not in keep:
+                victims.append(entry["ident"])
+                count -= 1
+                size -= entry["size"]
+
+        entries.remove_many(victims, False)
+        delete(victims, False)
+        self.__stats[kind]["evictions"] += len(victims)
+
+        return len(victims)
+
+    # Move the files of a cache with a flat layout into their directories
+    def __migrate_files(self):
+        count = 0
+        for temporary, file_dir in ((False, self.file_dir), (True, self.file_dir_tmp)):
+            for f_name in os.listdir(file_dir):
+                f_path = os.path.join(file_dir, f_name)
+                # incomplete files are left to compact()
+                if "." not in f_name and os.path.isfile(f_path):
+                    helper.replace_file(f_path, self.file_cache_path(f_name, temporary, create=True))
+                    count += 1
+        return count
+
+    # Replace a file by a hard link to a cached file with the same content
+    def __share_file(self, ident, temporary, f_name, checksum):
+        if checksum is None:
+            return False
+
+        for other, other_temporary in self.__manifest.references(checksum):
+            other_f_name = self.file_cache_path(other, other_temporary)
+            if other_f_name == f_name:
+                continue
+
+            try:
+                if os.path.getsize(other_f_name) != os.path.getsize(f_name):
+                    continue
+            except OSError:
+                continue    # packed or removed
+
+            f_name_tmp = f_name + "." + helper.random_str(8, "tmp")
+            try:
+                os.link(other_f_name, f_name_tmp)
+                helper.replace_file(f_name_tmp, f_name)
+                return True
+            except (OSError, AttributeError):
+                # hard links are not supported by the platform or filesystem
+                if os.path.exists(f_name_tmp):
+                    os.remove(f_name_tmp)
+                return False
+
+        return False
+
+    # Move a file into the pack, the file is kept if it is not an HDF5 file with a single dataset
+    def __pack_file(self, ident, f_name, checksum=None):
+        if not self.__pack.put(ident, f_name, checksum):
+            return False
         try:
+            os.remove(f_name)
+        except OSError:
+            pass    # still opened e.g. on Windows, the file is read instead of the packed array
+        return True
+
+    def __remove_dir(self, path):
+        thread = threading.Thread(target=shutil.rmtree, args=(path, True), name="gnodeclient-clear")
+        thread.daemon = True
+        thread.start()
+        self.__removals = [t for t in self.__removals if t.is_alive()] + [thread]
+
+    def __delete_files(self, idents, temporary):
+        if not temporary:
+            self.__pack.remove_many(idents)
+        for ident in idents:
+            f_name = self.file_cache_path(ident, temporary)
+            if os.path.isfile(f_name):
+                os.remove(f_name)
+
+    # Files are never modified in place: _secure_write writes to a temporary file in the same directory,
+    # syncs it to disk and atomically replaces the old file. Thus a file always contains either its old
+    # or its new content, even if writing fails or the process crashes, and reading needs no precautions.
+
+    def _secure_read(self, f_name, default=None, serialize=True):
+        try:
+            f_handle = open(f_name, "rb")
+        except IOError:
             if os.path.exists(f_name):
-                shutil.copy2(f_name, f_name_tmp)
-            f_handle = open(f_name, "wb")
+                raise
+            return default
 
+        with f_handle:
             if serialize:
-                pickle.dump(data, f_handle)
+                try:
+                    return pickle.load(f_handle)
+                except EOFError:
+                    return default
             else:
-                f_handle.write(data)
+                return f_handle.read()
 
-        except Exception as e:
-            if f_handle is not None and not f_handle.closed:
-                f_handle.close()
-            if os.path.exists(f_name_tmp):
-                if os.path.exists(f_name):
-                    os.remove(f_name)
-                os.rename(f_name_tmp, f_name)
-            raise e
+    def _secure_write(self, f_name, data, serialize=True):
+        f_name_tmp = f_name + "." + helper.random_str(8, "tmp")
 
-        else:
-            f_handle.close()
+        try:
+            with open(f_name_tmp, "wb") as f_handle:
+                if serialize:
+                    pickle.dump(data, f_handle, pickle.HIGHEST_PROTOCOL)
+                else:
+                    f_handle.write(data)
+                f_handle.flush()
+                os.fsync(f_handle.fileno())
+
+            helper.replace_file(f_name_tmp, f_name)
+
+        finally:
             if os.path.exists(f_name_tmp):
                 os.remove(f_name_tmp)
+
+
+Cache._BACKEND_MAP[Cache.PICKLE] = Cache
+
+
+class SQLiteCache(Cache):
+    """
+    A cache that keeps all objects in a single SQLite database, where each object is stored as
+    a separate record indexed by its identifier. Thus reading or writing an object does not depend
+    on the number of other cached objects. File data is handled in the same way as by Cache.
+
+    Objects found in the shard files of the pickle backend are migrated into the database when
+    the cache is opened.
+    """
+
+    DB_FILE = 'objects.db'
+    MAX_VARIABLES = 500     # keep queries below the SQLite limit of host parameters
+
+    # Compact the database file, if more than this fraction of its pages is unused
+    VACUUM_RATIO = 0.25
+
+    def __init__(self, location, base_dir, **limits):
+        """
+        Cache initialisation
+
+        :param location: The location of the base directory, by default a suitable location is chosen.
+        :type location: str
+        :param base_dir: The name of the base directory.
+        :type base_dir: str
+        :param limits: Limits and eviction policy (see Cache).
+        :type limits: dict
+        """
+        self.__lock = threading.RLock()
+        self.__db_path = None
+        self.__conn = None
+
+        super(SQLiteCache, self).__init__(location, base_dir, **limits)
+
+    #
+    # Properties
+    #
+
+    @property
+    def db_path(self):
+        """
+        The path to the database file, where cached objects are stored.
+        """
+        return self.__db_path
+
+    #
+    # Methods
+    #
+
+    def set(self, location, data, temporary=False):
+        ident = helper.id_from_location(location)
+        record = sqlite3.Binary(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+        with self.__lock:
+            self.__conn.execute("INSERT OR REPLACE INTO objects (ident, temporary, data) VALUES (?, ?, ?)",
+                                (ident, int(temporary), record))
+            self.__conn.commit()
+
+        self._objects_written({ident: len(record)}, temporary)
+
+    def get(self, location, temporary=False):
+        result = None
+        ident = helper.id_from_location(location)
+
+        if len(ident) > 0:
+            with self.__lock:
+                row = self.__conn.execute("SELECT data FROM objects WHERE ident = ? AND temporary = ?",
+                                          (ident, int(temporary))).fetchone()
+            if row is not None:
+                result = pickle.loads(bytes(row[0]))
+
+        self._objects_read([ident] if result is not None else [], 1, temporary)
+        return result
+
+    def set_many(self, mapping, temporary=False):
+        records = [(helper.id_from_location(location), int(temporary),
+                    sqlite3.Binary(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)))
+                   for location, data in mapping.items()]
+
+        with self.__lock:
+            self.__conn.executemany("INSERT OR REPLACE INTO objects (ident, temporary, data) VALUES (?, ?, ?)",
+                                    records)
+            self.__conn.commit()
+
+        self._objects_written(dict((ident, len(record)) for ident, _, record in records), temporary)
+
+    def get_many(self, locations, temporary=False):
+        results = {}
+        idents = {}
+        for location in locations:
+            ident = helper.id_from_location(location)
+            if len(ident) > 0:
+                idents.setdefault(ident, []).append(location)
+
+        found = []
+        keys = list(idents.keys())
+        for i in range(0, len(keys), SQLiteCache.MAX_VARIABLES):
+            page = keys[i:i + SQLiteCache.MAX_VARIABLES]
+            query = "SELECT ident, data FROM objects WHERE temporary = ? AND ident IN (%s)" % \
+                    ", ".join("?" * len(page))
+
+            with self.__lock:
+                rows = self.__conn.execute(query, [int(temporary)] + page).fetchall()
+
+            for ident, record in rows:
+                data = pickle.loads(bytes(record))
+                found.append(ident)
+                for location in idents[ident]:
+                    results[location] = data
+
+        self._objects_read(found, len(keys), temporary)
+        return results
+
+    def clear(self, temporary=False):
+        with self.__lock:
+            if temporary:
+                self.__conn.execute("DELETE FROM objects WHERE temporary = 1")
+            else:
+                self.__conn.execute("DELETE FROM objects")
+            self.__conn.commit()
+
+        super(SQLiteCache, self).clear(temporary)
+
+    def close(self):
+        with self.__lock:
+            if self.__conn is not None:
+                self.__conn.close()
+                self.__conn = None
+
+        super(SQLiteCache, self).close()
+
+    def compact(self):
+        count = super(SQLiteCache, self).compact()
+
+        with self.__lock:
+            free = self.__conn.execute("PRAGMA freelist_count").fetchone()[0]
+            pages = self.__conn.execute("PRAGMA page_count").fetchone()[0]
+            if free > pages * SQLiteCache.VACUUM_RATIO:
+                self.__conn.execute("VACUUM")
+
+        return count
+
+    def migrate(self):
+        """
+        Move all objects from the shard files of the pickle backend into the database. Shard files
+        are removed after their content was written to the database.
+
+        :returns: The number of migrated objects.
+        :rtype: int
+        """
+        count = 0
+        for temporary, obj_dir in ((False, self.obj_dir), (True, self.obj_dir_tmp)):
+            for f_name in os.listdir(obj_dir):
+                f_path = os.path.join(obj_dir, f_name)
+                if "." in f_name or not os.path.isfile(f_path):
+                    continue
+
+                all_data = self._secure_read(f_path, {})
+                records = [(ident, int(temporary), sqlite3.Binary(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)))
+                           for ident, data in all_data.items()]
+
+                with self.__lock:
+                    self.__conn.executemany("INSERT OR REPLACE INTO objects (ident, temporary, data) "
+                                            "VALUES (?, ?, ?)", records)
+                    self.__conn.commit()
+
+                os.remove(f_path)
+                count += len(records)
+
+        return count
+
+    #
+    # Helper methods
+    #
+
+    def _open(self):
+        self.__db_path = os.path.join(self.base_dir, SQLiteCache.DB_FILE)
+        self.__conn = sqlite3.connect(self.__db_path, check_same_thread=False)
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS objects ("
+                            "ident TEXT NOT NULL, "
+                            "temporary INTEGER NOT NULL, "
+                            "data BLOB NOT NULL, "
+                            "PRIMARY KEY (ident, temporary))")
+        self.__conn.commit()
+
+        self.migrate()
+
+    def _object_sizes(self):
+        with self.__lock:
+            rows = self.__conn.execute("SELECT ident, temporary, LENGTH(data) FROM objects").fetchall()
+        for ident, temporary, size in rows:
+            yield ident, bool(temporary), size
+
+    def _delete_objects(self, idents, temporary):
+        with self.__lock:
+            changes = self.__conn.total_changes
+            self.__conn.executemany("DELETE FROM objects WHERE ident = ? AND temporary = ?",
+                                    [(ident, int(temporary)) for ident in idents])
+            self.__conn.commit()
+            return self.__conn.total_changes - changes
+
+
+Cache._BACKEND_MAP[Cache.SQLITE] = SQLiteCache
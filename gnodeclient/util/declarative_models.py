@@ -1,7 +1,8 @@
 """
 This module provides an implementation for semi declarative model definitions in python. Models are
 defined by classes inheriting from the Model base class. Properties of models are defined by assigning
-instances of the Field class to fields of the model class.
+instances of the Field class to fields of the model class. The values of all fields are stored in
+slots, therefore model instances have no __dict__ and only fields can be assigned.
 
 Example model class:
 >>> class Foo(Model):
@@ -26,6 +27,21 @@ from __future__ import print_function, absolute_import, division
 # some constants
 _REGISTERED_FIELDS = "__registered_fields"      # the field where field descriptors are stored
 _REGISTERED_FIELDS_GETTER = "inspect_fields"    # readonly property for field descriptors access
+_FIELD_CATEGORIES = "__field_categories"        # the field where the categorised field descriptors are stored
+_FIELD_SLOTS = "__field_slots"                  # the field where the slots for all field values are stored
+_FIELD_DEFAULTS = "__field_defaults"            # the field where slots and default values are stored
+
+# selectors for all categories of fields, that are computed once per model class
+_FIELD_CATEGORY_SELECTORS = {
+    "fields": lambda x: True,
+    "parent_fields": lambda x: x.is_parent,
+    "child_fields": lambda x: x.is_child,
+    "reference_fields": lambda x: x.is_child or x.is_parent,
+    "none_reference_fields": lambda x: not x.is_child and not x.is_parent,
+    "optional_fields": lambda x: not x.obligatory,
+    "obligatory_fields": lambda x: x.obligatory,
+    "datafile_fields": lambda x: x.type_info == 'datafile'
+}
 
 
 def _mangle_field_name(cls_name, field_name):
@@ -48,31 +64,52 @@ def _make_registered_fields_property(dct, fields):
     dct[_REGISTERED_FIELDS_GETTER] = property(getter, None, None, "All registered field descriptors")
 
 
-def _add_field_property_to_dct(dct, cls_name, field, field_name):
+def _make_field_categories(dct, fields):
     """
-    Creates a property with setter, getter and deleter from a given field, and
-    adds this field to a dict.
+    Sorts all field descriptors of a model class into the categories defined by
+    _FIELD_CATEGORY_SELECTORS and adds them to the class dict.
     """
-    mangled_name = _mangle_field_name(cls_name, field_name)
+    categories = {}
+    for category, selector in _FIELD_CATEGORY_SELECTORS.items():
+        categories[category] = FrozenDict((name, field) for name, field in fields.items() if selector(field))
 
-    def getter(myself):
-        if not hasattr(myself, mangled_name):
-            setattr(myself, mangled_name, field.default)
-        return getattr(myself, mangled_name)
+    dct[_FIELD_CATEGORIES] = categories
+
+
+def _add_field_property(cls, field, field_name, slot):
+    """
+    Creates a property with setter, getter and deleter from a given field, that stores
+    the value of the field in a slot, and adds this property to the class.
+    """
+    check = field.check
+    set_slot = slot.__set__
 
     def setter(myself, value):
-        if field.check(value):
-            setattr(myself, mangled_name, value)
+        if check(value):
+            set_slot(myself, value)
         else:
             raise ValueError("Not a valid value: %s!" % str(value))
 
+    # fields without a specialised check accept every value
+    if type(field).check == Field.check:
+        setter = set_slot
+
     def deleter(myself):
-        if hasattr(myself, mangled_name):
-            delattr(myself, mangled_name)
-        if field.default is not None:
-            setattr(myself, mangled_name, field.default)
+        set_slot(myself, field.default)
+
+    doc = "Property accessor for %s.%s" % (cls.__name__, field_name)
+    setattr(cls, field_name, property(slot.__get__, setter, deleter, doc))
 
-    dct[field_name] = property(getter, setter, deleter, "Property accessor for %s.%s" % (cls_name, field_name))
+
+class FrozenDict(dict):
+    """
+    A dict that can not be changed after its creation.
+    """
+
+    def __readonly(self, *args, **kwargs):
+        raise TypeError("%s is read only" % type(self).__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __readonly
 
 
 class Field(object):
@@ -182,24 +219,41 @@ class ModelMeta(type):
     def __new__(mcs, name, bases, dct):
 
         fields = {}
+        field_slots = {}
 
         # collect field descriptors from base classes
         for b in bases:
             if hasattr(b, _REGISTERED_FIELDS):
                 fields.update(getattr(b, _REGISTERED_FIELDS))
+                field_slots.update(getattr(b, _FIELD_SLOTS))
 
-        # collect field descriptors from own dict
-        for field_name in dct.keys():
+        # collect field descriptors from own dict, the values of these fields are stored in slots
+        own_fields = {}
+        for field_name in list(dct.keys()):
             field = dct[field_name]
             if isinstance(field, Field):
-                _add_field_property_to_dct(dct, name, field, field_name)
+                own_fields[field_name] = field
                 fields[field_name] = field
+                del dct[field_name]
+
+        dct.setdefault("__slots__", tuple(_mangle_field_name(name, field_name) for field_name in own_fields))
 
         _make_registered_fields_property(dct, fields)
-        return type.__new__(mcs, name, bases, dct)
+        _make_field_categories(dct, fields)
+        cls = type.__new__(mcs, name, bases, dct)
 
+        for field_name, field in own_fields.items():
+            slot = cls.__dict__[_mangle_field_name(name, field_name)]
+            field_slots[field_name] = slot
+            _add_field_property(cls, field, field_name, slot)
 
-class Model(object):
+        setattr(cls, _FIELD_SLOTS, field_slots)
+        setattr(cls, _FIELD_DEFAULTS, tuple((field_slots[n], f.default) for n, f in fields.items()))
+        return cls
+
+
+# The metaclass is applied via a base class, which works with python 2 and 3
+class Model(ModelMeta("ModelBase", (object,), {})):
     """
     A model that can serve as a base class for objects that make use of the Field class
     in order to define their properties. It provides methods that makes it easier to inspect
@@ -207,13 +261,14 @@ class Model(object):
     item of a map.
     """
 
-    __metaclass__ = ModelMeta  # This is key feature of the model class
-
     def __init__(self, *args, **kwargs):
         """
         Generic init method that initiates all fields
         """
-        fields = getattr(self, _REGISTERED_FIELDS_GETTER)
+        fields = getattr(self, _REGISTERED_FIELDS)
+
+        for slot, default in getattr(self, _FIELD_DEFAULTS):
+            slot.__set__(self, default)
 
         if len(args) > 0:
             raise KeyError("%s: Unable to apply non keyword arguments" % (type(self)))
@@ -231,42 +286,42 @@ class Model(object):
     @property
     def fields(self):
         """Descriptors for all fields of the model"""
-        return self.__inspect_filtered()
+        return getattr(self, _FIELD_CATEGORIES)["fields"]
 
     @property
     def parent_fields(self):
         """Descriptors for all fields of the model, that are parent relationships"""
-        return self.__inspect_filtered(lambda x: x.is_parent)
+        return getattr(self, _FIELD_CATEGORIES)["parent_fields"]
 
     @property
     def child_fields(self):
         """Descriptors for all fields of the model, that are child relationships"""
-        return self.__inspect_filtered(lambda x: x.is_child)
+        return getattr(self, _FIELD_CATEGORIES)["child_fields"]
 
     @property
     def reference_fields(self):
         """Descriptors for all fields of the model, that are some kind of relationship"""
-        return self.__inspect_filtered(lambda x: x.is_child or x.is_parent)
+        return getattr(self, _FIELD_CATEGORIES)["reference_fields"]
 
     @property
     def none_reference_fields(self):
         """Descriptors for all fields of the model, that are not a kind of relationship"""
-        return self.__inspect_filtered(lambda x: not x.is_child and not x.is_parent)
+        return getattr(self, _FIELD_CATEGORIES)["none_reference_fields"]
 
     @property
     def optional_fields(self):
         """Descriptors for all fields of the model, that are optional"""
-        return self.__inspect_filtered(lambda x: not x.obligatory)
+        return getattr(self, _FIELD_CATEGORIES)["optional_fields"]
 
     @property
     def obligatory_fields(self):
         """Descriptors for all fields of the model, that are obligatory"""
-        return self.__inspect_filtered(lambda x: x.obligatory)
+        return getattr(self, _FIELD_CATEGORIES)["obligatory_fields"]
 
     @property
     def datafile_fields(self):
         """Descriptors for all data fields of the model, containing array """
-        return self.__inspect_filtered(lambda x: x.type_info == 'datafile')
+        return getattr(self, _FIELD_CATEGORIES)["datafile_fields"]
 
     #
     # Methods
@@ -282,46 +337,49 @@ class Model(object):
         :return: The field descriptor or None if the field does not exits.
         :rtype: Field
         """
-        fields = getattr(self, _REGISTERED_FIELDS_GETTER)
-        if name in fields:
-            return fields[name]
-        else:
-            return None
-
-    def __inspect_filtered(self, selector=lambda x: True):
-        fields = getattr(self, _REGISTERED_FIELDS_GETTER)
-        filtered_fields = {}
+        return getattr(self, _REGISTERED_FIELDS).get(name)
 
-        for f_name in fields:
-            f_desc = fields[f_name]
-            if selector(f_desc):
-                filtered_fields[f_name] = f_desc
+    def copy(self):
+        """
+        Create a copy of the model. Field values that are lists or dicts (e.g. relationships or
+        values with units) are copied as well, thus the copy can be modified without changing
+        the original.
 
-        return filtered_fields
+        :return: The copy of the model.
+        :rtype: Model
+        """
+        cls = type(self)
+        other = cls.__new__(cls)
+        for slot, _ in getattr(cls, _FIELD_DEFAULTS):
+            value = slot.__get__(self, cls)
+            if isinstance(value, list):
+                value = list(value)
+            elif isinstance(value, dict):
+                value = dict(value)
+            slot.__set__(other, value)
+        return other
 
     #
     # Built-in functions
     #
 
     def __getitem__(self, name):
-        field = self.get_field(name)
-        if field is not None:
+        if name in getattr(self, _REGISTERED_FIELDS):
             return getattr(self, name)
         else:
             raise KeyError("Model has no such field: %s" % name)
 
     def __setitem__(self, name, value):
-        field = self.get_field(name)
-        if field is not None:
+        if name in getattr(self, _REGISTERED_FIELDS):
             setattr(self, name, value)
         else:
             raise KeyError("Model has no such field: %s" % name)
 
     def __len__(self):
-        return len(getattr(self, _REGISTERED_FIELDS_GETTER))
+        return len(getattr(self, _REGISTERED_FIELDS))
 
     def __iter__(self):
-        return iter(getattr(self, _REGISTERED_FIELDS_GETTER))
+        return iter(getattr(self, _REGISTERED_FIELDS))
 
     def __str__(self):
         template = "<%s: %s>"
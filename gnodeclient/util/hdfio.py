@@ -3,38 +3,266 @@ This module provides easy to use functions for reading and writing datasets
 to and from the root of an HDF5 file.
 """
 
+import os
+
 import numpy as np
 import h5py
 
-def store_array_data(path, array_data):
+import gnodeclient.util.helper as helper
+from gnodeclient.model.models import Model
+
+
+class ArrayFormat(object):
+    """
+    Describes how arrays are written to HDF5 files: by default datasets are contiguous and
+    uncompressed, thus they can be mapped into memory. Optionally datasets are split into chunks
+    and compressed with gzip or lzf, which reduces the size of cached files and uploads. Reading
+    a part of a chunked dataset (e.g. a time window) only reads and decompresses the chunks
+    involved.
+
+    The shape of the chunks depends on the model of the array:
+    TIME_MAJOR chunks contain consecutive rows (samples) of all channels, CHANNEL_MAJOR chunks
+    contain consecutive rows of a single channel. Arrays of models without a layout are chunked
+    time-major.
+
+    Example:
+    >>> array_format = ArrayFormat(compression="gzip", shuffle=True)
+    >>> store_array_data("/tmp/signal.h5", signal, array_format, Model.ANALOGSIGNALARRAY)
     """
-    Write an array to the the first dataset of an HDF5 file.
+
+    TIME_MAJOR = "time"
+    CHANNEL_MAJOR = "channel"
+
+    COMPRESSIONS = ("gzip", "lzf")
+    # The default size of a chunk in bytes
+    CHUNK_BYTES = 64 * 1024
+    # Smaller arrays are always stored contiguously and uncompressed
+    MIN_BYTES = 4096
+
+    LAYOUTS = {Model.ANALOGSIGNALARRAY: TIME_MAJOR}
+
+    def __init__(self, compression=None, level=None, shuffle=False, chunk_bytes=None, layouts=None):
+        """
+        Constructor.
+
+        :param compression: The compression filter ('gzip', 'lzf' or None).
+        :type compression: str
+        :param level: The gzip compression level from 0 to 9 (None for the default of 4).
+        :type level: int
+        :param shuffle: Apply the shuffle filter before compression, which often improves the
+                        compression of numeric data.
+        :type shuffle: bool
+        :param chunk_bytes: The size of a chunk in bytes. If None, arrays are only chunked if
+                            they are compressed or shuffled (using CHUNK_BYTES).
+        :type chunk_bytes: int
+        :param layouts: A dict that maps model names to TIME_MAJOR or CHANNEL_MAJOR and overrides
+                        the default LAYOUTS.
+        :type layouts: dict
+
+        :raises: ValueError if the compression or a layout is not known.
+        """
+        if compression is not None and compression not in ArrayFormat.COMPRESSIONS:
+            raise ValueError("Unknown compression: %s" % compression)
+
+        self.__layouts = dict(ArrayFormat.LAYOUTS)
+        self.__layouts.update(layouts or {})
+        for layout in self.__layouts.values():
+            if layout not in (ArrayFormat.TIME_MAJOR, ArrayFormat.CHANNEL_MAJOR):
+                raise ValueError("Unknown chunk layout: %s" % layout)
+
+        self.__compression = compression
+        self.__level = level
+        self.__shuffle = shuffle
+        self.__chunk_bytes = chunk_bytes
+
+    #
+    # Properties
+    #
+
+    @property
+    def compression(self):
+        """
+        The compression filter ('gzip', 'lzf' or None).
+        """
+        return self.__compression
+
+    @property
+    def chunked(self):
+        """
+        True if arrays are stored in chunks.
+        """
+        return self.__compression is not None or self.__shuffle or self.__chunk_bytes is not None
+
+    #
+    # Methods
+    #
+
+    def layout(self, model=None):
+        """
+        The chunk layout used for arrays of a model.
+
+        :param model: The name of the model e.g. 'analogsignalarray'.
+        :type model: str
+
+        :returns: TIME_MAJOR or CHANNEL_MAJOR
+        :rtype: str
+        """
+        return self.__layouts.get(model, ArrayFormat.TIME_MAJOR)
+
+    def dataset_options(self, array_data, model=None):
+        """
+        The keyword arguments for creating a dataset of the given array (see h5py.Group.create_dataset).
+
+        :param array_data: The array to store.
+        :type array_data: numpy.ndarray
+        :param model: The name of the model the array belongs to.
+        :type model: str
+
+        :returns: A dict with the chunk shape and the filters, empty for a contiguous dataset.
+        :rtype: dict
+        """
+        if not self.chunked or array_data.ndim == 0 or array_data.size == 0 or \
+           array_data.nbytes < ArrayFormat.MIN_BYTES or array_data.dtype.hasobject:
+            return {}
+
+        options = {"chunks": chunk_shape(array_data.shape, array_data.dtype.itemsize,
+                                         self.__chunk_bytes or ArrayFormat.CHUNK_BYTES, self.layout(model))}
+        if self.__compression is not None:
+            options["compression"] = self.__compression
+            if self.__compression == "gzip" and self.__level is not None:
+                options["compression_opts"] = self.__level
+        if self.__shuffle:
+            options["shuffle"] = True
+        return options
+
+
+def chunk_shape(shape, itemsize, chunk_bytes, layout=ArrayFormat.TIME_MAJOR):
+    """
+    Get the shape of chunks of about chunk_bytes for a dataset, of which the first axis is the time.
+    TIME_MAJOR chunks contain all other axes in full, CHANNEL_MAJOR chunks only a single
+    element of the other axes.
+
+    :param shape: The shape of the dataset.
+    :type shape: tuple
+    :param itemsize: The size of a single element in bytes.
+    :type itemsize: int
+    :param chunk_bytes: The size of a chunk in bytes.
+    :type chunk_bytes: int
+    :param layout: ArrayFormat.TIME_MAJOR or ArrayFormat.CHANNEL_MAJOR
+    :type layout: str
+
+    :returns: The chunk shape.
+    :rtype: tuple
+    """
+    if layout == ArrayFormat.TIME_MAJOR:
+        rest = tuple(max(1, n) for n in shape[1:])
+    else:
+        rest = (1,) * (len(shape) - 1)
+
+    row_bytes = itemsize * int(np.prod(rest))
+    rows = min(max(1, shape[0]), max(1, chunk_bytes // row_bytes))
+    return (rows,) + rest
+
+
+def store_array_data(path, array_data, array_format=None, model=None):
+    """
+    Write an array to the the first dataset of an HDF5 file. The file is written to a new file, that
+    replaces an existing file at the path, thus the old file is never changed: it may still be mapped
+    into memory or be a hard link to another file with the same content (see Cache.add_file).
 
     :param path: The full path to the HDF5 file.
     :type path: str
     :param array_data: The array data to store.
     :type array_data: numpy.ndarray|list
+    :param array_format: Chunking and compression of the dataset, by default the dataset is
+                         contiguous and uncompressed.
+    :type array_format: ArrayFormat
+    :param model: The name of the model the array belongs to (see ArrayFormat.layout).
+    :type model: str
     """
     if not isinstance(array_data, np.ndarray):
         array_data = np.array(array_data)
 
-    f = h5py.File(path, 'w')
-    f.create_dataset('arraydata', data=array_data)
-    f.close()
+    options = array_format.dataset_options(array_data, model) if array_format is not None else {}
+
+    path_tmp = path + "." + helper.random_str(8, "tmp")
+    try:
+        # without timestamps the same array always results in the same file (see Cache.add_file)
+        with h5py.File(path_tmp, 'w') as f:
+            f.create_dataset('arraydata', data=array_data, track_times=False, **options)
+
+        helper.replace_file(path_tmp, path)
 
+    finally:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
 
-def read_array_data(path):
+
+def read_array_data(path, mmap=False):
     """
     Read array data from the first dataset of an HDF5 file.
 
     :param path: The full path to the HDF5 file.
     :type path: str
+    :param mmap: If True and the dataset is stored contiguously and uncompressed, the returned
+                 array is a read-only memory map of the file, that is not loaded into memory.
+                 Chunked or compressed datasets (see ArrayFormat) can not be mapped, they are
+                 read into memory as a whole.
+    :type mmap: bool
 
     :returns: The array read from the file.
     :rtype: numpy.ndarray|list
     """
     try:
         with h5py.File(path, 'r') as f:
-            return f[f.keys()[0]].value
+            dataset = f[list(f.keys())[0]]
+
+            if mmap:
+                offset = _contiguous_offset(dataset)
+                if offset is not None:
+                    return np.memmap(path, mode='r', dtype=dataset.dtype, shape=dataset.shape, offset=offset)
+
+            return dataset[()]
+    except IOError:
+        return None
+
+
+def _contiguous_offset(dataset):
+    """
+    Get the offset of the raw data of a dataset in its file, if the data can be mapped into
+    memory directly.
+
+    :returns: The offset or None if the dataset is chunked, compressed, empty or of a variable length type.
+    :rtype: int
+    """
+    if dataset.chunks is not None or dataset.compression is not None or dataset.size == 0:
+        return None
+    if dataset.dtype.hasobject or h5py.check_dtype(vlen=dataset.dtype) is not None:
+        return None
+
+    return dataset.id.get_offset()
+
+
+def read_array_slice(path, start=None, stop=None):
+    """
+    Read a part of the array data from the first dataset of an HDF5 file. Only the requested
+    rows (along the first axis) are read from the file.
+
+    :param path: The full path to the HDF5 file or a file-like object.
+    :type path: str|file
+    :param start: The index of the first row to read.
+    :type start: int
+    :param stop: The index after the last row to read.
+    :type stop: int
+
+    :returns: The array read from the file.
+    :rtype: numpy.ndarray
+    """
+    try:
+        with h5py.File(path, 'r') as f:
+            dataset = f[list(f.keys())[0]]
+            if dataset.shape == ():
+                return dataset[()]
+            return dataset[start:stop]
     except IOError:
-        return None
\ No newline at end of file
+        return None
@@ -2,9 +2,13 @@
 Miscellaneous helper functions.
 """
 
+import hashlib
+import os
 import random
 import string
 
+import numpy
+
 try:
     import urlparse
 except ImportError:
@@ -30,4 +34,55 @@ def random_base32(length=10):
     uid = random.choice(alphabet[1:])
     for i in range(length - 1):
         uid += random.choice(alphabet)
-    return uid
\ No newline at end of file
+    return uid
+
+
+def replace_file(src, dst):
+    """
+    Move a file to a new path and replace an existing file at this path. On POSIX systems the
+    replacement is atomic.
+    """
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def checksum(data):
+    """
+    Compute the checksum (SHA-1) of a byte string.
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_checksum(path, chunk_size=1048576):
+    """
+    Compute the checksum (SHA-1) of a file. The file is read in chunks.
+    """
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def array_checksum(array_data):
+    """
+    Compute the checksum (MD5) of the content of an array, which includes the type and shape
+    of the array. MD5 is used since it is considerably faster than SHA-1 for large arrays.
+    Only arrays of numbers and byte strings have a checksum, for other arrays (e.g. of objects)
+    None is returned.
+    """
+    try:
+        array_data = numpy.ascontiguousarray(array_data)
+    except ValueError:
+        return None     # e.g. nested lists of different lengths
+    if array_data.dtype.kind not in "biufcS":
+        return None
+
+    md5 = hashlib.md5()
+    md5.update(("%s %s " % (array_data.dtype.str, array_data.shape)).encode("ascii"))
+    md5.update(array_data.reshape(-1).view(numpy.uint8))
+    return md5.hexdigest()
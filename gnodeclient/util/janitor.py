@@ -0,0 +1,106 @@
+"""
+This module provides a background thread, that keeps a cache within its limits.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import threading
+
+
+class Janitor(object):
+    """
+    Periodically compacts a cache in a background thread (see Cache.compact). The thread is a
+    daemon thread and does not keep the interpreter alive.
+
+    Example:
+    >>> janitor = Janitor(cache, interval=60)
+    >>> janitor.start()
+    >>> janitor.stop()
+    """
+
+    def __init__(self, cache, interval=60):
+        """
+        Constructor.
+
+        :param cache: The cache to compact.
+        :type cache: Cache
+        :param interval: The time between two runs in seconds.
+        :type interval: float
+        """
+        self.__cache = cache
+        self.__interval = interval
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.__runs = 0
+        self.__error = None
+
+    #
+    # Properties
+    #
+
+    @property
+    def interval(self):
+        """
+        The time between two runs in seconds.
+
+        :rtype: float
+        """
+        return self.__interval
+
+    @property
+    def runs(self):
+        """
+        The number of completed runs.
+
+        :rtype: int
+        """
+        return self.__runs
+
+    @property
+    def error(self):
+        """
+        The error raised by the last run or None if it succeeded.
+
+        :rtype: Exception
+        """
+        return self.__error
+
+    #
+    # Methods
+    #
+
+    def start(self):
+        """
+        Start the background thread.
+        """
+        if self.__thread is None:
+            self.__stopped.clear()
+            self.__thread = threading.Thread(target=self.__run, name="gnodeclient-janitor")
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread and wait until a running compaction is finished.
+        """
+        if self.__thread is not None:
+            self.__stopped.set()
+            self.__thread.join()
+            self.__thread = None
+
+    def is_running(self):
+        return self.__thread is not None
+
+    #
+    # Helper methods
+    #
+
+    def __run(self):
+        while not self.__stopped.wait(self.__interval):
+            # a failed run must not end the thread, the error is kept for inspection
+            try:
+                self.__cache.compact()
+                self.__error = None
+            except Exception as e:
+                self.__error = e
+            self.__runs += 1
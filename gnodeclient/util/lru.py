@@ -0,0 +1,199 @@
+"""
+This module provides a bounded in-memory cache with least recently used eviction.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import sys
+import threading
+from collections import OrderedDict
+
+from gnodeclient.util.declarative_models import Model
+
+
+def estimate_size(obj):
+    """
+    Roughly estimate the memory used by an object and the collections, strings and numbers it contains.
+    The field values of Model instances are inspected as well.
+
+    :param obj: The object to inspect.
+    :type obj: object
+
+    :returns: The estimated size in bytes.
+    :rtype: int
+    """
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key) + estimate_size(value)
+    elif isinstance(obj, (list, tuple, set)):
+        for value in obj:
+            size += estimate_size(value)
+    elif isinstance(obj, Model):
+        for key in obj:
+            size += estimate_size(obj[key])
+
+    return size
+
+
+class LRUCache(object):
+    """
+    A thread safe in-memory cache, that is bounded by the number of entries and (optionally)
+    by the estimated size of all entries. When a limit is exceeded the least recently used entries
+    are removed.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        """
+        Constructor.
+
+        :param max_entries: The maximum number of entries or None for no limit.
+        :type max_entries: int
+        :param max_bytes: The maximum estimated size of all entries in bytes or None for no limit.
+        :type max_bytes: int
+        """
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.RLock()
+
+    #
+    # Properties
+    #
+
+    @property
+    def max_entries(self):
+        return self.__max_entries
+
+    @property
+    def max_bytes(self):
+        return self.__max_bytes
+
+    @property
+    def size(self):
+        """
+        The estimated size of all entries in bytes.
+        """
+        return self.__size
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    @property
+    def stats(self):
+        """
+        Hit and miss counters as well as the current number and size of entries.
+
+        :rtype: dict
+        """
+        with self.__lock:
+            return {"hits": self.__hits, "misses": self.__misses,
+                    "entries": len(self.__entries), "bytes": self.__size}
+
+    #
+    # Methods
+    #
+
+    def get(self, key):
+        """
+        Get an entry and mark it as recently used.
+
+        :param key: The key of the entry.
+        :type key: object
+
+        :returns: The cached value or None if not found.
+        :rtype: object
+        """
+        with self.__lock:
+            if key in self.__entries:
+                value, size = self.__entries.pop(key)
+                self.__entries[key] = (value, size)
+                self.__hits += 1
+                return value
+            else:
+                self.__misses += 1
+                return None
+
+    def set(self, key, value):
+        """
+        Add or replace an entry. Entries that are larger than the byte limit are not stored.
+
+        :param key: The key of the entry.
+        :type key: object
+        :param value: The value to store.
+        :type value: object
+        """
+        size = estimate_size(value) if self.__max_bytes is not None else 0
+
+        with self.__lock:
+            self.__remove(key)
+
+            if self.__max_bytes is not None and size > self.__max_bytes:
+                return
+
+            self.__entries[key] = (value, size)
+            self.__size += size
+
+            while (self.__max_entries is not None and len(self.__entries) > self.__max_entries) or \
+                    (self.__max_bytes is not None and self.__size > self.__max_bytes):
+                _, (_, old_size) = self.__entries.popitem(last=False)
+                self.__size -= old_size
+
+    def delete(self, key):
+        """
+        Remove an entry.
+
+        :param key: The key of the entry.
+        :type key: object
+
+        :returns: True if the entry was removed, False if not found.
+        :rtype: bool
+        """
+        with self.__lock:
+            return self.__remove(key)
+
+    def clear(self, selector=None):
+        """
+        Remove all entries or only those whose keys match the selector.
+
+        :param selector: A function that returns True for all keys, that should be removed.
+        :type selector: function
+        """
+        with self.__lock:
+            if selector is None:
+                self.__entries.clear()
+                self.__size = 0
+            else:
+                for key in [k for k in self.__entries if selector(k)]:
+                    self.__remove(key)
+
+    #
+    # Built-in functions
+    #
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    #
+    # Helper methods
+    #
+
+    def __remove(self, key):
+        if key in self.__entries:
+            _, size = self.__entries.pop(key)
+            self.__size -= size
+            return True
+        else:
+            return False
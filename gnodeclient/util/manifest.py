@@ -0,0 +1,426 @@
+"""
+This module provides a manifest for cached data files (or objects), which is stored in an SQLite database.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import sqlite3
+import threading
+import time
+
+# Eviction policies: least recently used and least frequently used entries come first
+LRU = "lru"
+LFU = "lfu"
+
+_ORDER_BY = {
+    LRU: "last_access",
+    LFU: "hits, last_access"
+}
+
+
+class FileManifest(object):
+    """
+    A manifest that keeps one entry for each cached data file. An entry stores the size, the
+    checksum and the etag of the file together with the time of the last access and the number
+    of accesses. For files with array data the checksum of the array can be stored as well. Thus
+    questions about the existence and freshness of a file can be answered without reading the
+    file. The manifest also keeps track of the number and size of all entries and
+    provides the order in which entries are evicted from the cache (see entries). The totals are
+    kept in a table of their own, that triggers update in the same transaction as the entries,
+    thus they include the changes of other processes, that use the same database.
+
+    Updates of the access time are collected in memory and written to the database in batches,
+    since reading a cached file should not require a write transaction.
+
+    Several manifests can be kept in one database file by using different table names,
+    e.g. for cached objects.
+
+    Example:
+    >>> manifest = FileManifest("/tmp/files.db")
+    >>> manifest.add("ABC0000001", False, 1024, checksum="...")
+    >>> manifest.get("ABC0000001", False)["size"]
+    1024
+    """
+
+    # The maximum number of access time updates kept in memory
+    MAX_PENDING = 10000
+    # keep queries below the SQLite limit of host parameters
+    MAX_VARIABLES = 500
+
+    _COLUMNS = ("ident", "temporary", "size", "checksum", "etag", "last_access", "hits", "array_checksum")
+
+    def __init__(self, db_path, table="files"):
+        """
+        Constructor.
+
+        :param db_path: The path to the database file.
+        :type db_path: str
+        :param table: The name of the table used for the manifest.
+        :type table: str
+        """
+        self.__db_path = db_path
+        self.__table = table
+        self.__pending = {}
+        self.__lock = threading.RLock()
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False)
+        # the manifest can be rebuilt from the cache (see Cache.scan_files), thus it is not synced on
+        # every commit: with WAL this may lose the latest changes on power loss but never corrupts the database
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        # entries replaced by INSERT OR REPLACE are subtracted from the totals as well
+        self.__conn.execute("PRAGMA recursive_triggers=ON")
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS %s ("
+                            "ident TEXT NOT NULL, "
+                            "temporary INTEGER NOT NULL, "
+                            "size INTEGER NOT NULL, "
+                            "checksum TEXT, "
+                            "etag TEXT, "
+                            "last_access REAL NOT NULL, "
+                            "hits INTEGER NOT NULL DEFAULT 0, "
+                            "array_checksum TEXT, "
+                            "PRIMARY KEY (ident, temporary))" % table)
+
+        # manifests created before access counts were recorded
+        columns = [row[1] for row in self.__conn.execute("PRAGMA table_info(%s)" % table)]
+        if "hits" not in columns:
+            self.__conn.execute("ALTER TABLE %s ADD COLUMN hits INTEGER NOT NULL DEFAULT 0" % table)
+        if "array_checksum" not in columns:
+            self.__conn.execute("ALTER TABLE %s ADD COLUMN array_checksum TEXT" % table)
+        # entries with the same content are found by their checksum
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS %s_checksum ON %s (checksum)" % (table, table))
+        self.__conn.commit()
+
+        # the totals of existing manifests are counted once, in the same transaction as the triggers are created
+        self.__conn.executescript("""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS {0}_totals (
+                temporary INTEGER PRIMARY KEY,
+                entries INTEGER NOT NULL,
+                bytes INTEGER NOT NULL);
+            INSERT OR IGNORE INTO {0}_totals
+                SELECT t.temporary, COUNT(f.ident), COALESCE(SUM(f.size), 0)
+                FROM (SELECT 0 AS temporary UNION SELECT 1) t LEFT JOIN {0} f ON f.temporary = t.temporary
+                GROUP BY t.temporary;
+            CREATE TRIGGER IF NOT EXISTS {0}_added AFTER INSERT ON {0} BEGIN
+                UPDATE {0}_totals SET entries = entries + 1, bytes = bytes + NEW.size
+                WHERE temporary = NEW.temporary;
+            END;
+            CREATE TRIGGER IF NOT EXISTS {0}_removed AFTER DELETE ON {0} BEGIN
+                UPDATE {0}_totals SET entries = entries - 1, bytes = bytes - OLD.size
+                WHERE temporary = OLD.temporary;
+            END;
+            CREATE TRIGGER IF NOT EXISTS {0}_changed AFTER UPDATE OF size, temporary ON {0} BEGIN
+                UPDATE {0}_totals SET entries = entries - 1, bytes = bytes - OLD.size
+                WHERE temporary = OLD.temporary;
+                UPDATE {0}_totals SET entries = entries + 1, bytes = bytes + NEW.size
+                WHERE temporary = NEW.temporary;
+            END;
+            COMMIT;
+            """.format(table))
+
+    #
+    # Properties
+    #
+
+    @property
+    def db_path(self):
+        """
+        The path to the database file.
+        """
+        return self.__db_path
+
+    #
+    # Methods
+    #
+
+    def add(self, ident, temporary, size, checksum=None, etag=None):
+        """
+        Add an entry for a file or replace an existing one. The array checksum of a replaced
+        entry is discarded.
+
+        :param ident: The identifier of the file.
+        :type ident: str
+        :param temporary: True if the file is stored in the temporary part of the cache.
+        :type temporary: bool
+        :param size: The size of the file in bytes.
+        :type size: int
+        :param checksum: The checksum of the file content.
+        :type checksum: str
+        :param etag: The etag of the file as reported by the server.
+        :type etag: str
+        """
+        self.add_many([(ident, size, checksum, etag)], temporary)
+
+    def add_many(self, entries, temporary):
+        """
+        Add or replace several entries at once.
+
+        :param entries: A list of tuples (ident, size, checksum, etag).
+        :type entries: list
+        :param temporary: True if the files are stored in the temporary part of the cache.
+        :type temporary: bool
+        """
+        now = time.time()
+        temporary = bool(temporary)
+
+        with self.__lock:
+            for ident, size, checksum, etag in entries:
+                self.__pending.pop((ident, temporary), None)
+
+            self.__conn.executemany("INSERT OR REPLACE INTO %s (ident, temporary, size, checksum, etag, last_access) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)" % self.__table,
+                                    [(ident, int(temporary), size, checksum, etag, now)
+                                     for ident, size, checksum, etag in entries])
+            self.__conn.commit()
+
+    def get(self, ident, temporary):
+        """
+        Get the entry of a file.
+
+        :param ident: The identifier of the file.
+        :type ident: str
+        :param temporary: True if the file is stored in the temporary part of the cache.
+        :type temporary: bool
+
+        :returns: A dict with the keys ident, temporary, size, checksum, etag, last_access, hits
+                  and array_checksum or None if the file is not in the manifest.
+        :rtype: dict
+        """
+        with self.__lock:
+            row = self.__conn.execute("SELECT %s FROM %s WHERE ident = ? AND temporary = ?" %
+                                      (", ".join(FileManifest._COLUMNS), self.__table),
+                                      (ident, int(temporary))).fetchone()
+            pending = self.__pending.get((ident, bool(temporary)))
+
+        if row is None:
+            return None
+
+        entry = self.__entry(row)
+        if pending is not None:
+            entry["last_access"] = pending[0]
+            entry["hits"] += pending[1]
+        return entry
+
+    def contains(self, ident, temporary):
+        """
+        Check if there is an entry for a file.
+
+        :param ident: The identifier of the file.
+        :type ident: str
+        :param temporary: True if the file is stored in the temporary part of the cache.
+        :type temporary: bool
+
+        :returns: True if the file is in the manifest.
+        :rtype: bool
+        """
+        with self.__lock:
+            row = self.__conn.execute("SELECT 1 FROM %s WHERE ident = ? AND temporary = ?" % self.__table,
+                                      (ident, int(temporary))).fetchone()
+        return row is not None
+
+    def references(self, checksum):
+        """
+        Get all entries of files with the given content.
+
+        :param checksum: The checksum of the file content.
+        :type checksum: str
+
+        :returns: A list of tuples (ident, temporary).
+        :rtype: list
+        """
+        with self.__lock:
+            rows = self.__conn.execute("SELECT ident, temporary FROM %s WHERE checksum = ?" % self.__table,
+                                       (checksum,)).fetchall()
+        return [(ident, bool(temporary)) for ident, temporary in rows]
+
+    def set_array_checksum(self, ident, temporary, array_checksum):
+        """
+        Store the checksum of the array data in a file (see helper.array_checksum).
+
+        :param ident: The identifier of the file.
+        :type ident: str
+        :param temporary: True if the file is stored in the temporary part of the cache.
+        :type temporary: bool
+        :param array_checksum: The checksum of the array.
+        :type array_checksum: str
+
+        :returns: True if the checksum was stored, False if the file is not in the manifest.
+        :rtype: bool
+        """
+        with self.__lock:
+            cursor = self.__conn.execute("UPDATE %s SET array_checksum = ? WHERE ident = ? AND temporary = ?" %
+                                         self.__table, (array_checksum, ident, int(temporary)))
+            self.__conn.commit()
+        return cursor.rowcount > 0
+
+    def touch(self, ident, temporary):
+        """
+        Record an access to a file.
+
+        :param ident: The identifier of the file.
+        :type ident: str
+        :param temporary: True if the file is stored in the temporary part of the cache.
+        :type temporary: bool
+        """
+        self.touch_many([ident], temporary)
+
+    def touch_many(self, idents, temporary):
+        """
+        Record an access to several files.
+
+        :param idents: The identifiers of the files.
+        :type idents: list
+        :param temporary: True if the files are stored in the temporary part of the cache.
+        :type temporary: bool
+        """
+        now = time.time()
+        temporary = bool(temporary)
+
+        with self.__lock:
+            for ident in idents:
+                key = (ident, temporary)
+                pending = self.__pending.get(key)
+                self.__pending[key] = (now, 1 if pending is None else pending[1] + 1)
+            if len(self.__pending) >= FileManifest.MAX_PENDING:
+                self.flush()
+
+    def remove(self, ident, temporary):
+        """
+        Remove the entry of a file.
+
+        :param ident: The identifier of the file.
+        :type ident: str
+        :param temporary: True if the file is stored in the temporary part of the cache.
+        :type temporary: bool
+
+        :returns: True if the entry was removed, False if not found.
+        :rtype: bool
+        """
+        return self.remove_many([ident], temporary) > 0
+
+    def remove_many(self, idents, temporary):
+        """
+        Remove the entries of several files at once.
+
+        :param idents: The identifiers of the files.
+        :type idents: list
+        :param temporary: True if the files are stored in the temporary part of the cache.
+        :type temporary: bool
+
+        :returns: The number of removed entries.
+        :rtype: int
+        """
+        temporary = bool(temporary)
+        idents = list(set(idents))
+
+        with self.__lock:
+            for ident in idents:
+                self.__pending.pop((ident, temporary), None)
+
+            cursor = self.__conn.executemany("DELETE FROM %s WHERE ident = ? AND temporary = ?" % self.__table,
+                                             [(ident, int(temporary)) for ident in idents])
+            self.__conn.commit()
+
+        return max(cursor.rowcount, 0)
+
+    def entries(self, temporary=False, policy=LRU):
+        """
+        Get the entries of all files in the order in which they are evicted by the given policy.
+        With LRU the least recently used entries come first, with LFU the least frequently used.
+
+        :param temporary: Get the entries of temporary files.
+        :type temporary: bool
+        :param policy: The eviction policy (LRU or LFU).
+        :type policy: str
+
+        :returns: A list of entries (see get).
+        :rtype: list
+
+        :raises: ValueError if the policy is not known.
+        """
+        if policy not in _ORDER_BY:
+            raise ValueError("Unknown eviction policy: %s" % policy)
+
+        with self.__lock:
+            self.flush()
+            rows = self.__conn.execute("SELECT %s FROM %s WHERE temporary = ? ORDER BY %s" %
+                                       (", ".join(FileManifest._COLUMNS), self.__table, _ORDER_BY[policy]),
+                                       (int(temporary),)).fetchall()
+        return [self.__entry(row) for row in rows]
+
+    def count(self, temporary=False):
+        """
+        The number of entries.
+
+        :param temporary: Count the entries of temporary files.
+        :type temporary: bool
+
+        :rtype: int
+        """
+        return self.__total(temporary)[0]
+
+    def total_size(self, temporary=False):
+        """
+        The size of all files in bytes.
+
+        :param temporary: Get the size of all temporary files.
+        :type temporary: bool
+
+        :rtype: int
+        """
+        return self.__total(temporary)[1]
+
+    def clear(self, temporary=False):
+        """
+        Remove all entries.
+
+        :param temporary: Remove only the entries of temporary files.
+        :type temporary: bool
+        """
+        with self.__lock:
+            if temporary:
+                self.__pending = dict((k, v) for k, v in self.__pending.items() if not k[1])
+                self.__conn.execute("DELETE FROM %s WHERE temporary = 1" % self.__table)
+            else:
+                self.__pending = {}
+                self.__conn.execute("DELETE FROM %s" % self.__table)
+            self.__conn.commit()
+
+    def flush(self):
+        """
+        Write all pending updates of access times and counts to the database.
+        """
+        with self.__lock:
+            if len(self.__pending) > 0:
+                self.__conn.executemany("UPDATE %s SET last_access = ?, hits = hits + ? "
+                                        "WHERE ident = ? AND temporary = ?" % self.__table,
+                                        [(t, hits, ident, int(temporary))
+                                         for (ident, temporary), (t, hits) in self.__pending.items()])
+                self.__conn.commit()
+                self.__pending = {}
+
+    def close(self):
+        """
+        Write pending updates and close the database.
+        """
+        with self.__lock:
+            if self.__conn is not None:
+                self.flush()
+                self.__conn.close()
+                self.__conn = None
+
+    #
+    # Helper methods
+    #
+
+    # Get the number and size of all entries as committed by all processes
+    def __total(self, temporary):
+        with self.__lock:
+            return self.__conn.execute("SELECT entries, bytes FROM %s_totals WHERE temporary = ?" % self.__table,
+                                       (int(temporary),)).fetchone()
+
+    @staticmethod
+    def __entry(row):
+        entry = dict(zip(FileManifest._COLUMNS, row))
+        entry["temporary"] = bool(entry["temporary"])
+        return entry
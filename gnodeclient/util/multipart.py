@@ -0,0 +1,154 @@
+"""
+This module provides a streaming implementation of multipart/form-data request bodies. It allows
+to upload large files without loading them into memory.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import os
+import uuid
+
+
+class MultipartStream(object):
+    """
+    A file-like object, that produces a multipart/form-data body with a single file field. The
+    file data is read from a file handle or an iterable of chunks while the body is sent.
+
+    If the size of the file data is known (file handles), the size of the whole body is known as well
+    and the body can be sent with a Content-Length header. Bodies of iterables are sent with chunked
+    transfer encoding.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, field_name, source, file_name=None):
+        """
+        Constructor.
+
+        :param field_name: The name of the form field.
+        :type field_name: str
+        :param source: A file handle opened in binary mode or an iterable of byte strings.
+        :type source: file|iterable
+        :param file_name: The file name, that is sent to the server.
+        :type file_name: str
+        """
+        self.__boundary = uuid.uuid4().hex
+        self.__source = source
+        self.__head = ('--%s\r\n'
+                       'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                       'Content-Type: application/octet-stream\r\n\r\n'
+                       % (self.__boundary, field_name, file_name or field_name)).encode("utf-8")
+        self.__tail = ('\r\n--%s--\r\n' % self.__boundary).encode("utf-8")
+
+        if hasattr(source, "read"):
+            self.__chunks = None
+            self.__size = len(self.__head) + _remaining_size(source) + len(self.__tail)
+        else:
+            self.__chunks = iter(source)
+            self.__size = None
+
+        self.__parts = [self.__head]
+        self.__buffer = b""
+        self.__done = False
+        self.__pos = 0
+
+    #
+    # Properties
+    #
+
+    @property
+    def content_type(self):
+        """
+        The value of the Content-Type header for the body.
+        """
+        return "multipart/form-data; boundary=%s" % self.__boundary
+
+    @property
+    def size(self):
+        """
+        The size of the whole body or None if unknown.
+        """
+        return self.__size
+
+    #
+    # Methods
+    #
+
+    def read(self, size=-1):
+        """
+        Read the next part of the body.
+
+        :param size: The maximum number of bytes to read (-1 reads the whole remaining body).
+        :type size: int
+
+        :returns: The data or an empty string if the end of the body was reached.
+        :rtype: str
+        """
+        while (size is None or size < 0 or len(self.__buffer) < size) and not self.__done:
+            self.__buffer += self.__next_part(size)
+
+        if size is None or size < 0:
+            data, self.__buffer = self.__buffer, b""
+        else:
+            data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+
+        self.__pos += len(data)
+        return data
+
+    def tell(self):
+        return self.__pos
+
+    #
+    # Built-in functions
+    #
+
+    def __iter__(self):
+        while True:
+            data = self.read(MultipartStream.CHUNK_SIZE)
+            if len(data) == 0:
+                break
+            yield data
+
+    def __len__(self):
+        if self.__size is None:
+            raise TypeError("The size of a body with data from an iterable is unknown")
+        return self.__size
+
+    #
+    # Helper methods
+    #
+
+    def __next_part(self, size):
+        if len(self.__parts) > 0:
+            return self.__parts.pop(0)
+
+        if self.__chunks is None:
+            chunk_size = size if size is not None and size > 0 else MultipartStream.CHUNK_SIZE
+            data = self.__source.read(chunk_size)
+        else:
+            data = next(self.__chunks, None)
+            while data is not None and len(data) == 0:
+                data = next(self.__chunks, None)
+
+        if data is None or len(data) == 0:
+            self.__done = True
+            return self.__tail
+
+        return data
+
+
+def _remaining_size(f_handle):
+    """
+    Get the number of bytes from the current position to the end of a file.
+    """
+    if hasattr(f_handle, "fileno"):
+        try:
+            return os.fstat(f_handle.fileno()).st_size - f_handle.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            pass
+
+    pos = f_handle.tell()
+    f_handle.seek(0, 2)
+    size = f_handle.tell() - pos
+    f_handle.seek(pos)
+    return size
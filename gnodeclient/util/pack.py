@@ -0,0 +1,466 @@
+"""
+This module provides a pack, that keeps many small arrays as datasets in a few container HDF5 files.
+"""
+
+from __future__ import print_function, absolute_import, division
+
+import contextlib
+import os
+import shutil
+import sqlite3
+import threading
+
+import h5py
+
+import gnodeclient.util.helper as helper
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # Windows
+    import msvcrt
+
+
+class ArrayPack(object):
+    """
+    Keeps many small arrays as datasets in a few container HDF5 files, thus each array does not
+    need a file of its own with an HDF5 header and an inode. An index, which is stored in an SQLite
+    database, maps the identifier of each array to its container. The datasets are named by the
+    identifiers of the arrays. Arrays with the same content (checksum) are stored only once: further
+    datasets are hard links within the container of the first one.
+
+    New arrays are added to the latest container until it reaches CONTAINER_BYTES. Several processes
+    can use the same pack: containers are only opened while an array is read or written and a lock file
+    serialises the writes of all processes, while reads share the lock. New arrays are appended to the
+    container in place, a dataset that could not be written completely is removed again. Arrays, that
+    replace an array with the same identifier, are written to a copy of the container, that replaces
+    the container when it is complete, thus a failed replacement leaves the container unchanged.
+
+    Removed arrays are only dropped from the index. Their space is reclaimed by compact(), which
+    rewrites containers with many removed datasets.
+
+    Example:
+    >>> pack = ArrayPack("/tmp/packs", "/tmp/files.db")
+    >>> pack.put("ABC0000001", "/tmp/files/ABC0000001")
+    True
+    >>> pack.get("ABC0000001", 0, 10)
+    array([...])
+    """
+
+    CONTAINER_BYTES = 16 * 1024 * 1024
+    # Containers are rewritten by compact(), if more than this fraction of their datasets was removed
+    GARBAGE_RATIO = 0.5
+    # keep queries below the SQLite limit of host parameters
+    MAX_VARIABLES = 500
+    # The file in the directory of the pack, that is locked while containers are written
+    LOCK_FILE = "lock"
+
+    def __init__(self, directory, db_path, container_bytes=CONTAINER_BYTES):
+        """
+        Constructor.
+
+        :param directory: The directory where the container files are stored.
+        :type directory: str
+        :param db_path: The path to the database file of the index.
+        :type db_path: str
+        :param container_bytes: The size in bytes up to which arrays are added to a container.
+        :type container_bytes: int
+        """
+        self.__directory = directory
+        self.__container_bytes = container_bytes
+        self.__lock = threading.RLock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o0750)
+
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS packed ("
+                            "ident TEXT PRIMARY KEY, "
+                            "container INTEGER NOT NULL, "
+                            "size INTEGER NOT NULL, "
+                            "checksum TEXT)")
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS containers ("
+                            "id INTEGER PRIMARY KEY, "
+                            "removed INTEGER NOT NULL DEFAULT 0)")
+
+        # packs created before arrays were deduplicated
+        columns = [row[1] for row in self.__conn.execute("PRAGMA table_info(packed)")]
+        if "checksum" not in columns:
+            self.__conn.execute("ALTER TABLE packed ADD COLUMN checksum TEXT")
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS packed_checksum ON packed (checksum)")
+        self.__conn.commit()
+
+    #
+    # Properties
+    #
+
+    @property
+    def directory(self):
+        """
+        The directory where the container files are stored.
+        """
+        return self.__directory
+
+    #
+    # Methods
+    #
+
+    def put(self, ident, path, checksum=None):
+        """
+        Copy the array of an HDF5 file with a single dataset into the pack. An array with the same
+        identifier is replaced. If an array with the same checksum is already packed, only a link
+        to its dataset is added.
+
+        :param ident: The identifier of the array.
+        :type ident: str
+        :param path: The path to the HDF5 file.
+        :type path: str
+        :param checksum: The checksum of the file (see helper.file_checksum).
+        :type checksum: str
+
+        :returns: True if the array was added, False if the file is not an HDF5 file with a single
+                  dataset or the container can not be written.
+        :rtype: bool
+        """
+        with self.__locked():
+            try:
+                size = os.path.getsize(path)
+                if checksum is not None and self.__link(ident, size, checksum):
+                    return True
+
+                with h5py.File(path, "r") as source:
+                    names = list(source.keys())
+                    if len(names) != 1 or not isinstance(source[names[0]], h5py.Dataset):
+                        return False
+
+                    container = self.__current(size)
+                    with self.__writing_to(container, ident) as f:
+                        f.copy(source[names[0]], ident)
+            except (IOError, OSError):
+                return False
+
+            self.__index(ident, container, size, checksum)
+            return True
+
+    def get(self, ident, start=None, stop=None):
+        """
+        Read an array or some of its rows (along the first axis) from the pack.
+
+        :param ident: The identifier of the array.
+        :type ident: str
+        :param start: The index of the first row to read.
+        :type start: int
+        :param stop: The index after the last row to read.
+        :type stop: int
+
+        :returns: The array or None if it is not in the pack or can not be read.
+        :rtype: numpy.ndarray
+        """
+        def read(dataset):
+            if dataset.shape == () or (start is None and stop is None):
+                return dataset[()]
+            return dataset[start:stop]
+
+        with self.__locked(exclusive=False):
+            return self.__read(ident, read)
+
+    def export(self, ident, path):
+        """
+        Write an array of the pack to a new HDF5 file (see hdfio.read_array_data).
+
+        :param ident: The identifier of the array.
+        :type ident: str
+        :param path: The path of the new file.
+        :type path: str
+
+        :returns: True if the file was written, False if the array is not in the pack or can not be read.
+        :rtype: bool
+        """
+        def write(dataset):
+            with h5py.File(path, "w") as target:
+                target.copy(dataset, "arraydata")
+            return True
+
+        with self.__locked(exclusive=False):
+            return self.__read(ident, write) is not None
+
+    def contains(self, ident):
+        """
+        Check if an array is in the pack.
+
+        :param ident: The identifier of the array.
+        :type ident: str
+
+        :rtype: bool
+        """
+        with self.__lock:
+            return self.__container_of(ident) is not None
+
+    def idents(self):
+        """
+        The identifiers of all arrays in the pack.
+
+        :rtype: set
+        """
+        with self.__lock:
+            return set(row[0] for row in self.__conn.execute("SELECT ident FROM packed"))
+
+    def count(self):
+        """
+        The number of arrays in the pack.
+
+        :rtype: int
+        """
+        with self.__lock:
+            return self.__conn.execute("SELECT COUNT(*) FROM packed").fetchone()[0]
+
+    def remove_many(self, idents):
+        """
+        Remove several arrays from the pack. The arrays are removed from the index, their datasets
+        are removed when the containers are rewritten (see compact).
+
+        :param idents: The identifiers of the arrays.
+        :type idents: list
+
+        :returns: The number of removed arrays.
+        :rtype: int
+        """
+        with self.__lock:
+            count = self.__unindex(idents)
+            if count > 0:
+                self.__conn.commit()
+            return count
+
+    def compact(self):
+        """
+        Rewrite containers of which more than GARBAGE_RATIO of the datasets were removed and
+        delete empty containers, thus the space of removed arrays is reclaimed. Copies of containers
+        left behind by interrupted writes are removed as well.
+
+        :returns: The number of rewritten or deleted containers.
+        :rtype: int
+        """
+        count = 0
+
+        with self.__locked():
+            # no other process is writing, thus all copies are left from interrupted writes
+            for f_name in os.listdir(self.__directory):
+                if ".tmp_" in f_name:
+                    os.remove(os.path.join(self.__directory, f_name))
+
+            rows = self.__conn.execute("SELECT c.id, c.removed, COUNT(p.ident) FROM containers c "
+                                       "LEFT JOIN packed p ON p.container = c.id GROUP BY c.id").fetchall()
+
+            for container, removed, live in rows:
+                if live > 0 and removed <= (removed + live) * ArrayPack.GARBAGE_RATIO:
+                    continue
+
+                if live == 0:
+                    self.__conn.execute("DELETE FROM containers WHERE id = ?", (container,))
+                    self.__conn.commit()
+                    if os.path.exists(self.__path(container)):
+                        os.remove(self.__path(container))
+                    count += 1
+                    continue
+
+                # live arrays are copied to a new file, arrays with the same content only once
+                live_rows = self.__conn.execute("SELECT ident, checksum FROM packed WHERE container = ?",
+                                                (container,)).fetchall()
+                try:
+                    with self.__updating(container, copy=False) as target:
+                        with h5py.File(self.__path(container), "r") as source:
+                            copied = {}
+                            for ident, checksum in live_rows:
+                                if ident not in source:
+                                    continue
+                                if checksum is not None and checksum in copied:
+                                    target[ident] = target[copied[checksum]]
+                                else:
+                                    target.copy(source[ident], ident)
+                                    if checksum is not None:
+                                        copied[checksum] = ident
+                except (IOError, OSError):
+                    continue    # can not be read, the container is kept as it is
+
+                self.__conn.execute("UPDATE containers SET removed = 0 WHERE id = ?", (container,))
+                self.__conn.commit()
+                count += 1
+
+        return count
+
+    def clear(self):
+        """
+        Remove all arrays and containers.
+        """
+        with self.__locked():
+            self.__conn.execute("DELETE FROM packed")
+            self.__conn.execute("DELETE FROM containers")
+            self.__conn.commit()
+
+            for f_name in os.listdir(self.__directory):
+                if f_name != ArrayPack.LOCK_FILE:
+                    os.remove(os.path.join(self.__directory, f_name))
+
+    def close(self):
+        """
+        Close the database.
+        """
+        with self.__lock:
+            if self.__conn is not None:
+                self.__conn.close()
+                self.__conn = None
+
+    #
+    # Helper methods
+    #
+
+    def __path(self, container):
+        return os.path.join(self.__directory, "%08d.h5" % container)
+
+    def __container_of(self, ident):
+        row = self.__conn.execute("SELECT container FROM packed WHERE ident = ?", (ident,)).fetchone()
+        return row[0] if row is not None else None
+
+    # Record an array in the index, an older entry of the array is replaced
+    def __index(self, ident, container, size, checksum):
+        self.__unindex([ident])
+        self.__conn.execute("INSERT INTO packed (ident, container, size, checksum) VALUES (?, ?, ?, ?)",
+                            (ident, container, size, checksum))
+        self.__conn.commit()
+
+    # Remove arrays from the index and count their datasets as removed, without committing
+    def __unindex(self, idents):
+        idents = list(set(idents))
+        count = 0
+
+        for i in range(0, len(idents), ArrayPack.MAX_VARIABLES):
+            page = idents[i:i + ArrayPack.MAX_VARIABLES]
+            rows = self.__conn.execute("SELECT ident, container FROM packed WHERE ident IN (%s)" %
+                                       ", ".join("?" * len(page)), page).fetchall()
+
+            self.__conn.executemany("UPDATE containers SET removed = removed + 1 WHERE id = ?",
+                                    [(row[1],) for row in rows])
+            self.__conn.executemany("DELETE FROM packed WHERE ident = ?", [(row[0],) for row in rows])
+            count += len(rows)
+
+        return count
+
+    # Add a link to a packed dataset with the same content
+    def __link(self, ident, size, checksum):
+        row = self.__conn.execute("SELECT ident, container FROM packed WHERE checksum = ? AND ident != ? LIMIT 1",
+                                  (checksum, ident)).fetchone()
+        if row is None:
+            return False
+
+        with self.__writing_to(row[1], ident) as f:
+            if row[0] not in f:
+                return False
+            f[ident] = f[row[0]]
+
+        self.__index(ident, row[1], size, checksum)
+        return True
+
+    # Apply a function to the dataset of an array, get None if the array is not packed or can not be read.
+    # The entry of the array is only dropped, if its dataset is really gone.
+    def __read(self, ident, function):
+        container = self.__container_of(ident)
+        if container is None:
+            return None
+
+        path = self.__path(container)
+        try:
+            with h5py.File(path, "r") as f:
+                if ident in f:
+                    return function(f[ident])
+        except (IOError, OSError):
+            if os.path.exists(path):
+                return None     # e.g. damaged or locked, the array may be readable later
+
+        self.__conn.execute("DELETE FROM packed WHERE ident = ? AND container = ?", (ident, container))
+        self.__conn.commit()
+        return None
+
+    # Get the container, to which an array of the given size is added
+    def __current(self, size):
+        row = self.__conn.execute("SELECT MAX(id) FROM containers").fetchone()
+        container = row[0]
+
+        if container is None or (os.path.exists(self.__path(container)) and
+                                 os.path.getsize(self.__path(container)) + size > self.__container_bytes):
+            container = (container or 0) + 1
+            self.__conn.execute("INSERT INTO containers (id) VALUES (?)", (container,))
+            self.__conn.commit()
+
+        return container
+
+    # Serialise the writes of all threads and processes, that use the pack. Reads of several processes
+    # share the lock (on Windows, where only exclusive locks are available, reads are serialised as well).
+    @contextlib.contextmanager
+    def __locked(self, exclusive=True):
+        with self.__lock:
+            if not os.path.isdir(self.__directory):
+                os.makedirs(self.__directory, 0o0750)
+
+            with open(os.path.join(self.__directory, ArrayPack.LOCK_FILE), "a+b") as lock_file:
+                lock_file.seek(0)
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                else:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                    else:
+                        lock_file.seek(0)
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # Open a container for adding the dataset of an array. A new array is appended in place and its
+    # dataset is removed again, if writing fails. An array, that replaces a packed array with the same
+    # identifier, is written to a copy of the container (see __updating).
+    @contextlib.contextmanager
+    def __writing_to(self, container, ident):
+        if self.__container_of(ident) is not None:
+            with self.__updating(container) as f:
+                if ident in f:
+                    del f[ident]    # removed, but not yet reclaimed by compact
+                yield f
+            return
+
+        with h5py.File(self.__path(container), "a") as f:
+            if ident in f:
+                del f[ident]        # left by an earlier removal, it is not in the index
+            written = False
+            try:
+                yield f
+                written = True
+            finally:
+                if not written and ident in f:
+                    del f[ident]
+
+    # Write a copy of a container (or a new empty file), that replaces the container when it is complete.
+    # The container is left unchanged, if writing fails.
+    @contextlib.contextmanager
+    def __updating(self, container, copy=True):
+        path = self.__path(container)
+        path_tmp = path + "." + helper.random_str(8, "tmp")
+
+        try:
+            if copy and os.path.exists(path):
+                shutil.copyfile(path, path_tmp)
+            with h5py.File(path_tmp, "a") as f:
+                yield f
+
+            fd = os.open(path_tmp, os.O_RDWR)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            helper.replace_file(path_tmp, path)
+
+        finally:
+            if os.path.exists(path_tmp):
+                os.remove(path_tmp)
@@ -17,7 +17,7 @@ _NAMES = [
     "__repr__", "__reversed__", "__rfloorfiv__", "__rlshift__", "__rmod__",
     "__rmul__", "__ror__", "__rpow__", "__rrshift__", "__rshift__", "__rsub__",
     "__rtruediv__", "__rxor__", "__setitem__", "__setslice__", "__sub__",
-    "__truediv__", "__xor__", "next"
+    "__truediv__", "__xor__", "next", "__next__"
 ]
 
 # Some names the proxy uses internally
@@ -104,13 +104,12 @@ class LazyProxyMeta(type):
         return type.__new__(mcs, name, bases, dct)
 
 
-class LazyProxy(object):
+class LazyProxy(LazyProxyMeta("LazyProxyBase", (object,), {})):
     """
-    A lazy loading proxy class.
+    A lazy loading proxy class. The meta class is applied through the base class, because
+    Python 3 ignores the __metaclass__ attribute.
     """
 
-    __metaclass__ = LazyProxyMeta
-
     def __init__(self, loader):
         """
         Initialize the proxy class. As a first parameter the constructor expects a
@@ -134,19 +133,25 @@ def lazy_value_loader(location, store, result_driver):
             loc = location
 
         obj = store.get(loc, False)
+        if obj is None:
+            return None
         res = result_driver.to_result(obj)
         return res
 
     return do_lazy_load
 
 
-def lazy_list_loader(locations, store, result_driver, list_cls):
+def lazy_list_loader(locations, store, result_driver, list_cls, owner=None):
 
     def do_lazy_load():
         results = list_cls()
 
-        for location in locations:
-            obj = store.get(location, False)
+        # all objects of the list are requested at once, objects that were deleted are missing
+        objects = [obj for obj in store.get_list(locations, False) if obj is not None]
+        if result_driver.prefetch is not None:
+            result_driver.prefetch.list_loaded(objects, owner)
+
+        for obj in objects:
             res = result_driver.to_result(obj)
             results.append(res)
 
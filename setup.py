@@ -29,6 +29,9 @@ setup(
         "odml >= 1.0",
         "h5py >= 2.0.1"
     ],
+    extras_require={
+        "async": ["aiohttp >= 3.0"]
+    },
     classifiers=[
         "Development Status :: 4 - Beta",
         "Programming Language :: Python",